@@ -161,6 +161,7 @@ async def get_user_client(user_id: int):
             - (Client, None) if successful
             - (None, 'no_session') if user hasn't logged in yet
             - (None, 'slots_full') if all session slots are busy with active downloads
+            - (None, 'memory_pressure') if new sessions are paused while memory is critical
             - (None, 'error') for other errors
     """
     session = db.get_user_session(user_id)
@@ -182,13 +183,15 @@ async def get_user_client(user_id: int):
         )
         
         if user_client:
-            LOGGER(__name__).info(f"Got user client for {user_id} from SessionManager")
+            LOGGER(__name__).debug("Got user client for %s from SessionManager", user_id)
             return (user_client, None)
         
         # Handle different error codes from SessionManager
         if error_code == 'slots_full':
             LOGGER(__name__).warning(f"All session slots busy, user {user_id} must wait")
             return (None, 'slots_full')
+        elif error_code == 'memory_pressure':
+            return (None, 'memory_pressure')
         elif error_code == 'invalid_session':
             # Session is not authorized - clear it from DB so user can relogin
             LOGGER(__name__).warning(f"Clearing invalid/unauthorized session for user {user_id}")
@@ -239,11 +242,12 @@ def force_subscribe(func):
             # Use Pyrogram's get_chat_member to check membership
             try:
                 # Get channel chat first
-                chat_entity = await client.get_chat(channel)
+                from rate_governor import rate_governor
+                chat_entity = await rate_governor.call(client.get_chat, channel)
                 
                 # Try to get user as member
                 try:
-                    member = await client.get_chat_member(chat_entity.id, user_id)
+                    member = await rate_governor.call(client.get_chat_member, chat_entity.id, user_id)
                     if member:
                         # User is a member
                         return await func(client, message)
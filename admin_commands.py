@@ -285,75 +285,127 @@ async def broadcast_command(client, message):
         await client.send_message(message.chat.id, f"❌ **Error: {str(e)}**")
         LOGGER(__name__).error(f"Error in broadcast_command: {e}")
 
-async def execute_broadcast(client, admin_id: int, broadcast_data: dict):
-    """Execute the actual broadcast - supports text and all media types, to all or specific users"""
-    target_users = broadcast_data.get('target_users')
+async def execute_broadcast(client, admin_id: int, broadcast_data: dict, on_progress=None):
+    """Execute the actual broadcast - supports text and all media types, to all or specific users.
     
-    if target_users:
-        users_to_send = target_users
-    else:
-        users_to_send = db.get_all_users()
+    The broadcast is persisted first so it resumes after a restart (see broadcast_engine).
+    """
+    from broadcast_engine import broadcast_engine
     
-    total_users = len(users_to_send)
-    successful_sends = 0
-
-    if total_users == 0:
+    broadcast_id = broadcast_engine.create(admin_id, broadcast_data)
+    if broadcast_id is None:
         return 0, 0
-
-    broadcast_type = broadcast_data.get('type', 'text')
     
-    for user_id in users_to_send:
-        try:
-            if broadcast_type == 'text':
-                await client.send_message(user_id, broadcast_data['message'])
-            elif broadcast_type == 'photo':
-                await client.send_photo(
-                    user_id, 
-                    broadcast_data['file'],
-                    caption=broadcast_data.get('caption')
-                )
-            elif broadcast_type == 'video':
-                await client.send_video(
-                    user_id, 
-                    broadcast_data['file'],
-                    caption=broadcast_data.get('caption')
-                )
-            elif broadcast_type == 'audio':
-                await client.send_audio(
-                    user_id, 
-                    broadcast_data['file'],
-                    caption=broadcast_data.get('caption')
-                )
-            elif broadcast_type == 'voice':
-                await client.send_voice(
-                    user_id, 
-                    broadcast_data['file'],
-                    caption=broadcast_data.get('caption')
-                )
-            elif broadcast_type == 'document':
-                await client.send_document(
-                    user_id, 
-                    broadcast_data['file'],
-                    caption=broadcast_data.get('caption')
-                )
-            elif broadcast_type == 'animation':
-                await client.send_animation(
-                    user_id, 
-                    broadcast_data['file'],
-                    caption=broadcast_data.get('caption')
-                )
-            elif broadcast_type == 'sticker':
-                await client.send_sticker(user_id, broadcast_data['file'])
-            
-            successful_sends += 1
-            await asyncio.sleep(0.1)
-        except Exception as e:
-            continue
+    return await broadcast_engine.run(client, broadcast_id, on_progress)
+
+@admin_only
+async def memory_profile_command(client, message):
+    """Control the tracemalloc profiler and show the top memory growers"""
+    try:
+        from memory_profiler import memory_profiler, MEMORY_PROFILER_INTERVAL
+        args = get_command_args(message.text)
+        action = args[0].lower() if args else 'show'
+
+        if action == 'on':
+            memory_profiler.start()
+            memory_profiler.ensure_running()
+            await client.send_message(message.chat.id, f"✅ **Memory profiler on** (snapshot every {MEMORY_PROFILER_INTERVAL}s). Use `/memprofile now` for a diff.")
+            return
+        if action == 'off':
+            memory_profiler.stop()
+            await client.send_message(message.chat.id, "✅ **Memory profiler off.**")
+            return
+        if action not in ('show', 'now'):
+            await client.send_message(message.chat.id, "**Usage:** `/memprofile [on|off|now]`")
+            return
+        if not memory_profiler.enabled:
+            await client.send_message(message.chat.id, "ℹ️ **Memory profiler is off.** Enable with `/memprofile on`.")
+            return
+
+        report = await memory_profiler.take_async() if action == 'now' else memory_profiler.last_report
+        if not report:
+            await client.send_message(message.chat.id, "ℹ️ **No snapshot yet.** Try `/memprofile now`.")
+            return
 
-    broadcast_content = broadcast_data.get('message') or broadcast_data.get('caption') or f"[{broadcast_type.upper()} broadcast]"
-    db.save_broadcast(broadcast_content, admin_id, total_users, successful_sends)
+        lines = [
+            "🧠 **MEMORY PROFILE**",
+            f"🕒 `{report['taken_at']}` - traced `{report['traced_mb']}MB` (peak `{report['peak_mb']}MB`, overhead `{report['overhead_mb']}MB`)\n",
+            "📦 **By subsystem:**",
+        ]
+        for entry in report['subsystems']:
+            lines.append(f"• `{entry['name']}`: `{entry['kb']}KB` (`{entry['delta_kb']:+}KB`)")
+        if report['baseline']:
+            lines.append("\nℹ️ First snapshot - growth is shown from the next one.")
+        elif report['top_growers']:
+            lines.append("\n📈 **Top growers:**")
+            for entry in report['top_growers'][:5]:
+                lines.append(f"• `{entry['file']}` +`{entry['delta_kb']}KB` ({entry['subsystem']})")
+        if report['top_lines']:
+            lines.append("\n🔎 **Largest lines:**")
+            for entry in report['top_lines'][:5]:
+                lines.append(f"• `{entry['line']}`: `{entry['kb']}KB`")
+
+        await client.send_message(message.chat.id, "\n".join(lines))
 
-    return total_users, successful_sends
+    except Exception as e:
+        await client.send_message(message.chat.id, f"❌ **Error: {str(e)}**")
+        LOGGER(__name__).error(f"Error in memory_profile_command: {e}")
+
+@admin_only
+async def traces_command(client, message):
+    """Show recent download traces, one trace in detail, or the slowest stages"""
+    try:
+        from tracing import tracer
+        from helpers.files import get_readable_file_size
+        args = get_command_args(message.text)
+
+        if args and args[0].lower() == 'slow':
+            summary = tracer.stage_summary()
+            if not summary:
+                await client.send_message(message.chat.id, "ℹ️ **No finished traces yet.**")
+                return
+            lines = ["🐢 **SLOWEST STAGES** (recent traces)\n"]
+            for entry in summary[:12]:
+                lines.append(f"• `{entry['stage']}` x{entry['count']}: avg `{entry['avg']}s`, p95 `{entry['p95']}s`, max `{entry['max']}s`")
+            await client.send_message(message.chat.id, "\n".join(lines))
+            return
+
+        if args:
+            trace = tracer.get(args[0])
+            if trace is None:
+                await client.send_message(message.chat.id, f"❌ **No trace `{args[0]}` in the buffer.**")
+                return
+            lines = [
+                f"🧵 **TRACE `{trace['job_id']}`** ({trace['kind']}, user `{trace['user_id']}`)",
+                f"🕒 `{trace['started_at']}` - `{trace['duration']}s` - **{trace['outcome']}**",
+            ]
+            if trace['attrs'].get('url'):
+                lines.append(f"🔗 {trace['attrs']['url']}")
+            lines.append("")
+            for span in trace['spans'][:40]:
+                size = f" {get_readable_file_size(span['bytes'])}" if span.get('bytes') else ""
+                outcome = "" if span['outcome'] == 'ok' else f" ⚠️ {span['outcome']}"
+                lines.append(f"{'  ' * span['depth']}• `+{span['start']}s` `{span['name']}` `{span['duration']}s`{size}{outcome}")
+            if trace['dropped_spans']:
+                lines.append(f"\n… {trace['dropped_spans']} more spans not kept")
+            await client.send_message(message.chat.id, "\n".join(lines))
+            return
+
+        traces = tracer.recent(10)
+        if not traces:
+            await client.send_message(message.chat.id, "ℹ️ **No traces yet.**")
+            return
+        lines = ["🧵 **RECENT DOWNLOAD TRACES**\n"]
+        for trace in traces:
+            slowest = max(trace['spans'], key=lambda span: span['duration'], default=None)
+            slow_text = f" - slowest `{slowest['name']}` `{slowest['duration']}s`" if slowest else ""
+            lines.append(f"• `{trace['job_id']}` user `{trace['user_id']}` `{trace['duration']}s` **{trace['outcome']}**{slow_text}")
+        lines.append("\nDetails: `/traces <job_id>` - stage summary: `/traces slow`")
+        await client.send_message(message.chat.id, "\n".join(lines))
+
+    except Exception as e:
+        await client.send_message(message.chat.id, f"❌ **Error: {str(e)}**")
+        LOGGER(__name__).error(f"Error in traces_command: {e}")
 
 @admin_only
 async def admin_stats_command(client, message, download_mgr=None):
@@ -365,6 +417,18 @@ async def admin_stats_command(client, message, download_mgr=None):
         if download_mgr:
             active_downloads = len(download_mgr.active_downloads)
 
+        from helpers.transfer_stats import transfer_metrics
+        from helpers.files import get_readable_file_size
+        transfers = transfer_metrics.get_summary()
+        from rate_governor import rate_governor
+        rate_stats = rate_governor.get_stats()
+        from cloud_backup import backup_scheduler
+        backup_stats = backup_scheduler.get_stats()
+        from memory_pressure import memory_pressure
+        pressure = memory_pressure.get_stats()
+        from helpers.workspace import workspace_manager
+        workspaces = workspace_manager.get_stats()
+
         stats_text = (
             "👑 **ADMIN DASHBOARD**\n"
             "——————————————————————————\n\n"
@@ -376,11 +440,26 @@ async def admin_stats_command(client, message, download_mgr=None):
             f"🔐 Admins: `{stats.get('admin_count', 0)}`\n\n"
             "📈 **Download Activity:**\n"
             f"📥 Today: `{stats.get('today_downloads', 0)}`\n"
-            f"⚡ Active: `{active_downloads}`\n\n"
+            f"⚡ Active: `{active_downloads}`\n"
+            f"✅ Transfers (since start): `{transfers['completed']}` ok / `{transfers['failed']}` failed\n"
+            f"🚀 Recent Avg Speed: `{get_readable_file_size(transfers['recent_avg_speed'])}/s`\n"
+            f"⏸ Recent Stall Time: `{transfers['recent_stall_time']}s`\n"
+            f"🗂 Workspaces: `{workspaces['workspaces']}` open, `{workspaces['files']}` files, `{workspaces['orphans_removed']}` orphans removed\n\n"
+            "🚦 **Telegram API Rate:**\n"
+            f"📨 Calls: `{rate_stats['calls']}` (throttled `{rate_stats['throttled']}`, dropped edits `{rate_stats['dropped']}`)\n"
+            f"🌊 FloodWaits: `{rate_stats['flood_waits']}` (`{rate_stats['flood_wait_seconds']}s`), SlowMode: `{rate_stats['slowmode_waits']}`\n\n"
+            "🧠 **Memory Pressure:**\n"
+            f"📶 Level: `{pressure['level']}` at `{pressure['rss_mb']}MB` (for `{pressure['since_seconds']}s`)\n"
+            f"🚫 Shed: `{pressure['rejected_downloads']}` downloads, `{pressure['rejected_sessions']}` sessions, `{pressure['evicted_sessions']}` evicted\n\n"
+            "💾 **Backups:**\n"
+            f"☁️ Uploads: `{backup_stats['uploads']}` (`{get_readable_file_size(backup_stats['bytes_shipped'])}`), failed `{backup_stats['failures']}`\n"
+            f"⏱ Lag: last `{backup_stats['last_lag_seconds']}s`, max `{backup_stats['max_lag_seconds']}s`, pending `{backup_stats['pending_seconds']}s`\n\n"
             "——————————————————————————\n\n"
             "⚙️ **Quick Admin Actions:**\n"
             "• `/killall` - Cancel all downloads\n"
             "• `/broadcast` - Send message to all\n"
+            "• `/memprofile` - Memory growth by subsystem\n"
+            "• `/traces` - Per-stage timing of recent downloads\n"
             "• `/logs` - View bot logs"
         )
 
@@ -452,10 +531,26 @@ async def broadcast_callback_handler(client, callback_query):
 
         await callback_query.edit_message_text("📡 **Sending broadcast... Please wait.**")
 
-        total_users, successful_sends = await execute_broadcast(client, admin_id, broadcast_data)
+        async def report_progress(progress):
+            from rate_governor import rate_governor, Priority
+            await rate_governor.try_call(
+                callback_query.edit_message_text,
+                f"📡 **Sending broadcast...**\n\n"
+                f"**Sent:** `{progress['sent']}/{progress['total']}`\n"
+                f"**Failed:** `{progress['failed']}`\n"
+                f"**Blocked/Deleted:** `{progress['blocked']}`",
+                priority=Priority.PROGRESS_EDIT
+            )
 
-        if hasattr(client, f'pending_broadcast_{admin_id}'):
-            delattr(client, f'pending_broadcast_{admin_id}')
+        try:
+            total_users, successful_sends = await execute_broadcast(client, admin_id, broadcast_data, report_progress)
+        except Exception as e:
+            # The engine already marked the broadcast failed and logged it
+            await callback_query.edit_message_text(f"❌ **Broadcast failed:** `{e}`")
+            return
+        finally:
+            if hasattr(client, f'pending_broadcast_{admin_id}'):
+                delattr(client, f'pending_broadcast_{admin_id}')
 
         result_text = (
             f"✅ **Broadcast Completed!**\n\n"
@@ -0,0 +1,206 @@
+"""
+Optional ASGI front end for the web server (WEB_SERVER_MODE=asgi).
+
+Runs under uvicorn on the bot's own event loop (ASGI_LOOP=bot, default) or
+on a dedicated loop in the main thread (ASGI_LOOP=dedicated). Hot public
+routes (/health, /, /verify-ad) are native coroutines, so thousands of
+concurrent ad-verification requests cost one task each instead of tying up
+a fixed pool of waitress threads; their database work runs via
+asyncio.to_thread. Every other route (admin pages, downloads, DB browser)
+is bridged to the existing WSGI application in a worker thread, so both
+modes serve exactly the same routes.
+
+uvicorn is optional; without it the server falls back to waitress.
+"""
+
+import io
+import os
+import sys
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from logger import LOGGER
+
+WEB_SERVER_MODE = os.getenv("WEB_SERVER_MODE", "wsgi").lower()
+ASGI_LOOP = os.getenv("ASGI_LOOP", "bot").lower()
+
+# Request bodies larger than this are rejected (admin forms/editor saves are far smaller)
+ASGI_MAX_BODY_BYTES = int(os.getenv("ASGI_MAX_BODY_BYTES", str(16 * 1024 * 1024)))
+
+# Native handler: async (environ) -> (status line, headers, body)
+NativeHandler = Callable[[dict], Awaitable[Tuple[str, List[Tuple[str, str]], bytes]]]
+
+
+def asgi_available() -> bool:
+    try:
+        import uvicorn  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def asgi_enabled() -> bool:
+    """True when ASGI mode is requested and uvicorn is installed"""
+    if WEB_SERVER_MODE != 'asgi':
+        return False
+    if not asgi_available():
+        LOGGER(__name__).warning("WEB_SERVER_MODE=asgi but uvicorn is not installed - using waitress")
+        return False
+    return True
+
+
+def build_environ(scope: dict, body: bytes) -> dict:
+    """WSGI environ for an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            continue
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _encode_headers(headers: List[Tuple[str, str]]) -> List[Tuple[bytes, bytes]]:
+    return [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers]
+
+
+class AsgiApp:
+    """ASGI application: native async routes first, everything else through the WSGI app"""
+
+    def __init__(self, wsgi_app: Callable):
+        self.wsgi_app = wsgi_app
+        self.native: Dict[str, Dict[str, NativeHandler]] = {}
+
+    def route(self, path: str, *methods: str):
+        def decorator(handler: NativeHandler) -> NativeHandler:
+            table = self.native.setdefault(path, {})
+            for method in methods or ('*',):
+                table[method.upper()] = handler
+            return handler
+        return decorator
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            await self._respond(send, '413 Payload Too Large', [('Content-Type', 'application/json; charset=utf-8')],
+                                b'{"error": "Request body too large"}')
+            return
+
+        environ = build_environ(scope, body)
+        table = self.native.get(scope['path'])
+        handler = table and (table.get(scope['method']) or table.get('*'))
+        if handler is not None:
+            try:
+                status, headers, payload = await handler(environ)
+            except Exception as e:
+                LOGGER(__name__).error(f"ASGI error on {scope['path']}: {e}")
+                status, headers, payload = '500 Internal Server Error', [('Content-Type', 'application/json; charset=utf-8')], b'{"error": "Internal Server Error"}'
+            if scope['method'] == 'HEAD':
+                payload = b''
+            await self._respond(send, status, headers, payload)
+            return
+
+        await self._call_wsgi(environ, send)
+
+    async def _read_body(self, receive) -> Optional[bytes]:
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > ASGI_MAX_BODY_BYTES:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                break
+        return b''.join(chunks)
+
+    @staticmethod
+    async def _respond(send, status: str, headers: List[Tuple[str, str]], body: bytes):
+        code = int(status.split(' ', 1)[0])
+        # 204/304 must not carry a body length
+        if code not in (204, 304) and not any(name.lower() == 'content-length' for name, _ in headers):
+            headers = headers + [('Content-Length', str(len(body)))]
+        await send({'type': 'http.response.start', 'status': code,
+                    'headers': _encode_headers(headers)})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _call_wsgi(self, environ: dict, send):
+        """Run the WSGI app in a worker thread and relay its (possibly streamed) body"""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+            return lambda data: None
+
+        def first_chunk():
+            iterable = self.wsgi_app(environ, start_response)
+            iterator = iter(iterable)
+            return iterable, iterator, next(iterator, None)
+
+        iterable, iterator, chunk = await asyncio.to_thread(first_chunk)
+        try:
+            await send({'type': 'http.response.start',
+                        'status': int(response['status'].split(' ', 1)[0]),
+                        'headers': _encode_headers(response['headers'])})
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await asyncio.to_thread(next, iterator, None)
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close:
+                await asyncio.to_thread(close)
+
+
+async def serve_asgi(app: AsgiApp, host: str, port: int):
+    """Serve the ASGI app with uvicorn on the current event loop"""
+    import uvicorn
+    config = uvicorn.Config(
+        app, host=host, port=port,
+        loop="none", lifespan="off",
+        log_level="warning", access_log=False,
+        timeout_keep_alive=15,
+    )
+    server = uvicorn.Server(config)
+    LOGGER(__name__).info(f"Starting ASGI server (uvicorn) on {host}:{port}")
+    await server.serve()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+CPU cost of hot-path logging in the transfer helpers, per download request.
+
+Runs one download plus upload through download_media_fast/upload_media_fast
+with a client stand-in that calls the progress callback once per 512KB part
+(no network), comparing the current helpers/transfer.py with a baseline
+version of it - e.g. the one before the hot-path log guards. Both run with the real logger pipeline,
+psutil and pyrogram (pip install -r requirements.txt), at the default INFO
+level.
+
+Both versions call gc.collect() at the same points; with pyrogram loaded a
+collection costs tens of milliseconds and varies with heap size, which would
+bury the difference, so it is replaced by a no-op in the measured modules.
+The two versions alternate for several rounds and the median is reported.
+
+    python bench_logging.py BASELINE [--parts 2000] [--runs 50] [--rounds 5]
+
+BASELINE is a git revision whose helpers/transfer.py is compared (for the log
+guards: the parent of the commit "Keep RAM sampling and log formatting off the
+hot paths"), or the path of a saved copy of the file.
+
+Results are printed and appended to bench_output.txt.
+"""
+
+import os
+import sys
+import time
+import types
+import asyncio
+import argparse
+import statistics
+import tempfile
+import subprocess
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+PART_SIZE = 512 * 1024
+
+
+def _baseline_source(baseline: str) -> str:
+    """helpers/transfer.py at a git revision, or the contents of a file path"""
+    if os.path.isfile(baseline):
+        with open(baseline) as f:
+            return f.read()
+    result = subprocess.run(
+        ["git", "show", f"{baseline}:helpers/transfer.py"],
+        cwd=REPO_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"Baseline {baseline!r} is neither a file nor a git revision: {result.stderr.strip()}")
+    return result.stdout
+
+
+def _load_transfer(source: str) -> types.ModuleType:
+    # Same module name as the real one, so both get the same logger and rate limits
+    module = types.ModuleType("helpers.transfer")
+    module.__file__ = os.path.join(REPO_DIR, "helpers", "transfer.py")
+    exec(compile(source, module.__file__, "exec"), module.__dict__)
+    module.gc = types.SimpleNamespace(collect=lambda *args: 0)
+    return module
+
+
+class _Client:
+    def __init__(self, parts: int):
+        self.parts = parts
+
+    async def download_media(self, message, file_name=None, progress=None):
+        total = self.parts * PART_SIZE
+        for part in range(1, self.parts + 1):
+            if progress:
+                progress(part * PART_SIZE, total)
+        return file_name
+
+
+def _message(parts: int):
+    document = types.SimpleNamespace(file_size=parts * PART_SIZE)
+    return types.SimpleNamespace(
+        document=document, media=None, video=None, audio=None, photo=None,
+        voice=None, video_note=None, animation=None, sticker=None
+    )
+
+
+def _user_progress(current, total):
+    pass
+
+
+def _measure(module, parts: int, runs: int, upload_file: str) -> float:
+    client = _Client(parts)
+    message = _message(parts)
+    loop = asyncio.new_event_loop()
+
+    async def one_request():
+        await module.download_media_fast(client, message, "bench.bin", _user_progress)
+        await module.upload_media_fast(None, upload_file)
+
+    try:
+        for _ in range(max(1, runs // 10)):
+            loop.run_until_complete(one_request())
+        started = time.process_time()
+        for _ in range(runs):
+            loop.run_until_complete(one_request())
+        # process_time includes the log listener thread, so log I/O is counted too
+        return (time.process_time() - started) / runs * 1e6
+    finally:
+        loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("baseline", help="git revision, or file path, of the helpers/transfer.py to compare against")
+    parser.add_argument("--parts", type=int, default=2000, help="512KB parts per download (2000 = ~1GB)")
+    parser.add_argument("--runs", type=int, default=50, help="requests per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    baseline_source = _baseline_source(args.baseline)
+    with open(os.path.join(REPO_DIR, "helpers", "transfer.py")) as f:
+        current_source = f.read()
+
+    # logger.py writes logs.txt to the working directory and echoes to stderr;
+    # keep both out of the repo and the terminal
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(tempfile.mkdtemp(prefix="bench_logging_"))
+    stderr = sys.stderr
+    sys.stderr = open(os.devnull, "w")
+    try:
+        import logger  # noqa: F401  (configures the queue pipeline with the devnull stream)
+    finally:
+        sys.stderr = stderr
+
+    upload_file = os.path.abspath("upload.bin")
+    with open(upload_file, "wb") as f:
+        f.write(b"\0" * PART_SIZE)
+
+    modules = {"baseline": _load_transfer(baseline_source), "current": _load_transfer(current_source)}
+    samples = {name: [] for name in modules}
+    for _ in range(args.rounds):
+        for name, module in modules.items():
+            samples[name].append(_measure(module, args.parts, args.runs, upload_file))
+    results = {name: statistics.median(values) for name, values in samples.items()}
+
+    saved = results["baseline"] - results["current"]
+    lines = [
+        f"{datetime.now():%Y-%m-%d %H:%M:%S} bench_logging parts={args.parts} runs={args.runs}x{args.rounds} baseline={args.baseline}",
+        f"  baseline: {results['baseline']:.0f} us CPU per request",
+        f"  current:  {results['current']:.0f} us CPU per request",
+        f"  saved:    {saved:.0f} us ({saved / results['baseline'] * 100:.0f}%)",
+    ]
+    print("\n".join(lines))
+    with open(os.path.join(REPO_DIR, "bench_output.txt"), "a") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# Copyright (C) @Wolfy004
+# Channel: https://t.me/Wolfy004
+# Resumable broadcast engine: paged recipients, bounded concurrency, per-recipient status
+
+import os
+import json
+import asyncio
+from typing import Dict, Optional, Tuple, Callable, Awaitable
+from logger import LOGGER
+from database_sqlite import db
+from rate_governor import rate_governor, Priority
+
+# Parallel sends per page. The rate governor keeps the actual rate under
+# Telegram's ~30 msg/s bulk limit; this only bounds in-flight requests.
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "25"))
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "200"))
+
+# Pyrogram error classes that mean the user can't receive messages any more
+BLOCKED_ERRORS = {'UserIsBlocked', 'PeerIdInvalid', 'InputUserDeactivated', 'UserDeactivated', 'UserDeactivatedBan'}
+DEACTIVATED_ERRORS = {'InputUserDeactivated', 'UserDeactivated', 'UserDeactivatedBan'}
+
+# broadcast type -> (client method, supports caption)
+SEND_METHODS = {
+    'photo': ('send_photo', True),
+    'video': ('send_video', True),
+    'audio': ('send_audio', True),
+    'voice': ('send_voice', True),
+    'document': ('send_document', True),
+    'animation': ('send_animation', True),
+    'sticker': ('send_sticker', False),
+}
+
+
+class BroadcastEngine:
+    """
+    Sends broadcasts page by page (keyset on user_id) with bounded concurrency.
+
+    Every page's per-recipient results and the resume cursor are committed in one
+    transaction, so a restart continues where it stopped instead of starting over.
+    Users that blocked the bot or deleted their account are flagged and skipped
+    by later broadcasts. Concurrency halves after a FloodWait and grows back slowly.
+    """
+
+    def __init__(self, max_concurrency: int = BROADCAST_CONCURRENCY, page_size: int = BROADCAST_PAGE_SIZE):
+        self.max_concurrency = max_concurrency
+        self.page_size = page_size
+
+    def create(self, admin_id: int, broadcast_data: dict) -> Optional[int]:
+        """Persist a new broadcast and return its id"""
+        target_users = broadcast_data.get('target_users')
+        if target_users:
+            total_users = sum(len(page) for page in self._target_pages(target_users, 0))
+        else:
+            total_users = db.count_broadcast_recipients()
+        broadcast_type = broadcast_data.get('type', 'text')
+        content = broadcast_data.get('message') or broadcast_data.get('caption') or f"[{broadcast_type.upper()} broadcast]"
+        return db.create_broadcast(content, admin_id, json.dumps(broadcast_data), total_users)
+
+    def _target_pages(self, target_users, cursor_user_id: int):
+        """Explicit recipients after the cursor, minus banned/blocked users like the full audience"""
+        remaining = sorted(u for u in set(target_users) if u > cursor_user_id)
+        for i in range(0, len(remaining), self.page_size):
+            chunk = remaining[i:i + self.page_size]
+            unreachable = db.get_unreachable_user_ids(chunk)
+            page = [user_id for user_id in chunk if user_id not in unreachable]
+            if page:
+                yield page
+
+    def _recipient_pages(self, broadcast_data: dict, cursor_user_id: int):
+        target_users = broadcast_data.get('target_users')
+        if target_users:
+            yield from self._target_pages(target_users, cursor_user_id)
+            return
+
+        yield from db.iter_broadcast_recipient_pages(cursor_user_id, self.page_size)
+
+    async def _send_one(self, client, user_id: int, broadcast_data: dict) -> Tuple[int, str, Optional[str]]:
+        broadcast_type = broadcast_data.get('type', 'text')
+        try:
+            if broadcast_type == 'text':
+                await rate_governor.call(client.send_message, user_id, broadcast_data['message'], priority=Priority.BULK)
+            else:
+                method_name, has_caption = SEND_METHODS[broadcast_type]
+                kwargs = {'caption': broadcast_data.get('caption')} if has_caption else {}
+                await rate_governor.call(
+                    getattr(client, method_name), user_id, broadcast_data['file'],
+                    priority=Priority.BULK, **kwargs
+                )
+            return user_id, 'sent', None
+        except Exception as e:
+            error_name = type(e).__name__
+            if error_name in DEACTIVATED_ERRORS:
+                return user_id, 'deactivated', error_name
+            if error_name in BLOCKED_ERRORS:
+                return user_id, 'blocked', error_name
+            LOGGER(__name__).warning(f"Broadcast to {user_id} failed: {error_name}: {e}")
+            return user_id, 'failed', f"{error_name}: {e}"[:200]
+
+    async def run(self, client, broadcast_id: int,
+                  on_progress: Optional[Callable[[Dict], Awaitable]] = None) -> Tuple[int, int]:
+        """
+        Send (or resume) a broadcast.
+
+        Returns:
+            (total_users, successful_sends)
+        """
+        record = db.get_broadcast(broadcast_id)
+        if not record or not record.get('payload'):
+            LOGGER(__name__).error(f"Broadcast {broadcast_id} not found or has no payload")
+            if record:
+                # Nothing to resume from - don't retry it on every restart
+                db.finish_broadcast(broadcast_id, 'failed')
+            return 0, 0
+
+        total_users = record['total_users']
+        sent = record.get('successful_sends') or 0
+        failed = record.get('failed_sends') or 0
+        blocked = record.get('blocked_sends') or 0
+        cursor_user_id = record.get('cursor_user_id') or 0
+        concurrency = self.max_concurrency
+
+        if cursor_user_id:
+            LOGGER(__name__).info(f"Resuming broadcast {broadcast_id} after user {cursor_user_id} ({sent} already sent)")
+
+        try:
+            broadcast_data = json.loads(record['payload'])
+            for page in self._recipient_pages(broadcast_data, cursor_user_id):
+                done = db.get_broadcast_done_ids(broadcast_id, page)
+                pending = [user_id for user_id in page if user_id not in done]
+
+                flood_waits_before = rate_governor.counters['flood_waits']
+                semaphore = asyncio.Semaphore(concurrency)
+
+                async def guarded(user_id):
+                    async with semaphore:
+                        return await self._send_one(client, user_id, broadcast_data)
+
+                results = await asyncio.gather(*(guarded(user_id) for user_id in pending))
+
+                for _, status, _ in results:
+                    if status == 'sent':
+                        sent += 1
+                    elif status == 'failed':
+                        failed += 1
+                    else:
+                        blocked += 1
+
+                db.record_broadcast_page(broadcast_id, results, page[-1], sent, failed, blocked)
+
+                # Adaptive concurrency: back off hard on FloodWait, recover gradually
+                if rate_governor.counters['flood_waits'] > flood_waits_before:
+                    concurrency = max(1, concurrency // 2)
+                    LOGGER(__name__).warning(f"Broadcast {broadcast_id}: FloodWait seen, concurrency -> {concurrency}")
+                elif concurrency < self.max_concurrency:
+                    concurrency += 1
+
+                if on_progress:
+                    try:
+                        await on_progress({
+                            'total': total_users, 'sent': sent, 'failed': failed, 'blocked': blocked
+                        })
+                    except Exception:
+                        pass
+        except asyncio.CancelledError:
+            LOGGER(__name__).info(f"Broadcast {broadcast_id} interrupted at {sent}/{total_users} - will resume on restart")
+            raise
+        except Exception as e:
+            # A deterministic failure (bad payload, DB error) would repeat on every resume
+            db.finish_broadcast(broadcast_id, 'failed')
+            LOGGER(__name__).error(f"Broadcast {broadcast_id} failed at {sent}/{total_users}: {e} - marked failed, not resumed")
+            raise
+
+        db.finish_broadcast(broadcast_id, 'completed')
+        LOGGER(__name__).info(
+            f"Broadcast {broadcast_id} complete: {sent}/{total_users} sent, {failed} failed, {blocked} blocked/deactivated"
+        )
+        return total_users, sent
+
+    async def resume_unfinished(self, client):
+        """Resume broadcasts that were still running when the bot stopped"""
+        # The cursor and recipient rows must come from the restored database, not
+        # the stale local one that the restore is about to replace
+        from cloud_backup import wait_for_hydration
+        await wait_for_hydration()
+        for broadcast_id in db.get_unfinished_broadcasts():
+            LOGGER(__name__).info(f"Resuming unfinished broadcast {broadcast_id}")
+            try:
+                await self.run(client, broadcast_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGGER(__name__).error(f"Error resuming broadcast {broadcast_id}: {e}")
+
+
+# Global broadcast engine instance
+broadcast_engine = BroadcastEngine()
@@ -11,6 +11,7 @@ import time
 from typing import Optional, Dict, Any
 from collections import OrderedDict
 from logger import LOGGER
+from metrics import metrics
 
 class LRUCache:
     """Simple LRU cache with TTL (Time To Live) support"""
@@ -25,6 +26,8 @@ class LRUCache:
         """
         self.cache: OrderedDict = OrderedDict()
         self.max_size = max_size
+        # Configured size; max_size drops below it under memory pressure
+        self.base_max_size = max_size
         self.default_ttl = default_ttl
         self.hits = 0
         self.misses = 0
@@ -58,6 +61,9 @@ class LRUCache:
         if ttl is None:
             ttl = self.default_ttl
         
+        if self.max_size <= 0:
+            return
+        
         # Remove oldest if at capacity
         if len(self.cache) >= self.max_size and key not in self.cache:
             self.cache.popitem(last=False)
@@ -73,6 +79,16 @@ class LRUCache:
         if key in self.cache:
             del self.cache[key]
     
+    def resize(self, max_size: int):
+        """Change capacity, evicting least recently used entries beyond it"""
+        self.max_size = max(0, max_size)
+        evicted = 0
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+            evicted += 1
+        if evicted:
+            LOGGER(__name__).info(f"Cache resized to {self.max_size}: evicted {evicted} entries")
+    
     def clear_pattern(self, pattern: str):
         """Clear all keys matching pattern (e.g., 'user_123_*')"""
         keys_to_delete = [k for k in self.cache.keys() if pattern in k]
@@ -132,3 +148,10 @@ _cache = LRUCache(max_size=CACHE_SIZE, default_ttl=120)  # Shorter TTL (2 min) t
 def get_cache() -> LRUCache:
     """Get global cache instance"""
     return _cache
+
+
+# Read at scrape time; get()/set() stay free of metric updates
+metrics.counter('cache_hits_total', 'LRU cache hits (reset by clear())', function=lambda: _cache.hits)
+metrics.counter('cache_misses_total', 'LRU cache misses (reset by clear())', function=lambda: _cache.misses)
+metrics.gauge('cache_entries', 'Entries in the LRU cache', function=lambda: len(_cache.cache))
+metrics.gauge('cache_capacity', 'Current LRU cache capacity', function=lambda: _cache.max_size)
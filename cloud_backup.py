@@ -1,207 +1,262 @@
 #!/usr/bin/env python3
 """
-GitHub Backup Integration for SQLite Database
-Automatically backs up database to GitHub repository
+Cloud Backup Integration for SQLite Database
+Automatically backs up the database to GitHub (or a local directory) as
+incremental compressed archives - see incremental_backup.py
 """
 
 import os
-import shutil
-import sqlite3
-from datetime import datetime
+from time import monotonic
 from logger import LOGGER
 import threading
 
 DB_PATH = os.getenv("DATABASE_PATH", "telegram_bot.db")
 
-# Concurrency control for backup operations
-_backup_lock = threading.Lock()
-_backup_in_progress = False
+# A backup runs once changes have been quiet for the debounce window, but
+# never later than the max-staleness deadline after the first unsaved change
+BACKUP_DEBOUNCE_SECONDS = float(os.getenv("BACKUP_DEBOUNCE_SECONDS", "30"))
+BACKUP_MAX_STALENESS_SECONDS = float(os.getenv("BACKUP_MAX_STALENESS_SECONDS", "300"))
+BACKUP_RETRY_SECONDS = float(os.getenv("BACKUP_RETRY_SECONDS", "60"))
+# Startup waits this long for a restore before serving on the local DB;
+# the restore then finishes (and swaps the DB in) in the background
+BACKUP_RESTORE_WAIT_SECONDS = float(os.getenv("BACKUP_RESTORE_WAIT_SECONDS", "30"))
 
-def _create_temp_backup():
-    """Create a temporary backup of the database for GitHub upload (internal use only)"""
-    if not os.path.exists(DB_PATH):
-        LOGGER(__name__).warning(f"Database file not found: {DB_PATH}")
+# Restored database is built next to DB_PATH so it can be renamed into place
+RESTORE_TEMP_PATH = f"{DB_PATH}.restore"
+
+_hydration_task = None
+# (mtime, size) of the local database files when the startup restore began
+_hydration_signature = None
+
+BACKUP_SERVICES = ("github", "local")
+
+_engine = None
+
+def _backup_service():
+    """Configured CLOUD_BACKUP_SERVICE if it is supported, else empty string"""
+    service = os.getenv("CLOUD_BACKUP_SERVICE", "").lower().strip()
+    return service if service in BACKUP_SERVICES else ""
+
+def get_backup_engine():
+    """Incremental backup engine for the configured service (None when not configured)"""
+    global _engine
+    service = _backup_service()
+    if not service:
         return None
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    temp_path = f"temp_backup_{timestamp}.db"
-    
+    if _engine is None or _engine.backend.name != service:
+        from incremental_backup import IncrementalBackup, backend_for_service
+        backend = backend_for_service(service)
+        if backend is None:
+            return None
+        _engine = IncrementalBackup(DB_PATH, backend)
+    return _engine
+
+def hydration_pending():
+    """True while the startup restore is still running in the background"""
+    return _hydration_task is not None and not _hydration_task.done()
+
+async def wait_for_hydration():
+    """Wait for the background startup restore (if any) to finish, whatever its outcome"""
+    import asyncio
+    if _hydration_task is None:
+        return
     try:
-        conn = sqlite3.connect(DB_PATH)
-        backup_conn = sqlite3.connect(temp_path)
-        
-        with backup_conn:
-            conn.backup(backup_conn)
-        
-        conn.close()
-        backup_conn.close()
-        
-        return temp_path
-    except Exception as e:
-        LOGGER(__name__).error(f"Failed to create temp backup: {e}")
-        return None
+        await asyncio.shield(_hydration_task)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        pass
+
+def _db_signature():
+    signature = []
+    for path in (DB_PATH, DB_PATH + "-wal"):
+        try:
+            st = os.stat(path)
+            signature.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
 
 def _restore_from_temp(backup_path):
-    """Restore database from a temporary backup file (internal use only)"""
+    """Swap a verified restored database into DB_PATH (internal use only)"""
     if not os.path.exists(backup_path):
         LOGGER(__name__).error(f"Backup file not found: {backup_path}")
         return False
     
     try:
-        if os.path.exists(DB_PATH):
-            backup_current = f"{DB_PATH}.before_restore"
-            shutil.copy2(DB_PATH, backup_current)
-            LOGGER(__name__).info(f"Current database backed up to: {backup_current}")
+        from database_sqlite import db
         
-        shutil.copy2(backup_path, DB_PATH)
+        # Renames only: no copy of either database, and writers are held off
+        # while the file changes underneath them
+        with db.lock:
+            if _hydration_signature is not None and _db_signature() != _hydration_signature:
+                # Bot handlers, /verify-ad and broadcast resume are held off while
+                # restoring; any other writer's changes are lost
+                LOGGER(__name__).warning(
+                    f"Local database was written while the restore ran - those writes are DISCARDED "
+                    f"by this restore (the previous file is kept as {DB_PATH}.before_restore)"
+                )
+            if os.path.exists(DB_PATH):
+                backup_current = f"{DB_PATH}.before_restore"
+                os.replace(DB_PATH, backup_current)
+                LOGGER(__name__).info(f"Current database moved to: {backup_current}")
+            # A leftover journal belongs to the old file and must not be replayed on the new one
+            for suffix in ("-journal", "-wal", "-shm"):
+                if os.path.exists(DB_PATH + suffix):
+                    os.remove(DB_PATH + suffix)
+            os.replace(backup_path, DB_PATH)
         LOGGER(__name__).info(f"✅ Database restored from: {backup_path}")
+        
+        # Backups taken by older versions may predate newer tables/triggers
+        try:
+            db.ensure_schema()
+        except Exception as e:
+            LOGGER(__name__).warning(f"Schema upgrade after restore failed: {e}")
         return True
     except Exception as e:
         LOGGER(__name__).error(f"Restore failed: {e}")
         return False
 
-def cleanup_old_github_backups(token, repo, keep_count=2):
-    """Delete old backups from GitHub, keeping only the newest ones"""
-    try:
-        import urllib.request
-        import json
-        
-        list_url = f"https://api.github.com/repos/{repo}/contents/backups"
-        headers = {
-            "Authorization": f"token {token}",
-            "Accept": "application/vnd.github.v3+json"
-        }
-        
-        req = urllib.request.Request(list_url, headers=headers)
-        with urllib.request.urlopen(req) as response:
-            backups = json.loads(response.read().decode())
-        
-        if not backups or len(backups) <= keep_count:
-            return
-        
-        sorted_backups = sorted(backups, key=lambda x: x['name'], reverse=True)
-        backups_to_delete = sorted_backups[keep_count:]
-        
-        for backup in backups_to_delete:
-            try:
-                delete_url = f"https://api.github.com/repos/{repo}/contents/{backup['path']}"
-                
-                req = urllib.request.Request(delete_url, headers=headers)
-                with urllib.request.urlopen(req) as resp:
-                    file_data = json.loads(resp.read().decode())
-                
-                data = {
-                    "message": f"Cleanup: Remove old backup {backup['name']}",
-                    "sha": file_data['sha']
-                }
-                
-                req = urllib.request.Request(
-                    delete_url,
-                    data=json.dumps(data).encode(),
-                    headers=headers,
-                    method='DELETE'
-                )
-                
-                with urllib.request.urlopen(req) as response:
-                    if response.status == 200:
-                        LOGGER(__name__).info(f"🗑️ Deleted old backup: {backup['name']}")
-            except Exception as e:
-                LOGGER(__name__).warning(f"Failed to delete {backup['name']}: {e}")
-    
-    except Exception as e:
-        LOGGER(__name__).warning(f"Cleanup failed: {e}")
-
-def backup_to_github():
-    """Upload database backup to GitHub repository"""
+def backup_to_cloud():
+    """Ship an incremental (or periodic full) backup to the configured service"""
     try:
-        import base64
-        import urllib.request
-        import json
-        
-        token = os.getenv("GITHUB_TOKEN")
-        repo = os.getenv("GITHUB_BACKUP_REPO")
-        
-        if not token or not repo:
-            LOGGER(__name__).error("GITHUB_TOKEN or GITHUB_BACKUP_REPO not set")
+        if hydration_pending():
+            # Backing up now would publish the pre-restore local database as the newest generation
+            LOGGER(__name__).info("Backup deferred: startup restore still running")
             return False
-        
-        # Create temporary backup for upload
-        temp_backup = _create_temp_backup()
-        if not temp_backup:
+        engine = get_backup_engine()
+        if engine is None:
+            LOGGER(__name__).error("Cloud backup is not configured")
             return False
-        
-        try:
-            with open(temp_backup, "rb") as f:
-                content = base64.b64encode(f.read()).decode()
-        finally:
-            # Clean up temp file
-            if os.path.exists(temp_backup):
-                os.remove(temp_backup)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_path = f"backups/backup_{timestamp}.db"
-        
-        url = f"https://api.github.com/repos/{repo}/contents/{file_path}"
-        
-        data = {
-            "message": f"Automated backup - {timestamp}",
-            "content": content
-        }
-        
-        headers = {
-            "Authorization": f"token {token}",
-            "Accept": "application/vnd.github.v3+json"
-        }
-        
-        req = urllib.request.Request(url, data=json.dumps(data).encode(), headers=headers, method='PUT')
-        
-        with urllib.request.urlopen(req) as response:
-            if response.status == 201:
-                LOGGER(__name__).info(f"✅ Uploaded to GitHub: {file_path}")
-                
-                cleanup_old_github_backups(token, repo, keep_count=2)
-                
-                return True
-            else:
-                LOGGER(__name__).error(f"GitHub upload failed: {response.status}")
-                return False
-                
+        return engine.run()
     except Exception as e:
-        LOGGER(__name__).error(f"❌ GitHub backup failed: {e}")
+        LOGGER(__name__).error(f"❌ Cloud backup failed: {e}")
         return False
 
-def trigger_backup_on_session(user_id):
-    """Trigger backup when new user session is created (non-blocking, thread-safe)"""
-    global _backup_in_progress
+# Backwards-compatible name
+backup_to_github = backup_to_cloud
+
+class BackupScheduler:
+    """
+    Single backup worker fed by a dirty flag.
     
-    backup_service = os.getenv("CLOUD_BACKUP_SERVICE", "").lower()
-    if backup_service != "github":
-        return False
+    Triggers only mark the database dirty, so a burst of changes costs one
+    backup, at most one backup is in flight, and a change made while a backup
+    runs leaves the flag set for a trailing backup. Failed backups keep the
+    flag (and the original change time) and retry after BACKUP_RETRY_SECONDS.
+    """
     
-    with _backup_lock:
-        if _backup_in_progress:
-            return False
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._thread = None
+        self._dirty = False
+        self._first_change = 0.0
+        self._last_change = 0.0
+        self._retry_at = 0.0
+        self._running = False
         
-        _backup_in_progress = True
+        self.triggers = 0
+        self.coalesced = 0
+        self.backups = 0
+        self.failures = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_reason = None
     
-    def _backup_worker():
-        global _backup_in_progress
-        try:
-            LOGGER(__name__).info(f"🔐 New session created for user {user_id}, triggering backup...")
-            backup_to_github()
-        except Exception as e:
-            LOGGER(__name__).error(f"Session backup failed: {e}")
-        finally:
-            with _backup_lock:
-                _backup_in_progress = False
+    def mark_dirty(self, reason):
+        """Record a change to be backed up; returns immediately"""
+        now = monotonic()
+        with self._cond:
+            self.triggers += 1
+            self.last_reason = reason
+            if self._dirty:
+                self.coalesced += 1
+            else:
+                self._dirty = True
+                self._first_change = now
+            self._last_change = now
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, daemon=True, name="BackupScheduler")
+                self._thread.start()
+            self._cond.notify()
+    
+    def _due_at(self):
+        due = min(self._last_change + BACKUP_DEBOUNCE_SECONDS,
+                  self._first_change + BACKUP_MAX_STALENESS_SECONDS)
+        return max(due, self._retry_at)
+    
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._dirty:
+                        self._cond.wait()
+                        continue
+                    delay = self._due_at() - monotonic()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                first_change = self._first_change
+                reason = self.last_reason
+                self._dirty = False
+                self._running = True
+            
+            LOGGER(__name__).info(f"💾 Backing up changes (latest: {reason})...")
+            success = False
+            try:
+                success = backup_to_cloud()
+            except Exception as e:
+                LOGGER(__name__).error(f"Scheduled backup failed: {e}")
+            
+            now = monotonic()
+            with self._cond:
+                self._running = False
+                if success:
+                    self.backups += 1
+                    self.last_lag = now - first_change
+                    self.max_lag = max(self.max_lag, self.last_lag)
+                    self._retry_at = 0.0
+                else:
+                    self.failures += 1
+                    # Keep the oldest unsaved change so staleness is measured from it
+                    if not self._dirty:
+                        self._dirty = True
+                        self._last_change = first_change
+                    self._first_change = first_change
+                    self._retry_at = now + BACKUP_RETRY_SECONDS
     
-    thread = threading.Thread(target=_backup_worker, daemon=True, name=f"SessionBackup-{user_id}")
-    thread.start()
+    def get_stats(self):
+        with self._cond:
+            pending_for = monotonic() - self._first_change if self._dirty else 0.0
+            running = self._running
+        engine = _engine
+        return {
+            'triggers': self.triggers,
+            'backups': self.backups,
+            'failures': self.failures,
+            'coalesced': self.coalesced,
+            'pending_seconds': round(pending_for, 1),
+            'running': running,
+            'last_lag_seconds': round(self.last_lag, 1),
+            'max_lag_seconds': round(self.max_lag, 1),
+            'uploads': engine.uploads if engine else 0,
+            'bytes_shipped': engine.bytes_shipped if engine else 0,
+        }
+
+
+# Global backup scheduler instance
+backup_scheduler = BackupScheduler()
+
+def trigger_backup_on_session(user_id):
+    """Schedule a backup after a new user session is created (non-blocking)"""
+    if not _backup_service():
+        return False
+    backup_scheduler.mark_dirty(f"session for user {user_id}")
     return True
 
 def trigger_backup_on_critical_change(operation_name, user_id=None):
     """
-    Trigger backup when critical database changes occur (non-blocking, thread-safe)
+    Schedule a backup after a critical database change (non-blocking)
     
     Critical operations that trigger backup:
         pass
@@ -211,127 +266,85 @@ def trigger_backup_on_critical_change(operation_name, user_id=None):
     - ban_user/unban_user: User ban status changes
     - increment_usage: User downloads files
     
-    This prevents data loss on Render/VPS restarts!
+    Bursts are coalesced by backup_scheduler. This prevents data loss on
+    Render/VPS restarts!
     """
-    global _backup_in_progress
-    
-    backup_service = os.getenv("CLOUD_BACKUP_SERVICE", "").lower()
-    if backup_service != "github":
+    if not _backup_service():
         return False
-    
-    with _backup_lock:
-        if _backup_in_progress:
-            return False
-        
-        _backup_in_progress = True
-    
-    def _backup_worker():
-        global _backup_in_progress
-        try:
-            user_info = f" (user {user_id})" if user_id else ""
-            LOGGER(__name__).info(f"💾 Critical change detected: {operation_name}{user_info}, triggering backup...")
-            backup_to_github()
-        except Exception as e:
-            LOGGER(__name__).error(f"Critical change backup failed: {e}")
-        finally:
-            with _backup_lock:
-                _backup_in_progress = False
-    
-    thread = threading.Thread(target=_backup_worker, daemon=True, name=f"CriticalBackup-{operation_name}")
-    thread.start()
+    user_info = f" (user {user_id})" if user_id else ""
+    backup_scheduler.mark_dirty(f"{operation_name}{user_info}")
     return True
 
-def restore_from_github(backup_name=None):
+def restore_from_cloud():
     """
-    Download and restore database from GitHub
+    Rebuild the database from the newest backup generation
     
     IMPORTANT: When deployed to Render or any service restart:
         pass
-    - This function ALWAYS downloads the NEWEST backup file
-    - Backups are sorted by filename (timestamp) in descending order
-    - The latest backup is automatically selected
-    - This ensures user data is preserved across service restarts
+    - The newest generation is chosen by the timestamp in the archive names
+    - Its full archive and deltas are streamed to disk and applied in order
+    - The result must match the archive checksum and pass PRAGMA quick_check
+      before it is renamed over the live database
+    - Older whole-DB backups (backup_<timestamp>.db) are still restored
+    - The restored chain becomes the base for the next delta, so a restart
+      does not force a full upload
     """
     try:
-        import base64
-        import urllib.request
-        import json
-        
-        token = os.getenv("GITHUB_TOKEN")
-        repo = os.getenv("GITHUB_BACKUP_REPO")
-        
-        if not token or not repo:
-            LOGGER(__name__).error("GITHUB_TOKEN or GITHUB_BACKUP_REPO not set")
+        engine = get_backup_engine()
+        if engine is None:
+            LOGGER(__name__).error("Cloud backup is not configured")
             return False
         
-        if not backup_name:
-            list_url = f"https://api.github.com/repos/{repo}/contents/backups"
-            headers = {
-                "Authorization": f"token {token}",
-                "Accept": "application/vnd.github.v3+json"
-            }
-            
-            req = urllib.request.Request(list_url, headers=headers)
-            
-            with urllib.request.urlopen(req) as response:
-                backups = json.loads(response.read().decode())
-            
-            if not backups:
-                LOGGER(__name__).warning("No backups found in GitHub")
-                return False
-            
-            # CRITICAL: Sort by name (contains timestamp) and get the NEWEST (first) backup
-            latest = sorted(backups, key=lambda x: x['name'], reverse=True)[0]
-            backup_name = latest['name']
-            download_url = latest['download_url']
-        else:
-            download_url = f"https://raw.githubusercontent.com/{repo}/main/backups/{backup_name}"
-        
-        req = urllib.request.Request(download_url)
-        
-        with urllib.request.urlopen(req) as response:
-            backup_content = response.read()
+        restored = engine.restore_to(RESTORE_TEMP_PATH, install=_restore_from_temp)
+        if not restored:
+            LOGGER(__name__).warning(f"No backup restored from {engine.backend.name}")
+            return False
         
-        temp_path = "temp_restore.db"
-        try:
-            with open(temp_path, "wb") as f:
-                f.write(backup_content)
-            
-            success = _restore_from_temp(temp_path)
-            
-            if success:
-                LOGGER(__name__).info(f"✅ Restored from GitHub: {backup_name}")
-            
-            return success
-        finally:
-            # Always clean up temp file, even on failure
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        LOGGER(__name__).info(f"✅ Restored from {engine.backend.name}: {restored}")
+        return True
     except Exception as e:
-        LOGGER(__name__).error(f"❌ GitHub restore failed: {e}")
+        LOGGER(__name__).error(f"❌ Cloud restore failed: {e}")
         return False
+    finally:
+        # Always clean up temp file, even on failure
+        if os.path.exists(RESTORE_TEMP_PATH):
+            os.remove(RESTORE_TEMP_PATH)
+
+# Backwards-compatible name
+restore_from_github = restore_from_cloud
 
 async def periodic_cloud_backup(interval_minutes=10):
-    """Run periodic GitHub backups in the background"""
+    """Run periodic cloud backups in the background"""
     import asyncio
     
-    backup_service = os.getenv("CLOUD_BACKUP_SERVICE", "").lower()
-    
-    if backup_service != "github":
+    backup_service = _backup_service()
+    if not backup_service:
         return
     
-    LOGGER(__name__).info(f"Starting periodic GitHub backups every {interval_minutes} minutes")
+    LOGGER(__name__).info(f"Starting periodic {backup_service} backups every {interval_minutes} minutes")
     
     while True:
         try:
             await asyncio.sleep(interval_minutes * 60)
-            backup_to_github()
+            # Safety net; goes through the scheduler so it never overlaps a triggered backup
+            backup_scheduler.mark_dirty("periodic")
         except Exception as e:
-            LOGGER(__name__).error(f"Error in periodic GitHub backup: {e}")
+            LOGGER(__name__).error(f"Error in periodic cloud backup: {e}")
             await asyncio.sleep(600)
 
 async def restore_latest_from_cloud():
-    """Restore latest backup from GitHub"""
+    """
+    Bring the database up to date with the cloud backup at startup
+    
+    Skips the download when the local database is intact and at least as new
+    as the newest backup. Otherwise restores, but waits at most
+    BACKUP_RESTORE_WAIT_SECONDS: a slower restore keeps running in the
+    background and swaps the database in when verified, so startup time
+    stays bounded.
+    """
+    global _hydration_task, _hydration_signature
+    import asyncio
+    
     # Import config to get cloud backup settings
     try:
         from config import PyroConf
@@ -339,11 +352,32 @@ async def restore_latest_from_cloud():
     except:
         backup_service = os.getenv("CLOUD_BACKUP_SERVICE", "").lower()
     
-    if not backup_service or backup_service != "github":
+    if backup_service not in BACKUP_SERVICES:
         return False
     
-    LOGGER(__name__).info("Attempting to restore from GitHub...")
-    return restore_from_github()
+    engine = get_backup_engine()
+    if engine is None:
+        return False
+    
+    try:
+        if await asyncio.to_thread(engine.local_is_current):
+            LOGGER(__name__).info("Local database is current - skipping restore")
+            return True
+    except Exception as e:
+        LOGGER(__name__).warning(f"Could not compare local database with {backup_service} backups: {e}")
+    
+    LOGGER(__name__).info(f"Attempting to restore from {backup_service}...")
+    _hydration_signature = _db_signature()
+    _hydration_task = asyncio.ensure_future(asyncio.to_thread(restore_from_cloud))
+    try:
+        return await asyncio.wait_for(asyncio.shield(_hydration_task), BACKUP_RESTORE_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        LOGGER(__name__).warning(
+            f"Restore still running after {BACKUP_RESTORE_WAIT_SECONDS:.0f}s - bot commands and /verify-ad "
+            f"answer 'restoring, try again' and broadcasts resume once it completes; any other write to the local database in the "
+            f"meantime will be discarded when the restored database replaces it"
+        )
+        return False
 
 if __name__ == "__main__":
     print("=" * 60)
@@ -352,7 +386,7 @@ if __name__ == "__main__":
     choice = input("\nEnter choice (1-2): ").strip()
     
     if choice == "1":
-        backup_to_github()
+        backup_to_cloud()
     elif choice == "2":
         import asyncio
         asyncio.run(restore_latest_from_cloud())
@@ -5,10 +5,28 @@
 import os
 import sqlite3
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterator
 from logger import LOGGER
 from cache import get_cache
 from threading import Lock
+from time import perf_counter
+from metrics import metrics
+
+_DB_OPERATION_SECONDS = metrics.histogram(
+    'db_operation_seconds', 'Time a DatabaseManager connection stays open (one operation)'
+)
+
+
+class _TimedConnection(sqlite3.Connection):
+    """Connection that reports its open-to-close time; every operation uses one connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._opened = perf_counter()
+
+    def close(self):
+        super().close()
+        _DB_OPERATION_SECONDS.observe(perf_counter() - self._opened)
 
 class DatabaseManager:
     def __init__(self, db_path: Optional[str] = None):
@@ -27,7 +45,7 @@ class DatabaseManager:
             raise
 
     def _get_connection(self):
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=_TimedConnection)
         conn.row_factory = sqlite3.Row
         return conn
 
@@ -51,7 +69,9 @@ class DatabaseManager:
                     session_string TEXT,
                     custom_thumbnail TEXT,
                     ad_downloads INTEGER DEFAULT 0,
-                    ad_downloads_reset_date TEXT
+                    ad_downloads_reset_date TEXT,
+                    is_blocked INTEGER DEFAULT 0,
+                    blocked_reason TEXT
                 )
             ''')
             
@@ -80,7 +100,12 @@ class DatabaseManager:
                     sent_by INTEGER NOT NULL,
                     sent_date TEXT NOT NULL,
                     total_users INTEGER NOT NULL,
-                    successful_sends INTEGER NOT NULL
+                    successful_sends INTEGER NOT NULL,
+                    status TEXT DEFAULT 'completed',
+                    payload TEXT,
+                    cursor_user_id INTEGER DEFAULT 0,
+                    failed_sends INTEGER DEFAULT 0,
+                    blocked_sends INTEGER DEFAULT 0
                 )
             ''')
             
@@ -112,16 +137,176 @@ class DatabaseManager:
                 )
             ''')
             
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS broadcast_recipients (
+                    broadcast_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (broadcast_id, user_id)
+                )
+            ''')
+            
+            # Columns added after the first release - existing databases get them via ALTER TABLE
+            self._add_missing_columns(cursor, 'users', {
+                'is_blocked': 'INTEGER DEFAULT 0',
+                'blocked_reason': 'TEXT'
+            })
+            self._add_missing_columns(cursor, 'broadcasts', {
+                'status': "TEXT DEFAULT 'completed'",
+                'payload': 'TEXT',
+                'cursor_user_id': 'INTEGER DEFAULT 0',
+                'failed_sends': 'INTEGER DEFAULT 0',
+                'blocked_sends': 'INTEGER DEFAULT 0'
+            })
+            
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_usage_user_date ON daily_usage(user_id, date)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts(status)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_ad_sessions_created ON ad_sessions(created_at)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_ad_verifications_created ON ad_verifications(created_at)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_legal_acceptance_date ON legal_acceptance(acceptance_date)')
             
+            # Covering indexes for the windowed stats (active users, paid users, new users)
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_last_activity ON users(last_activity)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_type_subscription ON users(user_type, subscription_end)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_joined_date ON users(joined_date)')
+            
+            self._init_stats_tables(cursor)
+            
             conn.commit()
             conn.close()
             
             LOGGER(__name__).info("Database tables and indexes created successfully")
 
+    def ensure_schema(self):
+        """Re-apply tables, indexes, triggers and column migrations (e.g. after a restore swapped the file)"""
+        self._init_database()
+        self.cache.clear()
+
+    def _init_stats_tables(self, cursor):
+        """
+        Summary tables for O(1) get_stats().
+        
+        stats_counters holds running totals maintained by triggers (total_users,
+        admin_count) plus the windowed counts (active_users, paid_users) written by
+        refresh_stats(). stats_daily holds per-day new users and downloads, also
+        trigger-maintained. stats_history keeps one snapshot per hour for graphs.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats_daily (
+                date TEXT PRIMARY KEY,
+                new_users INTEGER NOT NULL DEFAULT 0,
+                downloads INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats_history (
+                hour TEXT PRIMARY KEY,
+                total_users INTEGER NOT NULL,
+                active_users INTEGER NOT NULL,
+                paid_users INTEGER NOT NULL,
+                admin_count INTEGER NOT NULL,
+                today_downloads INTEGER NOT NULL,
+                today_new_users INTEGER NOT NULL
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_users_insert AFTER INSERT ON users BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'total_users';
+                INSERT INTO stats_daily (date, new_users, downloads) VALUES (substr(NEW.joined_date, 1, 10), 1, 0)
+                    ON CONFLICT(date) DO UPDATE SET new_users = new_users + 1;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_users_delete AFTER DELETE ON users BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'total_users';
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_admins_insert AFTER INSERT ON admins BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'admin_count';
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_admins_delete AFTER DELETE ON admins BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'admin_count';
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_usage_insert AFTER INSERT ON daily_usage BEGIN
+                INSERT INTO stats_daily (date, new_users, downloads) VALUES (NEW.date, 0, NEW.files_downloaded)
+                    ON CONFLICT(date) DO UPDATE SET downloads = downloads + NEW.files_downloaded;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_usage_update AFTER UPDATE OF files_downloaded ON daily_usage BEGIN
+                INSERT INTO stats_daily (date, new_users, downloads) VALUES (NEW.date, 0, NEW.files_downloaded - OLD.files_downloaded)
+                    ON CONFLICT(date) DO UPDATE SET downloads = downloads + NEW.files_downloaded - OLD.files_downloaded;
+            END
+        ''')
+        
+        # First run on an existing database: backfill the counters once
+        cursor.execute("SELECT 1 FROM stats_counters WHERE name = 'total_users'")
+        if cursor.fetchone() is None:
+            cursor.execute("INSERT INTO stats_counters (name, value) SELECT 'total_users', COUNT(*) FROM users")
+            cursor.execute("INSERT INTO stats_counters (name, value) SELECT 'admin_count', COUNT(*) FROM admins")
+            cursor.execute("INSERT OR IGNORE INTO stats_counters (name, value) VALUES ('active_users', 0), ('paid_users', 0), ('refreshed_at', 0)")
+            cursor.execute('''
+                INSERT OR REPLACE INTO stats_daily (date, new_users, downloads)
+                SELECT d, SUM(n), SUM(dl) FROM (
+                    SELECT substr(joined_date, 1, 10) AS d, COUNT(*) AS n, 0 AS dl FROM users GROUP BY d
+                    UNION ALL
+                    SELECT date AS d, 0 AS n, SUM(files_downloaded) AS dl FROM daily_usage GROUP BY date
+                ) GROUP BY d
+            ''')
+            LOGGER(__name__).info("Stats summary tables initialized from existing data")
+
+    def _add_missing_columns(self, cursor, table: str, columns: Dict[str, str]):
+        cursor.execute(f'PRAGMA table_info({table})')
+        existing = {row['name'] for row in cursor.fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+                LOGGER(__name__).info(f"Added column {table}.{name}")
+
+    # Rows per page for bulk reads - each page uses a short-lived connection,
+    # so long-running consumers never hold a cursor or the write lock
+    BULK_PAGE_SIZE = 500
+
+    def _iter_keyset_pages(self, select: str, key: str, where: str = '', params: tuple = (),
+                           after=0, page_size: Optional[int] = None) -> Iterator[List[Dict]]:
+        """
+        Keyset-paginated read: yields pages of rows ordered by `key`.
+        
+        Memory is bounded by page_size regardless of table size, and each page is
+        an index seek (`key > last`) instead of an OFFSET scan.
+        """
+        page_size = page_size or self.BULK_PAGE_SIZE
+        condition = f'{key} > ?' + (f' AND {where}' if where else '')
+        sql = f'{select} WHERE {condition} ORDER BY {key} LIMIT ?'
+        while True:
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(sql, (after, *params, page_size))
+                page = [dict(row) for row in cursor.fetchall()]
+            finally:
+                conn.close()
+            if not page:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            after = page[-1][key]
+
     def add_user(self, user_id: int, username: Optional[str] = None, first_name: Optional[str] = None,
                  last_name: Optional[str] = None, user_type: str = 'free') -> bool:
         try:
@@ -139,7 +324,8 @@ class DatabaseManager:
                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                     ''', (user_id, username, first_name, last_name, user_type, now, now, datetime.now().strftime('%Y-%m-%d')))
                 else:
-                    updates = ['last_activity = ?']
+                    # Any new interaction means the user can receive messages again
+                    updates = ['last_activity = ?', 'is_blocked = 0']
                     params = [now]
                     if username:
                         updates.append('username = ?')
@@ -246,7 +432,9 @@ class DatabaseManager:
             with self.lock:
                 conn = self._get_connection()
                 cursor = conn.cursor()
-                cursor.execute('INSERT OR REPLACE INTO admins (user_id, added_by, added_date) VALUES (?, ?, ?)',
+                # Upsert (not INSERT OR REPLACE) so the admin_count trigger only fires for new admins
+                cursor.execute('INSERT INTO admins (user_id, added_by, added_date) VALUES (?, ?, ?) '
+                               'ON CONFLICT(user_id) DO UPDATE SET added_by = excluded.added_by, added_date = excluded.added_date',
                                (user_id, added_by, datetime.now().isoformat()))
                 conn.commit()
                 conn.close()
@@ -436,30 +624,175 @@ class DatabaseManager:
 
         return True, ""
 
-    def get_all_users(self) -> List[int]:
+    def save_broadcast(self, message: str, sent_by: int, total_users: int, successful_sends: int) -> bool:
+        try:
+            with self.lock:
+                conn = self._get_connection()
+                cursor = conn.cursor()
+                cursor.execute('INSERT INTO broadcasts (message, sent_by, sent_date, total_users, successful_sends) VALUES (?, ?, ?, ?, ?)',
+                               (message, sent_by, datetime.now().isoformat(), total_users, successful_sends))
+                conn.commit()
+                conn.close()
+            return True
+        except Exception as e:
+            LOGGER(__name__).error(f"Error saving broadcast: {e}")
+            return False
+
+    def create_broadcast(self, message: str, sent_by: int, payload: str, total_users: int) -> Optional[int]:
+        """Create a resumable broadcast record. Returns the broadcast id."""
+        try:
+            with self.lock:
+                conn = self._get_connection()
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO broadcasts (message, sent_by, sent_date, total_users, successful_sends,
+                                            status, payload, cursor_user_id, failed_sends, blocked_sends)
+                    VALUES (?, ?, ?, ?, 0, 'running', ?, 0, 0, 0)
+                ''', (message, sent_by, datetime.now().isoformat(), total_users, payload))
+                broadcast_id = cursor.lastrowid
+                conn.commit()
+                conn.close()
+            return broadcast_id
+        except Exception as e:
+            LOGGER(__name__).error(f"Error creating broadcast: {e}")
+            return None
+
+    def get_broadcast(self, broadcast_id: int) -> Optional[Dict]:
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM broadcasts WHERE id = ?', (broadcast_id,))
+            row = cursor.fetchone()
+            conn.close()
+            return dict(row) if row else None
+        except Exception as e:
+            LOGGER(__name__).error(f"Error getting broadcast {broadcast_id}: {e}")
+            return None
+
+    def get_unfinished_broadcasts(self) -> List[int]:
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
-            cursor.execute('SELECT user_id FROM users WHERE is_banned = 0')
-            users = [row['user_id'] for row in cursor.fetchall()]
+            cursor.execute("SELECT id FROM broadcasts WHERE status = 'running' ORDER BY id")
+            ids = [row['id'] for row in cursor.fetchall()]
             conn.close()
-            return users
+            return ids
         except Exception as e:
-            LOGGER(__name__).error(f"Error getting all users: {e}")
+            LOGGER(__name__).error(f"Error getting unfinished broadcasts: {e}")
             return []
 
-    def save_broadcast(self, message: str, sent_by: int, total_users: int, successful_sends: int) -> bool:
+    def count_broadcast_recipients(self) -> int:
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) as count FROM users WHERE is_banned = 0 AND is_blocked = 0')
+            count = cursor.fetchone()['count']
+            conn.close()
+            return count
+        except Exception as e:
+            LOGGER(__name__).error(f"Error counting broadcast recipients: {e}")
+            return 0
+
+    def iter_broadcast_recipient_pages(self, after_user_id: int = 0,
+                                       page_size: Optional[int] = None) -> Iterator[List[int]]:
+        """Pages of reachable (not banned, not blocked) user ids after `after_user_id`"""
+        try:
+            for page in self._iter_keyset_pages('SELECT user_id FROM users', 'user_id',
+                                                'is_banned = 0 AND is_blocked = 0',
+                                                after=after_user_id, page_size=page_size):
+                yield [row['user_id'] for row in page]
+        except Exception as e:
+            LOGGER(__name__).error(f"Error iterating broadcast recipients: {e}")
+
+    def get_unreachable_user_ids(self, user_ids: List[int]) -> set:
+        """Users in `user_ids` that broadcasts skip (banned, or blocked the bot)"""
+        if not user_ids:
+            return set()
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            placeholders = ','.join('?' * len(user_ids))
+            cursor.execute(
+                f'SELECT user_id FROM users WHERE (is_banned = 1 OR is_blocked = 1) AND user_id IN ({placeholders})',
+                tuple(user_ids)
+            )
+            unreachable = {row['user_id'] for row in cursor.fetchall()}
+            conn.close()
+            return unreachable
+        except Exception as e:
+            LOGGER(__name__).error(f"Error checking broadcast recipients: {e}")
+            return set()
+
+    def get_broadcast_done_ids(self, broadcast_id: int, user_ids: List[int]) -> set:
+        """
+        Recipients in `user_ids` that already have a final status for this broadcast.
+        
+        DB errors propagate: an empty answer would re-send the whole page.
+        """
+        if not user_ids:
+            return set()
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            placeholders = ','.join('?' * len(user_ids))
+            cursor.execute(
+                f'SELECT user_id FROM broadcast_recipients WHERE broadcast_id = ? AND user_id IN ({placeholders})',
+                (broadcast_id, *user_ids)
+            )
+            return {row['user_id'] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    def record_broadcast_page(self, broadcast_id: int, results: List[tuple], cursor_user_id: int,
+                              sent: int, failed: int, blocked: int):
+        """
+        Persist one page of broadcast results in a single transaction.
+        
+        DB errors propagate so the broadcast engine marks the broadcast failed
+        instead of carrying on with an unsaved cursor.
+        
+        Args:
+            results: (user_id, status, error) tuples
+            cursor_user_id: Highest user id fully processed (resume point)
+            sent/failed/blocked: Running totals for the broadcast
+        """
+        now = datetime.now().isoformat()
+        blocked_users = [(status, user_id) for user_id, status, _ in results if status in ('blocked', 'deactivated')]
+        with self.lock:
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.executemany(
+                    'INSERT OR REPLACE INTO broadcast_recipients (broadcast_id, user_id, status, error, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    [(broadcast_id, user_id, status, error, now) for user_id, status, error in results]
+                )
+                if blocked_users:
+                    cursor.executemany('UPDATE users SET is_blocked = 1, blocked_reason = ? WHERE user_id = ?', blocked_users)
+                cursor.execute(
+                    'UPDATE broadcasts SET cursor_user_id = ?, successful_sends = ?, failed_sends = ?, blocked_sends = ? '
+                    'WHERE id = ?',
+                    (cursor_user_id, sent, failed, blocked, broadcast_id)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        for _, user_id in blocked_users:
+            self.cache.delete(f"user_{user_id}")
+
+    def finish_broadcast(self, broadcast_id: int, status: str = 'completed') -> bool:
         try:
             with self.lock:
                 conn = self._get_connection()
                 cursor = conn.cursor()
-                cursor.execute('INSERT INTO broadcasts (message, sent_by, sent_date, total_users, successful_sends) VALUES (?, ?, ?, ?, ?)',
-                               (message, sent_by, datetime.now().isoformat(), total_users, successful_sends))
+                cursor.execute('UPDATE broadcasts SET status = ? WHERE id = ?', (status, broadcast_id))
+                # Per-recipient rows are only needed to resume; keep the summary row
+                cursor.execute('DELETE FROM broadcast_recipients WHERE broadcast_id = ?', (broadcast_id,))
                 conn.commit()
                 conn.close()
             return True
         except Exception as e:
-            LOGGER(__name__).error(f"Error saving broadcast: {e}")
+            LOGGER(__name__).error(f"Error finishing broadcast {broadcast_id}: {e}")
             return False
 
     def ban_user(self, user_id: int) -> bool:
@@ -538,47 +871,97 @@ class DatabaseManager:
         user = self.get_user(user_id)
         return user.get('session_string') if user else None
 
+    # Windowed counts (active in 7 days, paid) are refreshed at most this often
+    STATS_REFRESH_SECONDS = 3600
+
+    def refresh_stats(self) -> bool:
+        """
+        Recompute the windowed counters via their covering indexes and store an
+        hourly snapshot in stats_history. Runs hourly from the bot, or lazily from
+        get_stats() when the counters are stale.
+        """
+        try:
+            week_ago = (datetime.now() - timedelta(days=7)).isoformat()
+            today = datetime.now().strftime('%Y-%m-%d')
+            hour = datetime.now().strftime('%Y-%m-%d %H:00')
+            with self.lock:
+                conn = self._get_connection()
+                cursor = conn.cursor()
+                cursor.execute('SELECT COUNT(*) as count FROM users WHERE last_activity > ?', (week_ago,))
+                active_users = cursor.fetchone()['count']
+                cursor.execute('SELECT COUNT(*) as count FROM users WHERE user_type = ? AND subscription_end > ?', ('paid', today))
+                paid_users = cursor.fetchone()['count']
+                cursor.executemany(
+                    'INSERT OR REPLACE INTO stats_counters (name, value) VALUES (?, ?)',
+                    [('active_users', active_users), ('paid_users', paid_users),
+                     ('refreshed_at', int(datetime.now().timestamp()))]
+                )
+                stats = self._read_stats(cursor, today)
+                cursor.execute('''
+                    INSERT OR REPLACE INTO stats_history
+                        (hour, total_users, active_users, paid_users, admin_count, today_downloads, today_new_users)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (hour, stats['total_users'], stats['active_users'], stats['paid_users'],
+                      stats['admin_count'], stats['today_downloads'], stats['today_new_users']))
+                # Keep 90 days of hourly history
+                cutoff = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d %H:00')
+                cursor.execute('DELETE FROM stats_history WHERE hour < ?', (cutoff,))
+                conn.commit()
+                conn.close()
+            return True
+        except Exception as e:
+            LOGGER(__name__).error(f"Error refreshing stats: {e}")
+            return False
+
+    def _read_stats(self, cursor, today: str) -> Dict:
+        cursor.execute('SELECT name, value FROM stats_counters')
+        counters = {row['name']: row['value'] for row in cursor.fetchall()}
+        cursor.execute('SELECT new_users, downloads FROM stats_daily WHERE date = ?', (today,))
+        daily = cursor.fetchone()
+        return {
+            'total_users': counters.get('total_users', 0),
+            'active_users': counters.get('active_users', 0),
+            'paid_users': counters.get('paid_users', 0),
+            'admin_count': counters.get('admin_count', 0),
+            'today_downloads': daily['downloads'] if daily else 0,
+            'today_new_users': daily['new_users'] if daily else 0,
+            'refreshed_at': counters.get('refreshed_at', 0)
+        }
+
     def get_stats(self) -> Dict:
+        """O(1) stats from the summary tables (no full-table scans)"""
         try:
+            today = datetime.now().strftime('%Y-%m-%d')
             conn = self._get_connection()
             cursor = conn.cursor()
-            
-            cursor.execute('SELECT COUNT(*) as count FROM users')
-            total_users = cursor.fetchone()['count']
-            
-            week_ago = (datetime.now() - timedelta(days=7)).isoformat()
-            cursor.execute('SELECT COUNT(*) as count FROM users WHERE last_activity > ?', (week_ago,))
-            active_users = cursor.fetchone()['count']
-            
-            now = datetime.now().strftime('%Y-%m-%d')
-            cursor.execute('SELECT COUNT(*) as count FROM users WHERE user_type = ? AND subscription_end > ?', ('paid', now))
-            paid_users = cursor.fetchone()['count']
-            
-            cursor.execute('SELECT COUNT(*) as count FROM admins')
-            admin_count = cursor.fetchone()['count']
-            
-            today = datetime.now().strftime('%Y-%m-%d')
-            cursor.execute('SELECT SUM(files_downloaded) as total FROM daily_usage WHERE date = ?', (today,))
-            result = cursor.fetchone()
-            today_downloads = result['total'] if result['total'] else 0
-            
-            today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-            cursor.execute('SELECT COUNT(*) as count FROM users WHERE joined_date >= ?', (today_start,))
-            today_new_users = cursor.fetchone()['count']
-            
+            stats = self._read_stats(cursor, today)
             conn.close()
             
-            return {
-                'total_users': total_users,
-                'active_users': active_users,
-                'paid_users': paid_users,
-                'admin_count': admin_count,
-                'today_downloads': today_downloads,
-                'today_new_users': today_new_users
-            }
+            if datetime.now().timestamp() - stats['refreshed_at'] > self.STATS_REFRESH_SECONDS:
+                if self.refresh_stats():
+                    conn = self._get_connection()
+                    stats = self._read_stats(conn.cursor(), today)
+                    conn.close()
+            
+            stats.pop('refreshed_at', None)
+            return stats
         except Exception as e:
             LOGGER(__name__).error(f"Error getting stats: {e}")
             return {}
+
+    def get_stats_history(self, hours: int = 24) -> List[Dict]:
+        """Hourly stats snapshots, oldest first (for graphs)"""
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM stats_history ORDER BY hour DESC LIMIT ?', (hours,))
+            rows = [dict(row) for row in cursor.fetchall()]
+            conn.close()
+            rows.reverse()
+            return rows
+        except Exception as e:
+            LOGGER(__name__).error(f"Error getting stats history: {e}")
+            return []
     
     def set_custom_thumbnail(self, user_id: int, file_id: str) -> bool:
         try:
@@ -755,36 +1138,44 @@ class DatabaseManager:
             LOGGER(__name__).error(f"Error deleting verification code: {e}")
             return False
 
+    def iter_expired_ad_sessions(self, cutoff_time: str, page_size: Optional[int] = None) -> Iterator[List[Dict]]:
+        """Pages of ad sessions created before `cutoff_time` (keyset on rowid)"""
+        return self._iter_keyset_pages(
+            'SELECT rowid, session_id, user_id FROM ad_sessions', 'rowid',
+            'created_at < ?', (cutoff_time,), page_size=page_size
+        )
+
     def cleanup_expired_sessions(self) -> Dict[str, int]:
         """Clean up expired ad sessions and verification codes (older than 60 minutes).
         Also invalidates any cached session data.
+        Expired sessions are deleted page by page so memory stays flat.
         Returns counts of deleted items."""
         try:
             cutoff_time = (datetime.now() - timedelta(minutes=60)).isoformat()
+            deleted_sessions = 0
+            
+            for page in self.iter_expired_ad_sessions(cutoff_time):
+                with self.lock:
+                    conn = self._get_connection()
+                    cursor = conn.cursor()
+                    cursor.executemany('DELETE FROM ad_sessions WHERE rowid = ?', [(row['rowid'],) for row in page])
+                    deleted_sessions += cursor.rowcount
+                    conn.commit()
+                    conn.close()
+                
+                # Clear cache entries for affected users
+                for user_id in {row['user_id'] for row in page}:
+                    self.cache.delete(f"user_{user_id}")
+            
             with self.lock:
                 conn = self._get_connection()
                 cursor = conn.cursor()
-                
-                # Get session IDs before deleting to clear cache
-                cursor.execute('SELECT session_id, user_id FROM ad_sessions WHERE created_at < ?', (cutoff_time,))
-                expired_sessions = cursor.fetchall()
-                
-                # Delete expired ad sessions
-                cursor.execute('DELETE FROM ad_sessions WHERE created_at < ?', (cutoff_time,))
-                deleted_sessions = cursor.rowcount
-                
                 # Delete expired verification codes
                 cursor.execute('DELETE FROM ad_verifications WHERE created_at < ?', (cutoff_time,))
                 deleted_verifications = cursor.rowcount
-                
                 conn.commit()
                 conn.close()
             
-            # Clear cache entries for affected users
-            for session in expired_sessions:
-                user_id = session['user_id']
-                self.cache.delete(f"user_{user_id}")
-            
             if deleted_sessions > 0 or deleted_verifications > 0:
                 LOGGER(__name__).info(
                     f"Cleaned up {deleted_sessions} expired ad sessions and "
@@ -839,25 +1230,18 @@ class DatabaseManager:
             LOGGER(__name__).error(f"Error getting free downloads remaining for {user_id}: {e}")
             return {'ad_downloads': 0, 'daily_remaining': 0, 'total': 0}
 
-    def get_premium_users(self) -> List[Dict]:
-        """Get list of all active premium users"""
+    def iter_premium_users(self, page_size: Optional[int] = None) -> Iterator[Dict]:
+        """Stream active premium users in user_id order (constant memory)"""
+        now = datetime.now().strftime('%Y-%m-%d')
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            now = datetime.now().strftime('%Y-%m-%d')
-            cursor.execute('''
-                SELECT user_id, username, subscription_end as premium_expiry 
-                FROM users 
-                WHERE user_type = ? AND subscription_end > ?
-                ORDER BY subscription_end DESC
-            ''', ('paid', now))
-            users = [dict(row) for row in cursor.fetchall()]
-            conn.close()
-            return users
+            for page in self._iter_keyset_pages(
+                'SELECT user_id, username, subscription_end as premium_expiry FROM users',
+                'user_id', 'user_type = ? AND subscription_end > ?', ('paid', now), page_size=page_size
+            ):
+                yield from page
         except Exception as e:
-            LOGGER(__name__).error(f"Error getting premium users: {e}")
-            return []
-    
+            LOGGER(__name__).error(f"Error iterating premium users: {e}")
+
     def get_ad_sessions_count(self) -> int:
         """Get count of active ad sessions (for memory monitoring)"""
         try:
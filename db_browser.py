@@ -0,0 +1,221 @@
+"""
+Bounded-memory database browsing for the admin web server.
+
+Tables are paged with keyset pagination on rowid, ad-hoc SELECT results are
+capped at DB_BROWSER_MAX_ROWS per response with an opaque continuation token,
+and results are streamed to the client as JSON or CSV while the cursor is
+being read, so no response ever holds a whole table in memory.
+"""
+
+import os
+import io
+import csv
+import json
+import base64
+import sqlite3
+from typing import Iterator, List, Optional
+from logger import LOGGER
+
+DB_BROWSER_PAGE_SIZE = int(os.getenv("DB_BROWSER_PAGE_SIZE", "100"))
+DB_BROWSER_MAX_ROWS = int(os.getenv("DB_BROWSER_MAX_ROWS", "1000"))
+
+# Rows fetched from the cursor (and written to the socket) per batch
+FETCH_BATCH_SIZE = 200
+
+
+def get_db_path() -> str:
+    from database_sqlite import db
+    return db.db_path
+
+
+def connect(readonly: bool = True) -> sqlite3.Connection:
+    path = get_db_path()
+    if readonly:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    return sqlite3.connect(path, check_same_thread=False)
+
+
+def encode_token(data: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_token(token: Optional[str]) -> dict:
+    """Decode a continuation token (raises ValueError if it was tampered with)"""
+    if not token:
+        return {}
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid continuation token")
+    if not isinstance(data, dict):
+        raise ValueError("Invalid continuation token")
+    return data
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def list_tables(conn: sqlite3.Connection) -> List[str]:
+    return [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")]
+
+
+def clamp_limit(limit: Optional[int], default: int = DB_BROWSER_PAGE_SIZE) -> int:
+    if not limit or limit <= 0:
+        return default
+    return min(limit, DB_BROWSER_MAX_ROWS)
+
+
+class ResultStream:
+    """
+    Lazily iterates at most `limit` rows of an executed cursor (limit=None means
+    unbounded, for CSV exports). After iteration, row_count, truncated and
+    next_token describe the page.
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor, limit: Optional[int], token_for, skip_first_column: bool = False):
+        self.cursor = cursor
+        self.limit = limit
+        self._token_for = token_for
+        self._skip = 1 if skip_first_column else 0
+        description = cursor.description or []
+        self.columns = [d[0] for d in description[self._skip:]]
+        self.row_count = 0
+        self.truncated = False
+        self.next_token: Optional[str] = None
+
+    def __iter__(self) -> Iterator[tuple]:
+        last_row = None
+        while True:
+            batch = self.cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not batch:
+                return
+            for row in batch:
+                if self.limit is not None and self.row_count >= self.limit:
+                    # The query fetched one row past the limit: there is more
+                    self.truncated = True
+                    self.next_token = self._token_for(last_row, self.row_count)
+                    return
+                self.row_count += 1
+                last_row = row
+                yield row[self._skip:] if self._skip else row
+
+
+def browse_table(conn: sqlite3.Connection, table: str, token: Optional[str] = None,
+                 limit: Optional[int] = None) -> ResultStream:
+    """Keyset-paginated table rows (rowid > cursor), falling back to OFFSET for WITHOUT ROWID tables"""
+    if table not in list_tables(conn):
+        raise ValueError(f"Unknown table: {table}")
+    state = decode_token(token)
+    fetch_limit = -1 if limit is None else limit + 1
+    quoted = quote_identifier(table)
+
+    try:
+        cursor = conn.execute(
+            f"SELECT rowid, * FROM {quoted} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (int(state.get('rowid', 0)), fetch_limit)
+        )
+        return ResultStream(cursor, limit, lambda row, n: encode_token({'rowid': row[0]}), skip_first_column=True)
+    except sqlite3.OperationalError:
+        offset = int(state.get('offset', 0))
+        cursor = conn.execute(f"SELECT * FROM {quoted} LIMIT ? OFFSET ?", (fetch_limit, offset))
+        return ResultStream(cursor, limit, lambda row, n: encode_token({'offset': offset + n}))
+
+
+def is_read_query(query: str) -> bool:
+    first = query.lstrip().split(None, 1)[0].upper() if query.strip() else ''
+    return first in ('SELECT', 'WITH', 'VALUES')
+
+
+def run_query(conn: sqlite3.Connection, query: str, token: Optional[str] = None,
+              limit: Optional[int] = None) -> ResultStream:
+    """
+    Run a read query with an OFFSET continuation token. The statement is
+    wrapped so SQLite itself stops after limit+1 rows.
+    """
+    query = query.strip().rstrip(';').strip()
+    if not is_read_query(query):
+        raise ValueError("Only SELECT/WITH queries can be paginated")
+    offset = int(decode_token(token).get('offset', 0))
+    fetch_limit = -1 if limit is None else limit + 1
+    cursor = conn.execute(f"SELECT * FROM ({query}) LIMIT ? OFFSET ?", (fetch_limit, offset))
+    return ResultStream(cursor, limit, lambda row, n: encode_token({'offset': offset + n}))
+
+
+def _json_default(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    return str(value)
+
+
+def stream_json(result: ResultStream, conn: Optional[sqlite3.Connection] = None) -> Iterator[bytes]:
+    """
+    JSON body {"columns", "rows", "row_count", "truncated", "next", "success"} written batch by batch.
+
+    "success" comes last: a failure mid-stream closes the rows array and ends
+    with "success": false and "error", so the body stays valid JSON after the
+    200 status has gone out.
+    """
+    started = False
+    written = 0
+    parts = []
+    try:
+        yield b'{"columns": ' + json.dumps(result.columns).encode() + b', "rows": ['
+        started = True
+        for row in result:
+            parts.append(json.dumps(list(row), default=_json_default))
+            if len(parts) >= FETCH_BATCH_SIZE:
+                chunk = (',' if written else '') + ','.join(parts)
+                written += len(parts)
+                parts = []
+                yield chunk.encode()
+        if parts:
+            chunk = (',' if written else '') + ','.join(parts)
+            written += len(parts)
+            parts = []
+            yield chunk.encode()
+        yield (
+            f'], "row_count": {result.row_count}, "truncated": {json.dumps(result.truncated)}, '
+            f'"next": {json.dumps(result.next_token)}, "success": true}}'
+        ).encode()
+    except Exception as e:
+        LOGGER(__name__).error(f"Error streaming query results: {e}")
+        error = json.dumps(str(e))
+        if not started:
+            yield f'{{"success": false, "error": {error}}}'.encode()
+        else:
+            chunk = ((',' if written and parts else '') + ','.join(parts))
+            yield (
+                f'{chunk}], "row_count": {written + len(parts)}, "truncated": true, "next": null, '
+                f'"success": false, "error": {error}}}'
+            ).encode()
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def stream_csv(result: ResultStream, conn: Optional[sqlite3.Connection] = None) -> Iterator[bytes]:
+    """
+    CSV body (header row first) written batch by batch. A failure mid-stream
+    ends the file with an "#ERROR" row, so a partial export is recognisable.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    try:
+        writer.writerow(result.columns)
+        for row in result:
+            writer.writerow(['' if v is None else _json_default(v) if isinstance(v, (bytes, bytearray, memoryview)) else v for v in row])
+            if result.row_count % FETCH_BATCH_SIZE == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+    except Exception as e:
+        LOGGER(__name__).error(f"Error streaming CSV export: {e}")
+        writer.writerow(['#ERROR', f"export incomplete after {result.row_count} rows: {e}"])
+        yield buffer.getvalue().encode('utf-8')
+    finally:
+        if conn is not None:
+            conn.close()
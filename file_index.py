@@ -0,0 +1,244 @@
+"""
+Incremental file index for the /files admin dashboard.
+
+Directory listings are cached and only re-read when a directory's mtime
+changes (files added, removed or renamed); a full re-stat runs at most once
+a minute to pick up in-place growth of logs and the database. Sorted and
+filtered views are cached per index version, and the entries on the page
+being served are re-stat'ed, so a page load costs O(page size) instead of a
+full os.walk + stat + sort of the working tree.
+"""
+
+import os
+import threading
+from time import time
+from datetime import datetime
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from logger import LOGGER
+
+FILE_INDEX_REFRESH_SECONDS = float(os.getenv("FILE_INDEX_REFRESH_SECONDS", "5"))
+FILE_INDEX_FULL_RESCAN_SECONDS = float(os.getenv("FILE_INDEX_FULL_RESCAN_SECONDS", "60"))
+FILE_INDEX_MAX_PER_PAGE = 500
+
+EXCLUDED_DIRS = {'__pycache__', 'node_modules', '.git'}
+EDITABLE_EXTENSIONS = ('.py', '.txt', '.md', '.json', '.xml', '.yaml', '.yml', '.toml', '.ini', '.cfg', '.conf', '.html', '.css', '.js')
+
+SORT_KEYS = {
+    'name': lambda item: item[0].lower(),
+    'size': lambda item: item[1][0],
+    'modified': lambda item: item[1][1],
+}
+
+# Sorted/filtered views kept per index version
+VIEW_CACHE_SIZE = 8
+
+
+def format_size(size: int) -> str:
+    if size < 1024:
+        return f"{size} B"
+    elif size < 1024 * 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+class FileIndex:
+    def __init__(self, base_dir: Optional[str] = None):
+        self.base_dir = base_dir or os.getcwd()
+        # rel_dir -> (dir mtime_ns, {file name: (size, mtime)}, [subdir names])
+        self._dirs: Dict[str, Tuple[int, Dict[str, Tuple[int, float]], List[str]]] = {}
+        # rel_path -> (size, mtime) for every indexed file
+        self._entries: Dict[str, Tuple[int, float]] = {}
+        self.version = 0
+        self.total_size = 0
+        self._views: "OrderedDict[tuple, List[Tuple[str, Tuple[int, float]]]]" = OrderedDict()
+        self._last_refresh = 0.0
+        self._last_full_scan = 0.0
+        self._lock = threading.Lock()
+        self.scans = 0
+        self.dirs_rescanned = 0
+
+    # ---- indexing ------------------------------------------------------
+
+    def _drop_dir(self, rel_dir: str):
+        cached = self._dirs.pop(rel_dir, None)
+        if not cached:
+            return
+        _, files, subdirs = cached
+        for name in files:
+            self._entries.pop(os.path.join(rel_dir, name) if rel_dir else name, None)
+        for sub in subdirs:
+            self._drop_dir(os.path.join(rel_dir, sub) if rel_dir else sub)
+
+    def _scan_dir(self, rel_dir: str, full: bool, seen: set) -> bool:
+        """Refresh one directory (and its children). Returns True if anything changed."""
+        abs_dir = os.path.join(self.base_dir, rel_dir) if rel_dir else self.base_dir
+        try:
+            dir_mtime = os.stat(abs_dir).st_mtime_ns
+        except OSError:
+            return False
+        seen.add(rel_dir)
+
+        cached = self._dirs.get(rel_dir)
+        changed = False
+        if cached and cached[0] == dir_mtime and not full:
+            subdirs = cached[2]
+        else:
+            files: Dict[str, Tuple[int, float]] = {}
+            subdirs = []
+            try:
+                with os.scandir(abs_dir) as it:
+                    for entry in it:
+                        if entry.name.startswith('.'):
+                            continue
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if entry.name not in EXCLUDED_DIRS:
+                                    subdirs.append(entry.name)
+                            elif entry.is_file():
+                                st = entry.stat()
+                                files[entry.name] = (st.st_size, st.st_mtime)
+                        except OSError:
+                            continue
+            except OSError:
+                return False
+
+            old_files = cached[1] if cached else {}
+            if files != old_files:
+                changed = True
+                for name in old_files.keys() - files.keys():
+                    self._entries.pop(os.path.join(rel_dir, name) if rel_dir else name, None)
+                for name, value in files.items():
+                    self._entries[os.path.join(rel_dir, name) if rel_dir else name] = value
+            self._dirs[rel_dir] = (dir_mtime, files, subdirs)
+            self.dirs_rescanned += 1
+
+        for sub in subdirs:
+            if self._scan_dir(os.path.join(rel_dir, sub) if rel_dir else sub, full, seen):
+                changed = True
+        return changed
+
+    def refresh(self, force: bool = False):
+        """Bring the index up to date (cheap when nothing changed)"""
+        now = time()
+        if not force and now - self._last_refresh < FILE_INDEX_REFRESH_SECONDS:
+            return
+        full = force or now - self._last_full_scan >= FILE_INDEX_FULL_RESCAN_SECONDS
+        seen = set()
+        changed = self._scan_dir('', full, seen)
+        for rel_dir in [d for d in self._dirs if d not in seen]:
+            self._drop_dir(rel_dir)
+            changed = True
+        if changed:
+            self._bump()
+        self._last_refresh = now
+        if full:
+            self._last_full_scan = now
+        self.scans += 1
+
+    def _bump(self):
+        self.version += 1
+        self.total_size = sum(size for size, _ in self._entries.values())
+        self._views.clear()
+
+    def invalidate(self):
+        """Force a full rescan on the next request (e.g. after a file was saved)"""
+        self._last_refresh = 0.0
+        self._last_full_scan = 0.0
+
+    # ---- queries -------------------------------------------------------
+
+    def _view(self, sort: str, descending: bool, query: str, ext: str):
+        key = (sort, descending, query, ext)
+        view = self._views.get(key)
+        if view is not None:
+            self._views.move_to_end(key)
+            return view
+
+        items = self._entries.items()
+        if query:
+            items = [item for item in items if query in item[0].lower()]
+        if ext:
+            items = [item for item in items if item[0].lower().endswith(ext)]
+        view = sorted(items, key=SORT_KEYS[sort], reverse=descending)
+        self._views[key] = view
+        if len(self._views) > VIEW_CACHE_SIZE:
+            self._views.popitem(last=False)
+        return view
+
+    def query(self, page: int = 1, per_page: int = 50, sort: str = 'size', order: str = 'desc',
+              query: str = '', ext: str = '') -> Dict:
+        """One page of the index, sorted and filtered, as a JSON-ready dict"""
+        if sort not in SORT_KEYS:
+            sort = 'size'
+        descending = order != 'asc'
+        per_page = max(1, min(per_page, FILE_INDEX_MAX_PER_PAGE))
+        query = (query or '').strip().lower()
+        ext = (ext or '').strip().lower()
+        if ext and not ext.startswith('.'):
+            ext = '.' + ext
+
+        with self._lock:
+            try:
+                self.refresh()
+            except Exception as e:
+                LOGGER(__name__).error(f"File index refresh failed: {e}")
+
+            view = self._view(sort, descending, query, ext)
+            total = len(view)
+            pages = max(1, (total + per_page - 1) // per_page)
+            page = max(1, min(page, pages))
+            start = (page - 1) * per_page
+
+            files = []
+            stale = False
+            for rel_path, (size, mtime) in view[start:start + per_page]:
+                # Re-stat only what is shown so sizes of growing files are exact
+                try:
+                    st = os.stat(os.path.join(self.base_dir, rel_path))
+                    if (st.st_size, st.st_mtime) != (size, mtime):
+                        size, mtime = st.st_size, st.st_mtime
+                        self._entries[rel_path] = (size, mtime)
+                        stale = True
+                except OSError:
+                    continue
+                files.append({
+                    'name': rel_path,
+                    'size': format_size(size),
+                    'size_bytes': size,
+                    'modified': datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S'),
+                    'editable': rel_path.endswith(EDITABLE_EXTENSIONS),
+                })
+            if stale:
+                # Keep this page stable; the next request re-sorts with fresh values
+                self._bump()
+
+            return {
+                'files': files,
+                'page': page,
+                'pages': pages,
+                'per_page': per_page,
+                'total': total,
+                'total_files': len(self._entries),
+                'total_size': self.total_size,
+                'sort': sort,
+                'order': 'desc' if descending else 'asc',
+                'version': self.version,
+            }
+
+    def get_summary(self) -> Dict:
+        with self._lock:
+            try:
+                self.refresh()
+            except Exception as e:
+                LOGGER(__name__).error(f"File index refresh failed: {e}")
+            return {
+                'total_files': len(self._entries),
+                'total_size': self.total_size,
+                'scans': self.scans,
+                'dirs_rescanned': self.dirs_rescanned,
+            }
+
+
+# Global file index instance (rooted at the bot's working directory)
+file_index = FileIndex()
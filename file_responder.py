@@ -0,0 +1,168 @@
+"""
+Constant-memory file responses for the WSGI admin server.
+
+serve_file() streams a file with wsgi.file_wrapper (waitress sends it with
+sendfile-style buffered reads) or a chunked generator, and supports single
+HTTP Range requests plus ETag/Last-Modified conditional GETs, so a 200MB
+database or log download never has to be read into memory and can resume.
+"""
+
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Iterable, List, Optional, Tuple
+
+STREAM_CHUNK_SIZE = 256 * 1024
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def file_etag(st: os.stat_result) -> str:
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def _not_modified(environ, etag: str, mtime: int) -> bool:
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+    if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since:
+        try:
+            return mtime <= int(parsedate_to_datetime(if_modified_since).timestamp())
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return False
+    return False
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range "bytes=" header into (start, end) inclusive.
+
+    Returns None when there is no usable Range (serve the whole file) and
+    raises ValueError when the range can't be satisfied (416).
+    Multi-range requests are answered with the full file, which RFC 9110 allows.
+    """
+    if not header:
+        return None
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def _range_applies(environ, etag: str, last_modified: str) -> bool:
+    """If-Range: only honour Range when the client's copy is still current"""
+    if_range = environ.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return if_range == last_modified
+
+
+def _iter_file(f, start: int, length: int, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterable[bytes]:
+    try:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def serve_file(environ, start_response, filepath: str, download_name: Optional[str] = None,
+               content_type: str = 'application/octet-stream',
+               extra_headers: Optional[List[Tuple[str, str]]] = None) -> Iterable[bytes]:
+    """
+    Stream a file as a WSGI response (200, 206, 304 or 416).
+
+    Memory use is one chunk regardless of file size. HEAD requests get the
+    headers only. The file is opened before start_response, so a missing or
+    unreadable file raises to the caller while it can still send an error.
+    extra_headers replace default headers of the same name.
+    """
+    f = open(filepath, 'rb')
+    try:
+        st = os.fstat(f.fileno())
+    except BaseException:
+        f.close()
+        raise
+    size = st.st_size
+    mtime = int(st.st_mtime)
+    etag = file_etag(st)
+    last_modified = formatdate(mtime, usegmt=True)
+
+    headers = [
+        ('Accept-Ranges', 'bytes'),
+        ('ETag', etag),
+        ('Last-Modified', last_modified),
+        # Always revalidate, but allow the 304 round-trip
+        ('Cache-Control', 'private, no-cache'),
+    ]
+    if download_name:
+        safe_name = download_name.replace('"', '').replace('\r', '').replace('\n', '')
+        headers.append(('Content-Disposition', f'attachment; filename="{safe_name}"'))
+    if extra_headers:
+        overridden = {name.lower() for name, _ in extra_headers}
+        headers = [header for header in headers if header[0].lower() not in overridden] + list(extra_headers)
+
+    if _not_modified(environ, etag, mtime):
+        f.close()
+        start_response('304 Not Modified', headers)
+        return [b'']
+
+    byte_range = None
+    if _range_applies(environ, etag, last_modified):
+        try:
+            byte_range = parse_range(environ.get('HTTP_RANGE'), size)
+        except ValueError:
+            f.close()
+            start_response('416 Range Not Satisfiable', headers + [
+                ('Content-Range', f'bytes */{size}'),
+                ('Content-Length', '0'),
+            ])
+            return [b'']
+
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        status = '206 Partial Content'
+        headers += [('Content-Range', f'bytes {start}-{end}/{size}')]
+    else:
+        start, length = 0, size
+        status = '200 OK'
+
+    headers += [('Content-Type', content_type), ('Content-Length', str(length))]
+
+    if environ.get('REQUEST_METHOD') == 'HEAD':
+        f.close()
+        start_response(status, headers)
+        return [b'']
+
+    start_response(status, headers)
+    file_wrapper = environ.get('wsgi.file_wrapper')
+    if file_wrapper and start == 0 and length == size:
+        return file_wrapper(f, STREAM_CHUNK_SIZE)
+    return _iter_file(f, start, length)
@@ -0,0 +1,108 @@
+# Copyright (C) @Wolfy004
+# Bounded ffmpeg process pool - shortest jobs first, hard timeouts
+
+import os
+import heapq
+import asyncio
+import itertools
+from typing import Optional, Tuple, List
+from asyncio.subprocess import PIPE
+from logger import LOGGER
+
+IS_CONSTRAINED = bool(
+    os.getenv('RENDER') or
+    os.getenv('RENDER_EXTERNAL_URL') or
+    os.getenv('REPLIT_DEPLOYMENT') or
+    os.getenv('REPL_ID')
+)
+
+# Max ffmpeg/ffprobe-heavy processes decoding at once (each can take 50-150MB RAM)
+FFMPEG_MAX_PROCESSES = int(os.getenv("FFMPEG_MAX_PROCESSES", "1" if IS_CONSTRAINED else "2"))
+
+
+class FFmpegPool:
+    """
+    Priority semaphore in front of ffmpeg subprocesses.
+
+    At most max_processes run at once; waiting jobs are released in order of
+    their cost (file size), so a small thumbnail isn't stuck behind a 2GB video.
+    Every job has a hard timeout after which the process is killed and reaped.
+    """
+
+    def __init__(self, max_processes: int = FFMPEG_MAX_PROCESSES):
+        self.max_processes = max(1, max_processes)
+        self.running = 0
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+        self.completed = 0
+        self.timeouts = 0
+        self.failures = 0
+
+    async def _acquire(self, cost: float):
+        if self.running < self.max_processes and not self._waiters:
+            self.running += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (cost, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # If the slot was already handed to us, pass it on
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot straight to the next job (running count unchanged)
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    async def run(self, cmd: List[str], timeout: float, cost: float = 0.0) -> Optional[Tuple[int, bytes]]:
+        """
+        Run a command inside the pool.
+
+        Returns:
+            (returncode, stderr) or None if it timed out or could not start
+        """
+        await self._acquire(cost)
+        proc = None
+        try:
+            proc = await asyncio.create_subprocess_exec(*cmd, stdout=PIPE, stderr=PIPE)
+            try:
+                _, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                LOGGER(__name__).warning(f"{cmd[0]} timed out after {timeout:.0f}s - killing")
+                return None
+            self.completed += 1
+            return proc.returncode, stderr or b""
+        except Exception as e:
+            self.failures += 1
+            LOGGER(__name__).warning(f"{cmd[0]} failed to run: {e}")
+            return None
+        finally:
+            if proc and proc.returncode is None:
+                try:
+                    proc.kill()
+                    await asyncio.wait_for(proc.wait(), timeout=3.0)
+                except Exception:
+                    pass
+            self._release()
+
+    def get_stats(self) -> dict:
+        return {
+            'max_processes': self.max_processes,
+            'running': self.running,
+            'queued': sum(1 for _, _, f in self._waiters if not f.done()),
+            'completed': self.completed,
+            'timeouts': self.timeouts,
+            'failures': self.failures,
+        }
+
+
+# Global ffmpeg pool instance
+ffmpeg_pool = FFmpegPool()
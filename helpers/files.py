@@ -11,11 +11,35 @@ from logger import LOGGER
 SIZE_UNITS = ["B", "KB", "MB", "GB", "TB", "PB"]
 
 def get_download_path(folder_id: int, filename: str, root_dir: str = "downloads") -> str:
+    """
+    Path for a file the current download job is about to write.
+
+    Inside `workspace_manager.job(...)` the path is registered to the job's
+    workspace and removed when the job ends; folder_id is then unused.
+    """
+    from helpers.workspace import workspace_manager
+    workspace = workspace_manager.current()
+    if workspace is not None:
+        return workspace.path(filename)
     folder = os.path.join(root_dir, str(folder_id))
     os.makedirs(folder, exist_ok=True)
     return os.path.join(folder, filename)
 
 
+def _release(path: str) -> None:
+    """Delete a download and its .temp/.tmp/.thumb.jpg files; the job's workspace removes its folder"""
+    from helpers.workspace import workspace_manager
+    in_workspace = workspace_manager.owner_of(path) is not None
+    workspace_manager.release(path)
+
+    if not in_workspace:
+        # Legacy per-message folder (path handed out outside a job); left alone unless empty
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
+
+
 def cleanup_download(path: str) -> None:
     """
     Immediate cleanup of downloaded files (legacy function).
@@ -27,14 +51,7 @@ def cleanup_download(path: str) -> None:
         
         LOGGER(__name__).info(f"Cleaning Download: {path}")
         
-        if os.path.exists(path):
-            os.remove(path)
-        if os.path.exists(path + ".temp"):
-            os.remove(path + ".temp")
-
-        folder = os.path.dirname(path)
-        if os.path.isdir(folder) and not os.listdir(folder):
-            os.rmdir(folder)
+        _release(path)
 
     except Exception as e:
         LOGGER(__name__).error(f"Cleanup failed for {path}: {e}")
@@ -60,16 +77,7 @@ async def cleanup_download_delayed(path: str, user_id: Optional[int], db) -> Non
         LOGGER(__name__).info(f"Cleaning Download: {os.path.basename(path)}")
         
         # Immediate cleanup
-        if os.path.exists(path):
-            os.remove(path)
-        if os.path.exists(path + ".temp"):
-            os.remove(path + ".temp")
-        if os.path.exists(path + ".tmp"):
-            os.remove(path + ".tmp")
-
-        folder = os.path.dirname(path)
-        if os.path.isdir(folder) and not os.listdir(folder):
-            os.rmdir(folder)
+        _release(path)
         
         # Force garbage collection to release RAM (critical for 512MB limit)
         gc.collect()
@@ -126,101 +134,20 @@ async def fileSizeLimit(file_size, message, action_type="download", is_premium=F
 
 def cleanup_orphaned_files() -> tuple[int, int]:
     """
-    Smart cleanup of orphaned files from crashes or stuck downloads.
+    Startup cleanup of files left behind by crashes or a restart mid-download.
     
-    Strategy:
-        pass
-    - Files in folders of users with ACTIVE downloads: NEVER touch (protects uploads too)
-    - Files in folders of users with NO active download: Delete if older than 45 min
-    - Always clean media files in root directory
+    This is the only full scan of downloads/: while the bot runs, every download
+    path belongs to a job's workspace and is removed when the job ends, and
+    workspace_manager.sweep() finds orphans from its index without touching disk.
     
-    Why folder-based approach?
-    - During download: file is being written (mod time updates)
-    - During upload: file is only READ (mod time stays same!)
-    - Using 45-min threshold alone could delete files during long uploads
-    - By checking user folders, we protect entire download+upload cycle
+    - downloads/: everything not owned by a live workspace (none exist at startup)
+    - Media files in the root directory
     
     Returns: (files_removed, bytes_freed)
     """
-    import time
-    
-    STALE_THRESHOLD = 45 * 60  # 45 minutes - matches per-file timeout
-    
     try:
-        files_removed = 0
-        bytes_freed = 0
-        now = time.time()
-        
-        # Get set of user IDs with active downloads
-        active_user_ids = set()
-        try:
-            from queue_manager import download_manager
-            active_user_ids = set(download_manager.active_downloads)
-            if active_user_ids:
-                pass
-        except ImportError:
-            LOGGER(__name__).warning("Could not import queue_manager")
-        except Exception as e:
-            LOGGER(__name__).warning(f"Could not check active downloads: {e}")
-        
-        # Clean downloads folder - process each user folder separately
-        if os.path.exists("downloads"):
-            # First, get list of user folders
-            try:
-                user_folders = [d for d in os.listdir("downloads") 
-                               if os.path.isdir(os.path.join("downloads", d))]
-            except Exception as e:
-                LOGGER(__name__).warning(f"Failed to list downloads folder: {e}")
-                user_folders = []
-            
-            for user_folder in user_folders:
-                user_path = os.path.join("downloads", user_folder)
-                
-                # Check if this user has an active download
-                try:
-                    user_id = int(user_folder)
-                    if user_id in active_user_ids:
-                        continue  # Skip entire folder - user is downloading or uploading
-                except ValueError:
-                    pass  # Not a user ID folder, process normally
-                
-                # Process files in this folder (user has no active download)
-                for root, dirs, files in os.walk(user_path, topdown=False):
-                    for file in files:
-                        filepath = os.path.join(root, file)
-                        try:
-                            stat = os.stat(filepath)
-                            file_age = now - stat.st_mtime
-                            size = stat.st_size
-                            
-                            # Delete if file is stale (45+ minutes old)
-                            if file_age > STALE_THRESHOLD:
-                                os.remove(filepath)
-                                files_removed += 1
-                                bytes_freed += size
-                                LOGGER(__name__).info(
-                                    f"Removed stale file ({file_age/60:.1f}min old): {filepath}"
-                                )
-                            else:
-                                pass
-                        except Exception as e:
-                            LOGGER(__name__).warning(f"Failed to check/remove {filepath}: {e}")
-                    
-                    # Remove empty subfolders
-                    for dir in dirs:
-                        dirpath = os.path.join(root, dir)
-                        try:
-                            if not os.listdir(dirpath):
-                                os.rmdir(dirpath)
-                        except:
-                            pass
-                
-                # Remove user folder if empty
-                try:
-                    if not os.listdir(user_path):
-                        os.rmdir(user_path)
-                except:
-                    pass
+        from helpers.workspace import workspace_manager
+        files_removed, bytes_freed = workspace_manager.scan_orphans()
         
         # Cleanup media files in root directory (from crashes)
         media_extensions = ['*.MOV', '*.mov', '*.MP4', '*.mp4', '*.MKV', '*.mkv', 
@@ -0,0 +1,310 @@
+# Copyright (C) @Wolfy004
+# Single-pass ffprobe with a small result cache
+
+import os
+import asyncio
+from dataclasses import dataclass, field
+from collections import OrderedDict
+from typing import Optional, Tuple, Dict
+from asyncio.subprocess import PIPE
+from logger import LOGGER
+
+PROBE_TIMEOUT_SECONDS = 10.0
+
+# Probe results are tiny; 128 entries covers every file a constrained box can hold at once
+PROBE_CACHE_SIZE = 128
+
+# Upload attributes that must be known for each media type. If the source
+# Telegram message already carries them, the downloaded file is never probed.
+REQUIRED_ATTRIBUTES = {
+    'video': ('duration', 'width', 'height'),
+    'animation': ('duration',),
+    'audio': ('duration',),
+    'voice': ('duration',),
+    'video_note': ('duration',),
+}
+
+
+@dataclass(frozen=True)
+class MediaStream:
+    index: int
+    codec_type: str
+    codec_name: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    duration: Optional[float] = None
+    rotation: int = 0
+    attached_pic: bool = False
+
+
+@dataclass(frozen=True)
+class MediaInfo:
+    path: str
+    streams: Tuple[MediaStream, ...] = ()
+    duration: int = 0
+    width: Optional[int] = None
+    height: Optional[int] = None
+    video_codec: Optional[str] = None
+    audio_codec: Optional[str] = None
+    rotation: int = 0
+    artist: Optional[str] = None
+    title: Optional[str] = None
+    tags: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def has_video(self) -> bool:
+        """True if there is a real video stream (cover art in audio files doesn't count)"""
+        return any(s.codec_type == 'video' and not s.attached_pic for s in self.streams)
+
+    @property
+    def has_audio(self) -> bool:
+        return any(s.codec_type == 'audio' for s in self.streams)
+
+
+@dataclass(frozen=True)
+class MediaAttributes:
+    """Upload attributes for send_video/send_audio/..., from Telegram or ffprobe"""
+    duration: int = 0
+    width: Optional[int] = None
+    height: Optional[int] = None
+    artist: Optional[str] = None
+    title: Optional[str] = None
+    source: str = 'none'
+
+
+def source_media_attributes(source_message, media_type: str) -> Dict[str, object]:
+    """
+    Read duration/size/tags straight from the source message's media object
+    (Pyrogram Video, Audio, Voice, VideoNote or Animation). Missing values are omitted.
+    """
+    media = getattr(source_message, media_type, None) if source_message else None
+    if media is None:
+        return {}
+    values = {
+        'duration': getattr(media, 'duration', None),
+        'width': getattr(media, 'width', None),
+        'height': getattr(media, 'height', None),
+        'artist': getattr(media, 'performer', None),
+        'title': getattr(media, 'title', None),
+    }
+    if media_type == 'video_note':
+        # Round videos only report a side length
+        length = getattr(media, 'length', None)
+        values['width'] = values['height'] = length
+    return {k: v for k, v in values.items() if v}
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        if value in (None, '', 'N/A'):
+            return None
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _stream_rotation(stream: dict) -> int:
+    rotate = (stream.get('tags') or {}).get('rotate')
+    if rotate is not None:
+        try:
+            return int(float(rotate)) % 360
+        except (ValueError, TypeError):
+            pass
+    for side_data in stream.get('side_data_list') or []:
+        if 'rotation' in side_data:
+            try:
+                return int(float(side_data['rotation'])) % 360
+            except (ValueError, TypeError):
+                pass
+    return 0
+
+
+def _get_tag(tags: dict, name: str) -> Optional[str]:
+    return tags.get(name) or tags.get(name.upper()) or tags.get(name.title())
+
+
+def parse_probe_output(path: str, data: dict) -> MediaInfo:
+    """Build a MediaInfo from ffprobe's -show_format -show_streams JSON"""
+    streams = []
+    for raw in data.get('streams') or []:
+        streams.append(MediaStream(
+            index=raw.get('index', len(streams)),
+            codec_type=raw.get('codec_type') or 'unknown',
+            codec_name=raw.get('codec_name'),
+            width=raw.get('width'),
+            height=raw.get('height'),
+            duration=_to_float(raw.get('duration')),
+            rotation=_stream_rotation(raw),
+            attached_pic=bool((raw.get('disposition') or {}).get('attached_pic')),
+        ))
+
+    format_info = data.get('format') or {}
+    tags = {k: str(v) for k, v in (format_info.get('tags') or {}).items()}
+
+    video = next((s for s in streams if s.codec_type == 'video' and not s.attached_pic), None)
+    audio = next((s for s in streams if s.codec_type == 'audio'), None)
+
+    # Duration: container first, then the video stream, then the audio stream
+    duration = _to_float(format_info.get('duration'))
+    if not duration:
+        duration = (video and video.duration) or (audio and audio.duration) or 0
+
+    width = height = None
+    rotation = 0
+    if video:
+        width, height, rotation = video.width, video.height, video.rotation
+        # Phone videos store portrait as landscape + rotation; report display size
+        if rotation in (90, 270) and width and height:
+            width, height = height, width
+
+    return MediaInfo(
+        path=path,
+        streams=tuple(streams),
+        duration=round(duration) if duration else 0,
+        width=width,
+        height=height,
+        video_codec=video.codec_name if video else None,
+        audio_codec=audio.codec_name if audio else None,
+        rotation=rotation,
+        artist=_get_tag(tags, 'artist'),
+        title=_get_tag(tags, 'title'),
+        tags=tags,
+    )
+
+
+class MediaProbe:
+    """
+    Runs ffprobe once per file and caches the result keyed by (path, size, mtime),
+    so the caption/duration lookup, thumbnail decision and upload attributes all
+    share one subprocess. Concurrent probes of the same file share one call.
+    """
+
+    def __init__(self, max_entries: int = PROBE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[tuple, MediaInfo]" = OrderedDict()
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.passthrough = 0
+
+    @staticmethod
+    def _cache_key(path: str) -> Optional[tuple]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+    async def probe(self, path: str) -> Optional[MediaInfo]:
+        """Probe a file. Returns None if the file is missing or ffprobe fails."""
+        key = self._cache_key(path)
+        if key is None:
+            return None
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            info = await self._run_ffprobe(path)
+            if info is not None:
+                self._cache[key] = info
+                if len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+            future.set_result(info)
+            return info
+        except BaseException as e:
+            future.set_result(None)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return None
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _run_ffprobe(self, path: str) -> Optional[MediaInfo]:
+        proc = None
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "ffprobe", "-hide_banner", "-loglevel", "error",
+                "-print_format", "json", "-show_format", "-show_streams", path,
+                stdout=PIPE, stderr=PIPE
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=PROBE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                LOGGER(__name__).warning(f"ffprobe timed out for {os.path.basename(path)}")
+                return None
+
+            if proc.returncode != 0 or not stdout:
+                return None
+
+            try:
+                import orjson
+                data = orjson.loads(stdout)
+            except ImportError:
+                import json
+                data = json.loads(stdout)
+            return parse_probe_output(path, data)
+        except Exception as e:
+            LOGGER(__name__).error(f"ffprobe failed for {os.path.basename(path)}: {e}")
+            return None
+        finally:
+            if proc and proc.returncode is None:
+                try:
+                    proc.kill()
+                    await asyncio.wait_for(proc.wait(), timeout=2.0)
+                except Exception:
+                    pass
+
+    async def resolve(self, path: str, media_type: str, source_message=None) -> MediaAttributes:
+        """
+        Upload attributes for a downloaded file. Values carried by the source
+        message win; ffprobe only runs when a required attribute is missing.
+        """
+        values = source_media_attributes(source_message, media_type)
+        required = REQUIRED_ATTRIBUTES.get(media_type, ())
+        if all(values.get(name) for name in required):
+            if required:
+                self.passthrough += 1
+            return MediaAttributes(source='telegram' if values else 'none', **values)
+
+        info = await self.probe(path)
+        if info is None:
+            return MediaAttributes(source='telegram' if values else 'none', **values)
+
+        probed = {
+            'duration': info.duration,
+            'width': info.width,
+            'height': info.height,
+            'artist': info.artist,
+            'title': info.title,
+        }
+        merged = {k: values.get(k) or v for k, v in probed.items()}
+        return MediaAttributes(source='mixed' if values else 'ffprobe', **merged)
+
+    def invalidate(self, path: str):
+        """Drop cached results for a path (call when the file is deleted)"""
+        abs_path = os.path.abspath(path)
+        for key in [k for k in self._cache if k[0] == abs_path]:
+            del self._cache[key]
+
+    def get_stats(self) -> Dict:
+        return {
+            'entries': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'passthrough': self.passthrough,
+        }
+
+
+# Global media probe instance
+media_probe = MediaProbe()
@@ -8,6 +8,21 @@ from collections import OrderedDict
 from time import time
 from pyrogram import Client
 from logger import LOGGER
+from metrics import metrics
+
+_log = LOGGER(__name__)
+
+_SESSIONS_CREATED = metrics.counter('sessions_created_total', 'User sessions connected and verified')
+_SESSION_FAILURES = metrics.counter(
+    'session_failures_total', 'User session requests that did not yield a client', ('reason',)
+).prepare(('slots_full',), ('memory_pressure',), ('invalid_session',), ('creation_failed',))
+_SESSIONS_EVICTED = metrics.counter(
+    'sessions_evicted_total', 'User sessions disconnected by the manager', ('reason',)
+).prepare(('capacity',), ('idle',))
+_SESSION_CONNECT_SECONDS = metrics.histogram(
+    'session_connect_seconds', 'Time to connect and verify a user session',
+    buckets=(0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+)
 
 class SessionManager:
     """
@@ -49,6 +64,7 @@ class SessionManager:
             tuple: (client, error_code) where:
                 - (Client, None) if successful
                 - (None, 'slots_full') if all slots have active downloads
+                - (None, 'memory_pressure') if new sessions are paused by the memory-pressure controller
                 - (None, 'invalid_session') if session is not authorized
                 - (None, 'creation_failed') if session creation failed
         """
@@ -61,8 +77,16 @@ class SessionManager:
                 self.last_activity[user_id] = time()
                 return (self.active_sessions[user_id], None)
             
+            from memory_pressure import memory_pressure
+            max_sessions = memory_pressure.session_limit(self.max_sessions)
+            if max_sessions == 0:
+                memory_pressure.rejected_sessions += 1
+                _log.warning("Cannot create session for user %s: paused by memory pressure", user_id)
+                _SESSION_FAILURES.labels('memory_pressure').inc()
+                return (None, 'memory_pressure')
+            
             # If at capacity, try to disconnect oldest IDLE session (no active downloads)
-            if len(self.active_sessions) >= self.max_sessions:
+            if len(self.active_sessions) >= max_sessions:
                 from queue_manager import download_manager
                 
                 # Find sessions without active downloads (safe to evict)
@@ -75,22 +99,27 @@ class SessionManager:
                 if evictable_sessions:
                     oldest_idle_user = evictable_sessions[0]
                     oldest_client = self.active_sessions.pop(oldest_idle_user)
+                    memory_pressure.unregister_transfer_client(oldest_client)
                     try:
                         from memory_monitor import memory_monitor
                         memory_monitor.track_session_cleanup(oldest_idle_user)
                         await oldest_client.disconnect()
                         # Clear activity timestamp for evicted session
                         self.last_activity.pop(oldest_idle_user, None)
-                        LOGGER(__name__).info(f"Disconnected oldest idle session: user {oldest_idle_user} (no active downloads)")
+                        _SESSIONS_EVICTED.labels('capacity').inc()
+                        _log.info("Disconnected oldest idle session: user %s (no active downloads)", oldest_idle_user)
                         memory_monitor.log_memory_snapshot("Session Disconnected", f"Freed idle session for user {oldest_idle_user}", silent=True)
                     except Exception as e:
-                        LOGGER(__name__).error(f"Error disconnecting session {oldest_idle_user}: {e}")
+                        _log.error("Error disconnecting session %s: %s", oldest_idle_user, e)
                 else:
                     # All sessions have active downloads - cannot evict safely
-                    LOGGER(__name__).warning(
-                        f"Cannot create session for user {user_id}: all {self.max_sessions} sessions "
-                        f"have active downloads. User must wait."
+                    _log.warning(
+                        "Cannot create session for user %s: all %d sessions have active downloads. User must wait.",
+                        user_id, max_sessions
                     )
+                    if max_sessions < self.max_sessions:
+                        memory_pressure.rejected_sessions += 1
+                    _SESSION_FAILURES.labels('slots_full').inc()
                     return (None, 'slots_full')
             
             # Create new session
@@ -98,13 +127,16 @@ class SessionManager:
                 from memory_monitor import memory_monitor
                 
                 memory_monitor.track_session_creation(user_id)
+                connect_started = time()
                 
                 # Create Pyrogram client with session string (no StringSession wrapper needed)
+                # Built at full size; memory pressure throttles it by holding permits
                 client = Client(
                     name=f"user_{user_id}",
                     api_id=api_id,
                     api_hash=api_hash,
-                    session_string=session_string
+                    session_string=session_string,
+                    max_concurrent_transmissions=SESSION_TRANSMISSIONS
                 )
                 
                 # Connect the client
@@ -112,30 +144,36 @@ class SessionManager:
                 
                 # Verify the session is valid AND user is authorized
                 if not client.is_connected:
-                    LOGGER(__name__).error(f"Session for user {user_id}: client not connected")
+                    _log.error("Session for user %s: client not connected", user_id)
                     await client.disconnect()
+                    _SESSION_FAILURES.labels('invalid_session').inc()
                     return (None, 'invalid_session')
                 
                 # Verify user account is actually authorized on this session
                 try:
                     me = await client.get_me()
-                    LOGGER(__name__).info(f"Session verified for user {user_id}: authorized as {me.username or me.first_name}")
+                    _log.info("Session verified for user %s: authorized as %s", user_id, me.username or me.first_name)
                 except Exception as e:
-                    LOGGER(__name__).error(f"Session for user {user_id} is not authorized: {e}")
+                    _log.error("Session for user %s is not authorized: %s", user_id, e)
                     await client.disconnect()
+                    _SESSION_FAILURES.labels('invalid_session').inc()
                     return (None, 'invalid_session')
                 
                 self.active_sessions[user_id] = client
+                memory_pressure.register_transfer_client(client, SESSION_TRANSMISSIONS)
                 # Track activity time
                 self.last_activity[user_id] = time()
-                LOGGER(__name__).info(f"Created new session for user {user_id} ({len(self.active_sessions)}/{self.max_sessions})")
+                _SESSIONS_CREATED.inc()
+                _SESSION_CONNECT_SECONDS.observe(time() - connect_started)
+                _log.info("Created new session for user %s (%d/%d)", user_id, len(self.active_sessions), self.max_sessions)
                 
                 memory_monitor.log_memory_snapshot("Session Created", f"User {user_id} - Total sessions: {len(self.active_sessions)}", silent=True)
                 
                 return (client, None)
                 
             except Exception as e:
-                LOGGER(__name__).error(f"Failed to create session for user {user_id}: {e}")
+                _log.error("Failed to create session for user %s: %s", user_id, e)
+                _SESSION_FAILURES.labels('creation_failed').inc()
                 return (None, 'creation_failed')
     
     async def remove_session(self, user_id: int):
@@ -145,6 +183,7 @@ class SessionManager:
                 try:
                     from memory_monitor import memory_monitor
                     memory_monitor.track_session_cleanup(user_id)
+                    self._release_transfers(self.active_sessions[user_id])
                     await self.active_sessions[user_id].disconnect()
                     del self.active_sessions[user_id]
                     self.last_activity.pop(user_id, None)
@@ -157,6 +196,7 @@ class SessionManager:
         """Disconnect all active sessions (for shutdown)"""
         async with self._lock:
             for user_id, client in list(self.active_sessions.items()):
+                self._release_transfers(client)
                 try:
                     await client.disconnect()
                 except:
@@ -165,14 +205,18 @@ class SessionManager:
             self.last_activity.clear()
             LOGGER(__name__).info("All sessions disconnected")
     
-    async def cleanup_idle_sessions(self):
+    async def cleanup_idle_sessions(self, max_idle_seconds=None):
         """
         Disconnect sessions that have been idle for too long.
         
         SMART SESSION TIMEOUT: Sessions with active downloads are NEVER disconnected,
         even if they exceed the idle timeout. This prevents interrupting downloads.
         The session will be cleaned up after the download completes and idle timeout expires.
+        
+        max_idle_seconds overrides the idle timeout (the memory-pressure controller
+        passes a shorter one, or 0 to evict every session without a download).
         """
+        idle_timeout_seconds = self.idle_timeout_seconds if max_idle_seconds is None else max_idle_seconds
         current_time = time()
         disconnected_count = 0
         skipped_active_downloads = 0
@@ -183,7 +227,7 @@ class SessionManager:
             idle_users = []
             for user_id, last_active in list(self.last_activity.items()):
                 idle_seconds = current_time - last_active
-                if idle_seconds >= self.idle_timeout_seconds:
+                if idle_seconds >= idle_timeout_seconds:
                     idle_users.append(user_id)
             
             for user_id in idle_users:
@@ -203,6 +247,7 @@ class SessionManager:
                         LOGGER(__name__).info(f"Disconnecting idle session for user {user_id} (idle for {idle_minutes:.1f} minutes)")
                         
                         memory_monitor.track_session_cleanup(user_id)
+                        self._release_transfers(self.active_sessions[user_id])
                         await self.active_sessions[user_id].disconnect()
                         del self.active_sessions[user_id]
                         del self.last_activity[user_id]
@@ -218,6 +263,9 @@ class SessionManager:
                 else:
                     self.last_activity.pop(user_id, None)
         
+        if disconnected_count:
+            _SESSIONS_EVICTED.labels('idle').inc(disconnected_count)
+        
         if disconnected_count > 0 or skipped_active_downloads > 0:
             LOGGER(__name__).info(
                 f"Session cleanup: disconnected {disconnected_count}, "
@@ -246,6 +294,12 @@ class SessionManager:
             except Exception as e:
                 LOGGER(__name__).error(f"Error in periodic session cleanup: {e}")
     
+    @staticmethod
+    def _release_transfers(client):
+        """Stop the memory-pressure controller throttling a session that is going away"""
+        from memory_pressure import memory_pressure
+        memory_pressure.unregister_transfer_client(client)
+    
     def get_active_count(self) -> int:
         """Get number of currently active sessions"""
         return len(self.active_sessions)
@@ -262,5 +316,9 @@ IS_CONSTRAINED = bool(
 )
 
 MAX_SESSIONS = 10 if IS_CONSTRAINED else 15
+# Parallel file transmissions per user session (scaled down under memory pressure)
+SESSION_TRANSMISSIONS = int(os.getenv('SESSION_TRANSMISSIONS', '2' if IS_CONSTRAINED else '4'))
 IDLE_TIMEOUT_MINUTES = 2  # Reduced from 30 since smart timeout protects active downloads
 session_manager = SessionManager(max_sessions=MAX_SESSIONS, idle_timeout_minutes=IDLE_TIMEOUT_MINUTES)
+
+metrics.gauge('sessions_active', 'Connected user sessions', function=lambda: len(session_manager.active_sessions))
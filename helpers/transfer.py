@@ -9,32 +9,48 @@ pooling is needed - each session can use full connection capacity.
 CONFIGURATION (Environment Variables):
     pass
 - CONNECTIONS_PER_TRANSFER: Connections per download/upload (default: 16)
+
+[RAM] lines are DEBUG: with the default INFO level no RSS is sampled and no
+progress wrapper is installed. Enable with LOG_LEVELS="helpers.transfer=DEBUG".
 """
 import os
 import asyncio
 import math
 import inspect
+import logging
 import psutil
 import gc
 from typing import Optional, Callable, BinaryIO, Set, Dict
 from pyrogram import Client
 from pyrogram.types import Message
-from logger import LOGGER
+from logger import LOGGER, lazy
 
 CONNECTIONS_PER_TRANSFER = int(os.getenv("CONNECTIONS_PER_TRANSFER", "16"))
 
+_log = LOGGER(__name__)
+_PROCESS = psutil.Process(os.getpid())
+
 def get_ram_usage_mb():
     """Get current RAM usage in MB"""
-    process = psutil.Process(os.getpid())
-    return process.memory_info().rss / 1024 / 1024
+    return _PROCESS.memory_info().rss / 1024 / 1024
+
+def ram_logging_enabled() -> bool:
+    """True when [RAM] debug lines (and the psutil samples behind them) are wanted"""
+    return _log.isEnabledFor(logging.DEBUG)
 
 def create_ram_logging_callback(original_callback: Optional[Callable], file_size: int, operation: str, file_name: str):
     """
     Wrap progress callback to log RAM usage at 25%, 50%, 75% progress.
+    
+    Returns the original callback untouched when RAM logging is off, so
+    chunks don't pay for an extra call layer.
     """
+    if not ram_logging_enabled():
+        return original_callback
+    
     logged_thresholds: Set[int] = set()
     start_ram = get_ram_usage_mb()
-    LOGGER(__name__).info(f"[RAM] {operation} START: {file_name} - RAM: {start_ram:.1f}MB")
+    _log.debug("[RAM] %s START: %s - RAM: %.1fMB", operation, file_name, start_ram)
     
     def ram_logging_wrapper(current: int, total: int):
         nonlocal logged_thresholds
@@ -50,10 +66,9 @@ def create_ram_logging_callback(original_callback: Optional[Callable], file_size
             if percent >= threshold and threshold not in logged_thresholds:
                 logged_thresholds.add(threshold)
                 current_ram = get_ram_usage_mb()
-                ram_increase = current_ram - start_ram
-                LOGGER(__name__).info(
-                    f"[RAM] {operation} {threshold}%: {file_name} - "
-                    f"RAM: {current_ram:.1f}MB (+{ram_increase:.1f}MB from start)"
+                _log.debug(
+                    "[RAM] %s %d%%: %s - RAM: %.1fMB (+%.1fMB from start)",
+                    operation, threshold, file_name, current_ram, current_ram - start_ram
                 )
         
         if original_callback:
@@ -105,7 +120,7 @@ async def download_media_fast(
     
     # Check for paid media (Pyrogram identifies this via media type checking)
     if hasattr(message, 'media') and message.media and hasattr(message.media, 'is_paid') and message.media.is_paid:
-        LOGGER(__name__).warning(f"Paid media detected - this is premium content")
+        _log.warning("Paid media detected - this is premium content")
         raise ValueError("Paid media (premium content) cannot be downloaded - the content owner requires payment to access this media")
     
     try:
@@ -137,12 +152,9 @@ async def download_media_fast(
             file_size = getattr(message.animation, 'file_size', 0)
             media_location = message.animation
         
-        LOGGER(__name__).info(
-            f"Starting download: {os.path.basename(file)} "
-            f"({file_size/1024/1024:.1f}MB)"
-        )
-        
         file_name = os.path.basename(file)
+        _log.info("Starting download: %s (%.1fMB)", file_name, file_size / 1024 / 1024)
+        
         ram_callback = create_ram_logging_callback(progress_callback, file_size, "DOWNLOAD", file_name)
         
         if media_location and file_size > 0:
@@ -153,18 +165,20 @@ async def download_media_fast(
                 progress=ram_callback
             )
             
-            end_ram = get_ram_usage_mb()
-            LOGGER(__name__).info(f"[RAM] DOWNLOAD COMPLETE: {file_name} - RAM before GC: {end_ram:.1f}MB")
-            
+            verbose = ram_logging_enabled()
+            end_ram = get_ram_usage_mb() if verbose else 0.0
             gc.collect()
-            after_gc_ram = get_ram_usage_mb()
-            ram_released = end_ram - after_gc_ram
-            LOGGER(__name__).info(f"[RAM] DOWNLOAD GC: {file_name} - RAM after GC: {after_gc_ram:.1f}MB (released: {ram_released:.1f}MB)")
+            if verbose:
+                after_gc_ram = get_ram_usage_mb()
+                _log.debug(
+                    "[RAM] DOWNLOAD COMPLETE: %s - RAM before GC: %.1fMB, after GC: %.1fMB (released: %.1fMB)",
+                    file_name, end_ram, after_gc_ram, end_ram - after_gc_ram
+                )
             return file
         else:
-            LOGGER(__name__).warning(
-                f"Pyrogram streaming bypassed for {file_name}: media_location={media_location is not None}, "
-                f"file_size={file_size} - falling back to standard download"
+            _log.warning(
+                "Pyrogram streaming bypassed for %s: media_location=%s, file_size=%s - falling back to standard download",
+                file_name, media_location is not None, file_size
             )
             return await client.download_media(message, file_name=file, progress=progress_callback)
         
@@ -172,7 +186,7 @@ async def download_media_fast(
         error_str = str(e).lower()
         if 'paidmedia' in error_str or 'paid' in error_str:
             raise ValueError("Paid media (premium content) cannot be downloaded - the content owner requires payment to access this media")
-        LOGGER(__name__).error(f"Pyrogram download failed, falling back to standard: {e}")
+        _log.error("Pyrogram download failed, falling back to standard: %s", e)
         return await client.download_media(message, file_name=file, progress=progress_callback)
 
 async def upload_media_fast(
@@ -193,31 +207,28 @@ async def upload_media_fast(
     
     try:
         file_name = os.path.basename(file_path)
-        LOGGER(__name__).info(
-            f"Starting upload: {file_name} "
-            f"({file_size/1024/1024:.1f}MB)"
-        )
-        
-        ram_callback = create_ram_logging_callback(progress_callback, file_size, "UPLOAD", file_name)
+        _log.info("Starting upload: %s (%.1fMB)", file_name, file_size / 1024 / 1024)
+        _log.debug("[RAM] UPLOAD START: %s - RAM: %.1fMB", file_name, lazy(get_ram_usage_mb))
         
         # Pyrogram's upload is handled directly via send_photo/send_video/send_document
         # This function returns None and lets the send methods handle the actual upload
         # The progress callback is passed through the send methods
-        
-        end_ram = get_ram_usage_mb()
-        LOGGER(__name__).info(f"[RAM] UPLOAD COMPLETE: {file_name} - RAM before GC: {end_ram:.1f}MB")
         return result
         
     except Exception as e:
-        LOGGER(__name__).error(f"Pyrogram upload preparation failed: {e}")
+        _log.error("Pyrogram upload preparation failed: %s", e)
         return None
         
     finally:
-        before_gc = get_ram_usage_mb()
+        verbose = ram_logging_enabled()
+        before_gc = get_ram_usage_mb() if verbose else 0.0
         gc.collect()
-        after_gc = get_ram_usage_mb()
-        ram_released = before_gc - after_gc
-        LOGGER(__name__).info(f"[RAM] UPLOAD GC: {os.path.basename(file_path)} - RAM after GC: {after_gc:.1f}MB (released: {ram_released:.1f}MB)")
+        if verbose:
+            after_gc = get_ram_usage_mb()
+            _log.debug(
+                "[RAM] UPLOAD GC: %s - RAM after GC: %.1fMB (released: %.1fMB)",
+                os.path.basename(file_path), after_gc, before_gc - after_gc
+            )
 
 
 def get_connection_count_for_size(file_size: int, max_count: int = CONNECTIONS_PER_TRANSFER) -> int:
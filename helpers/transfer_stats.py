@@ -0,0 +1,313 @@
+# Copyright (C) @Wolfy004
+# Transfer speed/ETA estimation and per-transfer metrics
+
+import os
+import math
+from time import time
+from collections import deque
+from typing import Optional, Dict, List
+from logger import LOGGER
+from metrics import metrics
+
+# Time constant (seconds) for the exponentially weighted speed average.
+# Lower values react faster to speed changes, higher values give a smoother display.
+SPEED_SMOOTHING_SECONDS = float(os.getenv("SPEED_SMOOTHING_SECONDS", "3"))
+
+# A gap between two chunks longer than this counts as a stall
+STALL_THRESHOLD_SECONDS = float(os.getenv("STALL_THRESHOLD_SECONDS", "2"))
+
+# Span (seconds) of the windowed rate shown next to the smoothed speed. Unlike the
+# EWMA it has no memory beyond the window, so it drops to zero during a stall.
+RATE_WINDOW_SECONDS = float(os.getenv("RATE_WINDOW_SECONDS", "10"))
+
+# Byte-count samples kept for the window (one per window/slots seconds, fixed RAM)
+RATE_WINDOW_SLOTS = 16
+
+# Seconds between progress message edits; they continue while no chunks arrive
+PROGRESS_REFRESH_SECONDS = float(os.getenv("PROGRESS_REFRESH_SECONDS", "5"))
+
+# Bounded sample buffer for chunk latency percentiles (fixed RAM per transfer)
+LATENCY_SAMPLE_SIZE = 256
+
+# Completed transfer records kept for /adminstats and debugging
+RECENT_TRANSFERS_KEPT = 50
+
+_TRANSFERS = metrics.counter('transfers_total', 'Completed transfers', ('operation', 'outcome'))
+_TRANSFER_BYTES = metrics.counter('transfer_bytes_total', 'Bytes moved by completed transfers', ('operation',))
+_TRANSFER_STALL_SECONDS = metrics.counter('transfer_stall_seconds_total', 'Time transfers spent stalled', ('operation',))
+_TRANSFER_SECONDS = metrics.histogram(
+    'transfer_duration_seconds', 'Wall time of a transfer', ('operation',),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 3600)
+)
+
+
+class TransferRateEstimator:
+    """
+    O(1) per-chunk speed/ETA estimator for a single transfer.
+
+    Speed is an exponentially weighted moving average where the weight of each
+    sample depends on the time it covers, so irregular chunk intervals (Pyrogram
+    calls back once per 512KB-1MB part) don't skew the result. Alongside it, a
+    windowed rate covers only the last RATE_WINDOW_SECONDS, from at most
+    RATE_WINDOW_SLOTS (time, bytes) samples. Chunk latencies are kept in a
+    fixed-size ring buffer and only sorted once when the transfer ends.
+    """
+    __slots__ = (
+        'operation', 'file_name', 'user_id', 'total', 'start_time',
+        'last_time', 'last_bytes', 'speed', 'chunks', 'stall_time',
+        'latencies', 'window', 'finished'
+    )
+
+    def __init__(self, operation: str = "transfer", total: int = 0,
+                 file_name: Optional[str] = None, user_id: Optional[int] = None,
+                 start_time: Optional[float] = None):
+        now = time() if start_time is None else start_time
+        self.operation = operation
+        self.file_name = file_name
+        self.user_id = user_id
+        self.total = total
+        self.start_time = now
+        self.last_time = now
+        self.last_bytes = 0
+        self.speed = 0.0
+        self.chunks = 0
+        self.stall_time = 0.0
+        self.latencies = deque(maxlen=LATENCY_SAMPLE_SIZE)
+        # (time, bytes) samples; the oldest one anchors the start of the window
+        self.window = deque([(now, 0)], maxlen=RATE_WINDOW_SLOTS + 2)
+        self.finished = False
+
+    def update(self, current: int, total: Optional[int] = None, now: Optional[float] = None) -> float:
+        """Feed the latest byte count. Returns the smoothed speed in bytes/s."""
+        if now is None:
+            now = time()
+        if total:
+            self.total = total
+
+        dt = now - self.last_time
+        delta = current - self.last_bytes
+        if dt <= 0 or delta <= 0:
+            return self.speed
+
+        self.chunks += 1
+        self.latencies.append(dt)
+        if dt > STALL_THRESHOLD_SECONDS:
+            self.stall_time += dt
+
+        instant = delta / dt
+        if self.speed <= 0:
+            self.speed = instant
+        else:
+            alpha = 1.0 - math.exp(-dt / SPEED_SMOOTHING_SECONDS)
+            self.speed += alpha * (instant - self.speed)
+
+        self.last_time = now
+        self.last_bytes = current
+        self._add_window_sample(now, current)
+        return self.speed
+
+    def _add_window_sample(self, now: float, current: int):
+        window = self.window
+        # Chunks closer together than one slot share a sample
+        if len(window) > 1 and now - window[-2][0] < RATE_WINDOW_SECONDS / RATE_WINDOW_SLOTS:
+            window[-1] = (now, current)
+        else:
+            window.append((now, current))
+        # Keep one sample at or before the window start as the anchor
+        cutoff = now - RATE_WINDOW_SECONDS
+        while len(window) > 2 and window[1][0] <= cutoff:
+            window.popleft()
+
+    def window_speed(self, now: Optional[float] = None) -> float:
+        """Bytes/s over roughly the last RATE_WINDOW_SECONDS; falls during a stall"""
+        if now is None:
+            now = self.last_time
+        anchor_time, anchor_bytes = self.window[0]
+        elapsed = now - anchor_time
+        return (self.last_bytes - anchor_bytes) / elapsed if elapsed > 0 else 0.0
+
+    def average_speed(self, now: Optional[float] = None) -> float:
+        elapsed = (self.last_time if now is None else now) - self.start_time
+        return self.last_bytes / elapsed if elapsed > 0 else 0.0
+
+    def current_speed(self) -> float:
+        """Smoothed speed, falling back to the overall average before the first sample"""
+        return self.speed if self.speed > 0 else self.average_speed()
+
+    def eta(self) -> float:
+        """Seconds remaining at the current smoothed speed (0 when unknown)"""
+        speed = self.current_speed()
+        remaining = self.total - self.last_bytes
+        if speed <= 0 or remaining <= 0:
+            return 0.0
+        return remaining / speed
+
+    def _percentile(self, ordered: List[float], pct: float) -> float:
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def finish(self, outcome: str = "ok", now: Optional[float] = None) -> Dict:
+        """Close the transfer and return its metrics record"""
+        if now is None:
+            now = time()
+        self.finished = True
+        ordered = sorted(self.latencies)
+        duration = max(now - self.start_time, 0.0)
+        return {
+            'operation': self.operation,
+            'file_name': self.file_name,
+            'user_id': self.user_id,
+            'outcome': outcome,
+            'bytes': self.last_bytes,
+            'total': self.total,
+            'duration': round(duration, 2),
+            'avg_speed': round(self.last_bytes / duration, 1) if duration > 0 else 0.0,
+            'ewma_speed': round(self.speed, 1),
+            'window_speed': round(self.window_speed(now), 1),
+            'chunks': self.chunks,
+            'chunk_latency_p50': round(self._percentile(ordered, 50), 3),
+            'chunk_latency_p95': round(self._percentile(ordered, 95), 3),
+            'stall_time': round(self.stall_time, 2),
+            'finished_at': now,
+        }
+
+
+class TransferMetrics:
+    """Keeps a bounded history of completed transfer records"""
+
+    def __init__(self, max_records: int = RECENT_TRANSFERS_KEPT):
+        self.recent = deque(maxlen=max_records)
+        self.completed = 0
+        self.failed = 0
+
+    def start(self, operation: str, total: int = 0, file_name: Optional[str] = None,
+              user_id: Optional[int] = None, start_time: Optional[float] = None) -> TransferRateEstimator:
+        return TransferRateEstimator(operation, total, file_name, user_id, start_time)
+
+    def record(self, estimator: TransferRateEstimator, outcome: str = "ok") -> Optional[Dict]:
+        """Finish an estimator and store its record (no-op if already finished)"""
+        if estimator is None or estimator.finished:
+            return None
+        record = estimator.finish(outcome)
+        self.recent.append(record)
+        operation = record['operation']
+        _TRANSFERS.labels(operation, outcome).inc()
+        _TRANSFER_BYTES.labels(operation).inc(record['bytes'])
+        _TRANSFER_STALL_SECONDS.labels(operation).inc(record['stall_time'])
+        _TRANSFER_SECONDS.labels(operation).observe(record['duration'])
+        if outcome == "ok":
+            self.completed += 1
+        else:
+            self.failed += 1
+
+        from helpers.files import get_readable_file_size
+        LOGGER(__name__).info(
+            f"[TRANSFER] {record['operation']} {outcome}: {record['file_name'] or 'unknown'} "
+            f"{get_readable_file_size(record['bytes'])} in {record['duration']}s "
+            f"(avg {get_readable_file_size(record['avg_speed'])}/s, "
+            f"last {RATE_WINDOW_SECONDS:g}s {get_readable_file_size(record['window_speed'])}/s, "
+            f"p50 {record['chunk_latency_p50']}s, p95 {record['chunk_latency_p95']}s, "
+            f"stalled {record['stall_time']}s)"
+        )
+        return record
+
+    def get_recent(self, limit: int = 10) -> List[Dict]:
+        return list(self.recent)[-limit:]
+
+    def get_summary(self) -> Dict:
+        records = list(self.recent)
+        ok = [r for r in records if r['outcome'] == 'ok' and r['duration'] > 0]
+        return {
+            'completed': self.completed,
+            'failed': self.failed,
+            'recent_avg_speed': round(sum(r['avg_speed'] for r in ok) / len(ok), 1) if ok else 0.0,
+            'recent_stall_time': round(sum(r['stall_time'] for r in records), 2),
+        }
+
+
+class ProgressReporter:
+    """
+    Sync Pyrogram progress callback backed by a TransferRateEstimator.
+
+    Pyrogram runs sync callbacks in its executor thread, so a call only feeds
+    the estimator. The Telegram message is edited from the event loop by a
+    refresher task every PROGRESS_REFRESH_SECONDS whether or not chunks arrive,
+    so a stall shows up as a falling windowed rate. The task ends once the
+    estimator is recorded or the reporter is dropped.
+    """
+    __slots__ = ('progress_message', 'label', 'estimator', '__weakref__')
+
+    def __init__(self, progress_message, label: str, estimator: TransferRateEstimator):
+        self.progress_message = progress_message
+        self.label = label
+        self.estimator = estimator
+
+    def __call__(self, current, total):
+        try:
+            self.estimator.update(current, total)
+        except Exception:
+            pass
+
+    def render(self, now: float) -> Optional[str]:
+        """Progress text at `now` (None before the first chunk)"""
+        estimator = self.estimator
+        if estimator.total <= 0 or estimator.chunks == 0:
+            return None
+        percent = min(100, int(estimator.last_bytes / estimator.total * 100))
+        speed_mbps = estimator.current_speed() / 1024 / 1024
+        window_mbps = estimator.window_speed(now) / 1024 / 1024
+        remaining_time = estimator.eta()
+        eta_str = f"{int(remaining_time)}s" if remaining_time < 60 else f"{int(remaining_time / 60)}m"
+        text = (
+            f"**{self.label}: {percent}%**\n"
+            f"Speed: {speed_mbps:.1f} MB/s (last {RATE_WINDOW_SECONDS:g}s: {window_mbps:.1f} MB/s)\n"
+            f"ETA: {eta_str}"
+        )
+        idle = now - estimator.last_time
+        if idle > STALL_THRESHOLD_SECONDS:
+            text += f"\nNo data for {int(idle)}s"
+        return text
+
+
+async def _refresh_progress(reporter_ref, estimator: TransferRateEstimator):
+    """Edit the progress message on a timer until the transfer is recorded or abandoned"""
+    import asyncio
+    from rate_governor import rate_governor
+    last_text = None
+    while True:
+        await asyncio.sleep(PROGRESS_REFRESH_SECONDS)
+        reporter = reporter_ref()
+        if reporter is None or estimator.finished:
+            return
+        text = reporter.render(time())
+        progress_message = reporter.progress_message
+        # Don't keep the reporter alive across the edit
+        del reporter
+        if text and text != last_text:
+            last_text = text
+            await rate_governor.try_call(progress_message.edit_text, text)
+
+
+def create_progress_reporter(progress_message, label: str, operation: str,
+                             file_name: Optional[str] = None, user_id: Optional[int] = None,
+                             start_time: Optional[float] = None) -> ProgressReporter:
+    """
+    Build a progress callback with a fresh estimator attached as .estimator.
+    Call from the event loop: it starts the task that edits progress_message.
+    """
+    estimator = transfer_metrics.start(operation, 0, file_name, user_id, start_time or time())
+    reporter = ProgressReporter(progress_message, label, estimator)
+    if progress_message:
+        try:
+            import asyncio
+            import weakref
+            asyncio.create_task(_refresh_progress(weakref.ref(reporter), estimator))
+        except RuntimeError as e:
+            LOGGER(__name__).warning(f"No event loop for progress updates of {file_name or operation}: {e}")
+    return reporter
+
+
+# Global transfer metrics instance
+transfer_metrics = TransferMetrics()
@@ -6,9 +6,8 @@ import gc
 import asyncio
 from time import time
 from logger import LOGGER
-from typing import Optional
-from asyncio.subprocess import PIPE
-from asyncio import create_subprocess_exec, create_subprocess_shell, wait_for
+from typing import Optional, Tuple
+from dataclasses import dataclass
 
 def get_intra_request_delay(is_premium):
     """
@@ -40,88 +39,57 @@ from helpers.transfer import download_media_fast
 # Ultra-minimal progress template (near-zero RAM)
 # No string formatting needed - computed inline
 
-async def cmd_exec(cmd, shell=False):
-    if shell:
-        proc = await create_subprocess_shell(cmd, stdout=PIPE, stderr=PIPE)
-    else:
-        proc = await create_subprocess_exec(*cmd, stdout=PIPE, stderr=PIPE)
-    stdout, stderr = await proc.communicate()
-    try:
-        stdout = stdout.decode().strip()
-    except:
-        stdout = "Unable to decode the response!"
-    try:
-        stderr = stderr.decode().strip()
-    except:
-        stderr = "Unable to decode the error!"
-    return stdout, stderr, proc.returncode
+def pick_source_thumbnail(thumbs):
+    """
+    Choose the Telegram-provided thumbnail to reuse: the largest one that still fits
+    Telegram's 320px thumbnail limit, otherwise the smallest available.
+    """
+    if not thumbs:
+        return None
+    fitting = [t for t in thumbs if max(getattr(t, 'width', 0) or 0, getattr(t, 'height', 0) or 0) <= 320]
+    if fitting:
+        return max(fitting, key=lambda t: (t.width or 0) * (t.height or 0))
+    return min(thumbs, key=lambda t: getattr(t, 'file_size', 0) or 0)
 
 
-async def has_video_stream(video_path):
+async def download_source_thumbnail(client, source_message, thumb_path):
     """
-    Check if a file has a video stream using ffprobe.
-    Properly handles process cleanup to prevent resource leaks.
-    
-    Returns:
-        tuple: (has_video: bool, duration: float or None, error_msg: str or None)
+    Fast path: fetch the thumbnail Telegram already generated for the source media
+    (a few KB, no decoding). Returns the path or None if the source has no thumbnail.
     """
-    proc = None
+    if not client or not source_message:
+        return None
+    media = (
+        getattr(source_message, 'video', None)
+        or getattr(source_message, 'animation', None)
+        or getattr(source_message, 'audio', None)
+        or getattr(source_message, 'document', None)
+    )
+    thumb = pick_source_thumbnail(getattr(media, 'thumbs', None) if media else None)
+    if not thumb:
+        return None
     try:
-        cmd = [
-            "ffprobe", "-v", "error", "-select_streams", "v:0",
-            "-show_entries", "stream=codec_type,duration",
-            "-of", "csv=p=0", video_path
-        ]
-        proc = await create_subprocess_exec(*cmd, stdout=PIPE, stderr=PIPE)
-        
-        try:
-            stdout, stderr = await wait_for(proc.communicate(), timeout=10.0)
-        except asyncio.TimeoutError:
-            if proc:
-                try:
-                    proc.kill()
-                    await asyncio.wait_for(proc.wait(), timeout=2.0)
-                except:
-                    pass
-            return False, None, "ffprobe timed out"
-        
-        stdout_str = stdout.decode().strip() if stdout else ""
-        stderr_str = stderr.decode().strip() if stderr else ""
-        
-        if proc.returncode != 0 or not stdout_str:
-            if stderr_str:
-                pass
-            return False, None, stderr_str or "No video stream found"
-        
-        parts = stdout_str.split(',')
-        if parts and 'video' in str(parts[0]).lower():
-            duration = None
-            if len(parts) > 1 and parts[1] and parts[1] != 'N/A':
-                try:
-                    duration = float(parts[1])
-                except ValueError:
-                    pass
-            return True, duration, None
-        return False, None, "No video stream detected"
+        path = await client.download_media(thumb.file_id, file_name=thumb_path)
+        if path and os.path.exists(path) and os.path.getsize(path) > 0:
+            return path
     except Exception as e:
-        if proc and proc.returncode is None:
-            try:
-                proc.kill()
-                await asyncio.wait_for(proc.wait(), timeout=2.0)
-            except:
-                pass
-        return False, None, str(e)
+        LOGGER(__name__).info(f"Source thumbnail unavailable, falling back to ffmpeg: {e}")
+    return None
 
 
-async def generate_thumbnail(video_path, thumb_path=None, duration=None):
+async def generate_thumbnail(video_path, thumb_path=None, duration=None, source_client=None, source_message=None):
     """
-    Generate a thumbnail from a video file using ffmpeg.
-    Multi-pass approach with proper resource cleanup to prevent hangs and leaks.
+    Generate a thumbnail for a video.
+    Uses the source message's Telegram thumbnail when available, otherwise ffmpeg
+    (multi-pass) through the shared ffmpeg pool so concurrent downloads can't
+    start unbounded decoders.
     
     Args:
         video_path: Path to the video file
-        thumb_path: Optional path for thumbnail. If None, uses video_path + ".jpg"
+        thumb_path: Optional path for thumbnail. If None, uses video_path + ".thumb.jpg"
         duration: Optional video duration in seconds (for calculating middle frame)
+        source_client: Client that fetched source_message (for the fast path)
+        source_message: Original Telegram message the video was downloaded from
     
     Returns:
         str: Path to generated thumbnail, or None if failed
@@ -129,13 +97,19 @@ async def generate_thumbnail(video_path, thumb_path=None, duration=None):
     if thumb_path is None:
         thumb_path = video_path + ".thumb.jpg"
     
-    has_video, probe_duration, error_msg = await has_video_stream(video_path)
-    if not has_video:
-        LOGGER(__name__).info(f"Skipping thumbnail for {os.path.basename(video_path)}: {error_msg}")
+    fast_thumb = await download_source_thumbnail(source_client, source_message, thumb_path)
+    if fast_thumb:
+        return fast_thumb
+    
+    # Shared, cached ffprobe result (send_media usually probed this file already)
+    from helpers.media_probe import media_probe
+    info = await media_probe.probe(video_path)
+    if not info or not info.has_video:
+        LOGGER(__name__).info(f"Skipping thumbnail for {os.path.basename(video_path)}: no video stream")
         return None
     
-    if probe_duration and not duration:
-        duration = probe_duration
+    if info.duration and not duration:
+        duration = info.duration
     
     file_size = 0
     try:
@@ -181,56 +155,20 @@ async def generate_thumbnail(video_path, thumb_path=None, duration=None):
         }
     ]
     
+    from helpers.ffmpeg_pool import ffmpeg_pool
+    
     for strategy in strategies:
-        proc = None
+        # Smaller files are released from the queue first
+        result = await ffmpeg_pool.run(strategy["cmd"], strategy["timeout"], cost=file_size)
+        if result is None or result[0] != 0:
+            continue
         try:
-            proc = await create_subprocess_exec(*strategy["cmd"], stdout=PIPE, stderr=PIPE)
-            
-            try:
-                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=strategy["timeout"])
-            except asyncio.TimeoutError:
-                if proc:
-                    try:
-                        proc.kill()
-                        await asyncio.wait_for(proc.wait(), timeout=3.0)
-                    except Exception as kill_err:
-                        pass
-                continue
-            
-            if proc.returncode == 0:
-                try:
-                    if os.path.exists(thumb_path):
-                        thumb_size = os.path.getsize(thumb_path)
-                        if thumb_size > 0:
-                            return thumb_path
-                        else:
-                            try:
-                                os.remove(thumb_path)
-                            except:
-                                pass
-                except OSError as e:
-                    pass
-            else:
-                stderr_str = stderr.decode().strip() if stderr else ""
-                if stderr_str and len(stderr_str) > 0:
-                    pass
-        except Exception as e:
-            if proc:
-                try:
-                    if proc.returncode is None:
-                        proc.kill()
-                        await asyncio.wait_for(proc.wait(), timeout=2.0)
-                except:
-                    pass
-        finally:
-            if proc and proc.returncode is None:
-                try:
-                    proc.kill()
-                    await asyncio.wait_for(proc.wait(), timeout=2.0)
-                except Exception as cleanup_err:
-                    pass
-                finally:
-                    proc = None
+            if os.path.exists(thumb_path):
+                if os.path.getsize(thumb_path) > 0:
+                    return thumb_path
+                os.remove(thumb_path)
+        except OSError:
+            pass
     
     LOGGER(__name__).warning(f"Thumbnail generation failed: {os.path.basename(video_path)}")
     try:
@@ -241,64 +179,6 @@ async def generate_thumbnail(video_path, thumb_path=None, duration=None):
     return None
 
 
-async def get_media_info(path):
-    try:
-        result = await cmd_exec([
-            "ffprobe", "-hide_banner", "-loglevel", "error",
-            "-print_format", "json", "-show_format", "-show_streams", path,
-        ])
-    except Exception as e:
-        return 0, None, None
-    
-    if result[0] and result[2] == 0:
-        try:
-            try:
-                import orjson
-                data = orjson.loads(result[0])
-            except ImportError:
-                import json
-                data = json.loads(result[0])
-        except Exception as e:
-            LOGGER(__name__).error(f"Failed to parse ffprobe JSON: {e}")
-            return 0, None, None
-        
-        duration = 0
-        artist = None
-        title = None
-        
-        # Try to get duration from format first
-        format_info = data.get("format", {})
-        if format_info:
-            try:
-                duration_str = format_info.get("duration", "0")
-                if duration_str and duration_str != "N/A":
-                    duration = round(float(duration_str))
-            except (ValueError, TypeError):
-                pass
-            
-            # Get tags from format
-            tags = format_info.get("tags", {})
-            artist = tags.get("artist") or tags.get("ARTIST") or tags.get("Artist")
-            title = tags.get("title") or tags.get("TITLE") or tags.get("Title")
-        
-        # If format duration is 0 or missing, try to get from video stream
-        if duration == 0:
-            streams = data.get("streams", [])
-            for stream in streams:
-                if stream.get("codec_type") == "video":
-                    try:
-                        stream_duration = stream.get("duration")
-                        if stream_duration and stream_duration != "N/A":
-                            duration = round(float(stream_duration))
-                            LOGGER(__name__).info(f"Got duration from video stream: {duration}s")
-                            break
-                    except (ValueError, TypeError):
-                        continue
-        
-        return duration, artist, title
-    return 0, None, None
-
-
 # Progress Throttle Helper to prevent Telegram API rate limits
 class ProgressThrottle:
     """
@@ -329,6 +209,23 @@ class ProgressThrottle:
         if stale_keys:
             pass
     
+    def _get_entry(self, message_id, now):
+        if message_id not in self.message_throttles:
+            from helpers.transfer_stats import TransferRateEstimator
+            self.message_throttles[message_id] = {
+                'last_update_time': 0,
+                'last_percentage': 0,
+                'estimator': TransferRateEstimator("progress", start_time=now),
+                'rate_limited': False,
+                'backoff_duration': 5,  # Start with 5 seconds
+                'cooldown_until': 0
+            }
+        return self.message_throttles[message_id]
+    
+    def observe(self, message_id, current, total, now):
+        """Feed every chunk into the speed estimator (O(1), no message edits)"""
+        self._get_entry(message_id, now)['estimator'].update(current, total, now)
+    
     def should_update(self, message_id, current, total, now):
         """
         Determine if progress should be updated based on throttle rules.
@@ -341,18 +238,7 @@ class ProgressThrottle:
         """
         self._sweep_stale_entries(now)
         
-        if message_id not in self.message_throttles:
-            self.message_throttles[message_id] = {
-                'last_update_time': 0,
-                'last_percentage': 0,
-                'last_bytes': 0,
-                'last_speed_time': now,
-                'rate_limited': False,
-                'backoff_duration': 5,  # Start with 5 seconds
-                'cooldown_until': 0
-            }
-        
-        throttle = self.message_throttles[message_id]
+        throttle = self._get_entry(message_id, now)
         percentage = (current / total) * 100 if total > 0 else 0
         
         # Always allow 100% completion
@@ -373,22 +259,18 @@ class ProgressThrottle:
     
     def get_current_speed(self, message_id, current, now):
         """
-        Calculate current transfer speed based on bytes transferred since last update.
-        Returns speed in bytes per second.
+        Smoothed (EWMA) transfer speed in bytes per second.
+        Returns 0 if no chunks have been observed for this message yet.
         """
         if message_id not in self.message_throttles:
             return 0
-        
-        throttle = self.message_throttles[message_id]
-        last_bytes = throttle.get('last_bytes', 0)
-        last_time = throttle.get('last_speed_time', now)
-        
-        time_diff = now - last_time
-        bytes_diff = current - last_bytes
-        
-        if time_diff > 0 and bytes_diff > 0:
-            return bytes_diff / time_diff
-        return 0
+        return self.message_throttles[message_id]['estimator'].current_speed()
+    
+    def get_eta(self, message_id):
+        """Seconds remaining at the smoothed speed (0 when unknown)"""
+        if message_id not in self.message_throttles:
+            return 0
+        return self.message_throttles[message_id]['estimator'].eta()
     
     def mark_updated(self, message_id, percentage, now, current_bytes=0):
         """Mark that an update was successfully sent"""
@@ -396,21 +278,23 @@ class ProgressThrottle:
             throttle = self.message_throttles[message_id]
             throttle['last_update_time'] = now
             throttle['last_percentage'] = percentage
-            throttle['last_bytes'] = current_bytes
-            throttle['last_speed_time'] = now
             # Reset backoff on successful update
             throttle['rate_limited'] = False
             throttle['backoff_duration'] = 5
     
-    def mark_rate_limited(self, message_id, now):
-        """Mark that we hit a rate limit and implement exponential backoff"""
+    def mark_rate_limited(self, message_id, now, wait_seconds=None):
+        """
+        Mark that we hit a rate limit. Uses the exact FloodWait duration when known,
+        otherwise exponential backoff.
+        """
         if message_id in self.message_throttles:
             throttle = self.message_throttles[message_id]
             throttle['rate_limited'] = True
             # Exponential backoff: 5s -> 10s -> 20s -> 40s -> 60s (max)
             throttle['backoff_duration'] = min(throttle['backoff_duration'] * 2, 60)
-            throttle['cooldown_until'] = now + throttle['backoff_duration']
-            LOGGER(__name__).info(f"Rate limited - backing off for {throttle['backoff_duration']}s")
+            pause = wait_seconds if wait_seconds is not None else throttle['backoff_duration']
+            throttle['cooldown_until'] = now + pause
+            LOGGER(__name__).info(f"Rate limited - backing off for {pause}s")
     
     def cleanup(self, message_id):
         """Remove throttle data when done"""
@@ -446,12 +330,13 @@ async def safe_progress_callback(current, total, *args):
         percentage = (current / total) * 100 if total > 0 else 0
         message_id = progress_message.id
         
+        # Every chunk feeds the EWMA estimator, even when the message isn't edited
+        _progress_throttle.observe(message_id, current, total, now)
+        
         # Check throttle - only update if allowed
         if not _progress_throttle.should_update(message_id, current, total, now):
             return
         
-        # Calculate current speed based on bytes transferred since last update
-        # This gives accurate real-time speed instead of average speed
         current_speed = _progress_throttle.get_current_speed(message_id, current, now)
         
         # Fallback to average speed if no previous data (first update)
@@ -459,8 +344,9 @@ async def safe_progress_callback(current, total, *args):
         if current_speed == 0 and elapsed_time > 0:
             current_speed = current / elapsed_time
         
-        # Calculate ETA based on current speed
-        eta = (total - current) / current_speed if current_speed > 0 else 0
+        eta = _progress_throttle.get_eta(message_id)
+        if eta == 0 and current_speed > 0:
+            eta = (total - current) / current_speed
         
         # Import here to avoid circular dependency
         from helpers.files import get_readable_file_size, get_readable_time
@@ -480,6 +366,11 @@ async def safe_progress_callback(current, total, *args):
         # Visual format with progress bar
         progress_text = f"**{action}** `{pct}%`\n{progress_bar}\n{get_readable_file_size(current)}/{get_readable_file_size(total)} • {get_readable_file_size(current_speed)}/s • {get_readable_time(int(eta))}"
         
+        # Progress edits yield to user-facing sends when the bot is near its rate limit
+        from rate_governor import rate_governor, Priority
+        if not rate_governor.try_acquire(getattr(progress_message, '_client', None), "edit_message_text", progress_message.chat.id, Priority.PROGRESS_EDIT):
+            return
+        
         # Try to update message
         await progress_message.edit(progress_text)
         # Mark successful update with current bytes for next speed calculation
@@ -487,13 +378,16 @@ async def safe_progress_callback(current, total, *args):
             
     except Exception as e:
         error_str = str(e).lower()
+        from rate_governor import rate_governor
+        wait_seconds, wait_kind = rate_governor.parse_wait(e)
         
         # Check if it's a rate limit error
-        if 'wait of' in error_str and 'seconds is required' in error_str:
-            # This is a rate limit error - mark it and back off
+        if wait_seconds is not None:
+            # Pause exactly as long as Telegram asked
             if progress_message:
-                _progress_throttle.mark_rate_limited(progress_message.id, time())
-            LOGGER(__name__).warning(f"Rate limited by Telegram API - backing off")
+                _progress_throttle.mark_rate_limited(progress_message.id, time(), wait_seconds)
+                rate_governor.note_wait(getattr(progress_message, '_client', None), "edit_message_text",
+                                        progress_message.chat.id, wait_seconds, wait_kind)
         # Silently ignore errors related to deleted or invalid messages
         elif any(err in error_str for err in ['message_id_invalid', 'message not found', 'message to edit not found', 'message can\'t be edited']):
             pass
@@ -539,12 +433,17 @@ async def forward_to_dump_channel(bot, sent_message, user_id, caption=None, sour
         
         # Use copy_message to avoid "forwarded from" tag, with new caption containing tracking info
         try:
-            await bot.copy_message(
-                chat_id=channel_id,
-                from_chat_id=sent_message.chat.id,
-                message_id=sent_message.id,
-                caption=dump_caption
-            )
+            from rate_governor import rate_governor, Priority
+            from tracing import tracer
+            async with tracer.span("dump_forward"):
+                await rate_governor.call(
+                    bot.copy_message,
+                    chat_id=channel_id,
+                    from_chat_id=sent_message.chat.id,
+                    message_id=sent_message.id,
+                    caption=dump_caption,
+                    priority=Priority.DUMP_COPY
+                )
             LOGGER(__name__).info(f"[DUMP_CHANNEL] ✅ Media copied to dump channel for user {user_id}")
                 
         except Exception as copy_error:
@@ -559,338 +458,154 @@ def progressArgs(action: str, progress_message, start_time):
     return (action, progress_message, start_time)
 
 
+@dataclass(frozen=True)
+class SendSpec:
+    """How to upload one media type: the Pyrogram send method and what it accepts"""
+    method: str
+    file_arg: str
+    caption: bool = True
+    # upload kwarg -> MediaAttributes field
+    attributes: Tuple[Tuple[str, str], ...] = ()
+    # 'generate' (Telegram thumb, else ffmpeg), 'source' (Telegram thumb only) or None
+    thumb: Optional[str] = None
+    extra: Tuple[Tuple[str, object], ...] = ()
+
+
+SEND_SPECS = {
+    "photo": SendSpec("send_photo", "photo"),
+    "video": SendSpec(
+        "send_video", "video",
+        attributes=(("duration", "duration"), ("width", "width"), ("height", "height")),
+        thumb="generate",
+        extra=(("supports_streaming", True),),
+    ),
+    "audio": SendSpec(
+        "send_audio", "audio",
+        attributes=(("duration", "duration"), ("performer", "artist"), ("title", "title")),
+        thumb="source",
+    ),
+    "document": SendSpec("send_document", "document", thumb="source"),
+    "voice": SendSpec("send_voice", "voice", attributes=(("duration", "duration"),)),
+    "video_note": SendSpec("send_video_note", "video_note", caption=False, attributes=(("duration", "duration"),)),
+    "animation": SendSpec("send_animation", "animation", attributes=(("duration", "duration"),)),
+    "sticker": SendSpec("send_sticker", "sticker", caption=False),
+}
+
+
+async def _prepare_thumbnail(spec, media_path, duration, source_client, source_message):
+    thumb_path = media_path + ".thumb.jpg"
+    try:
+        if spec.thumb == "generate":
+            return await generate_thumbnail(
+                media_path, thumb_path, duration=duration,
+                source_client=source_client, source_message=source_message
+            )
+        if spec.thumb == "source":
+            return await download_source_thumbnail(source_client, source_message, thumb_path)
+    except Exception as e:
+        LOGGER(__name__).warning(f"Thumbnail preparation failed for {os.path.basename(media_path)}: {e}")
+    return None
+
+
 async def send_media(
-    bot, message, media_path, media_type, caption, progress_message, start_time, user_id=None, source_url=None
+    bot, message, media_path, media_type, caption, progress_message, start_time, user_id=None, source_url=None,
+    source_client=None, source_message=None
 ):
     """Upload media with all safeguards (size checks, fast uploads, thumbnails, dump channel).
     
+    Every media type goes through the same upload core; SEND_SPECS only describes
+    which send method to call and which attributes/thumbnail it takes.
+    
     Args:
         source_url: Original download URL for tracking in dump channel (no extra RAM usage)
+        source_client/source_message: Where the file came from - uploads reuse its
+            duration/dimensions/tags and Telegram's own thumbnail, so the downloaded
+            file is only probed (ffprobe) or decoded (ffmpeg) when the source lacks them
     
     Returns:
         bool: True if upload succeeded, False if it was rejected or failed
     """
+    spec = SEND_SPECS.get(media_type)
+    if spec is None:
+        LOGGER(__name__).error(f"Unsupported media type for upload: {media_type}")
+        return False
+
     file_size = os.path.getsize(media_path)
 
     if not await fileSizeLimit(file_size, message, "upload"):
         return False
 
     from memory_monitor import memory_monitor
-    memory_monitor.log_memory_snapshot("Upload Start", f"User {user_id or 'unknown'}: {os.path.basename(media_path)} ({media_type})", silent=True)
-    
-    progress_args = progressArgs("📤 Uploading", progress_message, start_time)
+    from helpers.media_probe import media_probe, MediaAttributes
+    from helpers.transfer import upload_media_fast
+    from helpers.transfer_stats import create_progress_reporter, transfer_metrics
+    from rate_governor import rate_governor, Priority
+    from tracing import tracer
+    file_name = os.path.basename(media_path)
+    memory_monitor.log_memory_snapshot("Upload Start", f"User {user_id or 'unknown'}: {file_name} ({media_type})", silent=True)
+
+    # Duration/dimensions/tags from the source message, ffprobe only if missing
+    attrs = MediaAttributes()
+    if spec.attributes:
+        async with tracer.span("media_info"):
+            attrs = await media_probe.resolve(media_path, media_type, source_message)
+
+    thumb_path = None
+    if spec.thumb:
+        async with tracer.span("thumbnail", source=spec.thumb) as span:
+            thumb_path = await _prepare_thumbnail(spec, media_path, attrs.duration, source_client, source_message)
+            if not thumb_path:
+                span.outcome = "none"
+
+    # Sync upload progress callback backed by the EWMA speed estimator
+    upload_progress = create_progress_reporter(
+        progress_message, "📤 Uploading", "upload",
+        file_name=file_name, user_id=user_id
+    )
+
+    try:
+        fast_file = await upload_media_fast(bot, media_path, progress_callback=None)
 
-    # Create sync upload progress callback with throttling
-    last_update = {"time": time(), "percent": 0}
-    def create_upload_progress_callback():
-        def upload_progress(current, total):
+        send_kwargs = {
+            spec.file_arg: fast_file if fast_file else media_path,
+            "progress": upload_progress,
+        }
+        if spec.caption:
+            send_kwargs["caption"] = caption or ""
+        # Only pass attributes that are actually known
+        for kwarg, field_name in spec.attributes:
+            value = getattr(attrs, field_name)
+            if value:
+                send_kwargs[kwarg] = value
+        if thumb_path and os.path.exists(thumb_path):
+            send_kwargs["thumb"] = thumb_path
+        send_kwargs.update(spec.extra)
+
+        # User-facing sends go first through the rate governor (FloodWait is waited out and retried)
+        async with tracer.span(spec.method, media_type=media_type) as span:
+            span.bytes = file_size
+            sent_message = await rate_governor.call(
+                getattr(bot, spec.method), message.chat.id,
+                priority=Priority.USER_SEND, **send_kwargs
+            )
+    except Exception as e:
+        transfer_metrics.record(upload_progress.estimator, "failed")
+        LOGGER(__name__).error(f"Upload failed ({media_type}) {file_name}: {e}")
+        raise
+    finally:
+        if thumb_path and os.path.exists(thumb_path):
             try:
-                if total > 0 and progress_message:
-                    now = time()
-                    percent = int((current / total) * 100)
-                    elapsed = now - start_time
-                    
-                    # Throttle updates: only update if 5+ seconds passed OR 10% progress changed OR complete
-                    should_update = (
-                        (now - last_update["time"] >= 5) or  # 5 seconds minimum between updates
-                        (percent - last_update["percent"] >= 10) or  # 10% progress change
-                        (percent == 100)  # Always show completion
-                    )
-                    
-                    if should_update and elapsed > 0:
-                        last_update["time"] = now
-                        last_update["percent"] = percent
-                        
-                        speed_mbps = (current / elapsed) / 1024 / 1024
-                        remaining_time = (total - current) / (current / elapsed) if current > 0 else 0
-                        eta_str = f"{int(remaining_time)}s" if remaining_time < 60 else f"{int(remaining_time / 60)}m"
-                        try:
-                            import asyncio
-                            asyncio.create_task(progress_message.edit_text(
-                                f"**📤 Uploading: {percent}%**\n"
-                                f"Speed: {speed_mbps:.1f} MB/s\n"
-                                f"ETA: {eta_str}"
-                            ))
-                        except:
-                            pass
-            except:
+                os.remove(thumb_path)
+            except Exception:
                 pass
-        return upload_progress
 
-    if media_type == "photo":
-        from helpers.transfer import upload_media_fast
-        
-        fast_file = await upload_media_fast(
-            bot, 
-            media_path, 
-            progress_callback=None
-        )
-        
-        sent_message = None
-        if fast_file:
-            # FastPyrogram upload: Use explicit filename to preserve extension
-            sent_message = await bot.send_photo(
-                message.chat.id,
-                photo=fast_file,
-                caption=caption or "",
-                progress=create_upload_progress_callback()
-            )
-        else:
-            sent_message = await bot.send_photo(
-                message.chat.id,
-                photo=media_path,
-                caption=caption or "",
-                progress=create_upload_progress_callback()
-            )
-        
-        # Forward to dump channel if configured (RAM-efficient, no re-upload)
-        if user_id and sent_message:
-            await forward_to_dump_channel(bot, sent_message, user_id, caption, source_url)
-        
-        memory_monitor.log_memory_snapshot("Upload Complete", f"User {user_id or 'unknown'}: {os.path.basename(media_path)} (photo)", silent=True)
-        return True
-    elif media_type == "video":
-        # Get video duration and dimensions
-        try:
-            media_info = await get_media_info(media_path)
-            duration = media_info[0] if media_info and len(media_info) > 0 else None
-        except:
-            duration = None
-        
-        # Default video dimensions (only include if values are valid)
-        width = 480 if duration and duration > 0 else None
-        height = 320 if duration and duration > 0 else None
-        
-        # Generate thumbnail for the video
-        thumb_path = None
-        try:
-            thumb_path = await generate_thumbnail(media_path, duration=duration)
-        except:
-            thumb_path = None
-        
-        sent_message = None
-        try:
-            from helpers.transfer import upload_media_fast
-            
-            fast_file = await upload_media_fast(
-                bot,
-                media_path,
-                progress_callback=None
-            )
-            
-            # Build send_video kwargs only with non-None values
-            send_kwargs = {
-                "chat_id": message.chat.id,
-                "video": fast_file if fast_file else media_path,
-                "caption": caption or "",
-                "progress": create_upload_progress_callback(),
-                "supports_streaming": True
-            }
-            
-            # Only add optional parameters if they're not None
-            if duration and duration > 0:
-                send_kwargs["duration"] = int(duration)
-            if width and width > 0:
-                send_kwargs["width"] = width
-            if height and height > 0:
-                send_kwargs["height"] = height
-            if thumb_path and os.path.exists(thumb_path):
-                send_kwargs["thumb"] = thumb_path
-            
-            sent_message = await bot.send_video(**send_kwargs)
-        except Exception as e:
-            LOGGER(__name__).error(f"Upload failed: {e}")
-            raise
-        finally:
-            # Clean up thumbnail file
-            if thumb_path and os.path.exists(thumb_path):
-                try:
-                    os.remove(thumb_path)
-                except Exception:
-                    pass
-        
-        # Forward to dump channel if upload was successful (RAM-efficient, no re-upload)
-        if user_id and sent_message:
-            await forward_to_dump_channel(bot, sent_message, user_id, caption, source_url)
-        
-        memory_monitor.log_memory_snapshot("Upload Complete", f"User {user_id or 'unknown'}: {os.path.basename(media_path)} (video)", silent=True)
-        return True
-    elif media_type == "audio":
-        duration, artist, title = await get_media_info(media_path)
-        
-        from helpers.transfer import upload_media_fast
-        
-        fast_file = await upload_media_fast(
-            bot,
-            media_path,
-            progress_callback=None
-        )
-        
-        sent_message = None
-        if fast_file:
-            # FastPyrogram upload: Use explicit filename to preserve extension
-            sent_message = await bot.send_audio(
-                message.chat.id,
-                audio=fast_file,
-                duration=duration if duration and duration > 0 else None,
-                performer=artist,
-                title=title,
-                caption=caption or "",
-                progress=create_upload_progress_callback()
-            )
-        else:
-            sent_message = await bot.send_audio(
-                message.chat.id,
-                audio=media_path,
-                duration=duration if duration and duration > 0 else None,
-                performer=artist,
-                title=title,
-                caption=caption or "",
-                progress=create_upload_progress_callback()
-            )
-        
-        # Forward to dump channel if configured (RAM-efficient, no re-upload)
-        if user_id and sent_message:
-            await forward_to_dump_channel(bot, sent_message, user_id, caption, source_url)
-        
-        memory_monitor.log_memory_snapshot("Upload Complete", f"User {user_id or 'unknown'}: {os.path.basename(media_path)} (audio)", silent=True)
-        return True
-    elif media_type == "document":
-        from helpers.transfer import upload_media_fast
-        
-        fast_file = await upload_media_fast(
-            bot,
-            media_path,
-            progress_callback=None
-        )
-        
-        sent_message = None
-        if fast_file:
-            # FastPyrogram upload: Use explicit filename to preserve extension
-            sent_message = await bot.send_document(
-                message.chat.id,
-                document=fast_file,
-                caption=caption or "",
-                progress=create_upload_progress_callback()
-            )
-        else:
-            sent_message = await bot.send_document(
-                message.chat.id,
-                document=media_path,
-                caption=caption or "",
-                progress=create_upload_progress_callback()
-            )
-        
-        # Forward to dump channel if configured (RAM-efficient, no re-upload)
-        if user_id and sent_message:
-            await forward_to_dump_channel(bot, sent_message, user_id, caption, source_url)
-        
-        memory_monitor.log_memory_snapshot("Upload Complete", f"User {user_id or 'unknown'}: {os.path.basename(media_path)} (document)", silent=True)
-        return True
-    elif media_type == "voice":
-        from helpers.transfer import upload_media_fast
-        duration, _, _ = await get_media_info(media_path)
-        
-        fast_file = await upload_media_fast(bot, media_path, progress_callback=None)
-        sent_message = None
-        if fast_file:
-            sent_message = await bot.send_voice(
-                message.chat.id,
-                voice=fast_file,
-                duration=duration if duration and duration > 0 else None,
-                caption=caption or "",
-                progress=create_upload_progress_callback()
-            )
-        else:
-            sent_message = await bot.send_voice(
-                message.chat.id,
-                voice=media_path,
-                duration=duration if duration and duration > 0 else None,
-                caption=caption or "",
-                progress=create_upload_progress_callback()
-            )
-        
-        if user_id and sent_message:
-            await forward_to_dump_channel(bot, sent_message, user_id, caption, source_url)
-        
-        memory_monitor.log_memory_snapshot("Upload Complete", f"User {user_id or 'unknown'}: {os.path.basename(media_path)} (voice)", silent=True)
-        return True
-    elif media_type == "video_note":
-        duration, _, _ = await get_media_info(media_path)
-        
-        from helpers.transfer import upload_media_fast
-        fast_file = await upload_media_fast(bot, media_path, progress_callback=None)
-        sent_message = None
-        if fast_file:
-            sent_message = await bot.send_video_note(
-                message.chat.id,
-                video_note=fast_file,
-                duration=duration if duration and duration > 0 else None,
-                progress=create_upload_progress_callback()
-            )
-        else:
-            sent_message = await bot.send_video_note(
-                message.chat.id,
-                video_note=media_path,
-                duration=duration if duration and duration > 0 else None,
-                progress=create_upload_progress_callback()
-            )
-        
-        if user_id and sent_message:
-            await forward_to_dump_channel(bot, sent_message, user_id, None, source_url)
-        
-        memory_monitor.log_memory_snapshot("Upload Complete", f"User {user_id or 'unknown'}: {os.path.basename(media_path)} (video_note)", silent=True)
-        return True
-    elif media_type == "animation":
-        duration, _, _ = await get_media_info(media_path)
-        
-        from helpers.transfer import upload_media_fast
-        fast_file = await upload_media_fast(bot, media_path, progress_callback=None)
-        sent_message = None
-        if fast_file:
-            sent_message = await bot.send_animation(
-                message.chat.id,
-                animation=fast_file,
-                duration=duration if duration and duration > 0 else None,
-                caption=caption or "",
-                progress=create_upload_progress_callback()
-            )
-        else:
-            sent_message = await bot.send_animation(
-                message.chat.id,
-                animation=media_path,
-                duration=duration if duration and duration > 0 else None,
-                caption=caption or "",
-                progress=create_upload_progress_callback()
-            )
-        
-        if user_id and sent_message:
-            await forward_to_dump_channel(bot, sent_message, user_id, caption, source_url)
-        
-        memory_monitor.log_memory_snapshot("Upload Complete", f"User {user_id or 'unknown'}: {os.path.basename(media_path)} (animation)", silent=True)
-        return True
-    elif media_type == "sticker":
-        from helpers.transfer import upload_media_fast
-        fast_file = await upload_media_fast(bot, media_path, progress_callback=None)
-        sent_message = None
-        if fast_file:
-            sent_message = await bot.send_sticker(
-                message.chat.id,
-                sticker=fast_file,
-                progress=create_upload_progress_callback()
-            )
-        else:
-            sent_message = await bot.send_sticker(
-                message.chat.id,
-                sticker=media_path,
-                progress=create_upload_progress_callback()
-            )
-        
-        if user_id and sent_message:
-            await forward_to_dump_channel(bot, sent_message, user_id, None, source_url)
-        
-        memory_monitor.log_memory_snapshot("Upload Complete", f"User {user_id or 'unknown'}: {os.path.basename(media_path)} (sticker)", silent=True)
-        return True
+    # Forward to dump channel if configured (RAM-efficient, no re-upload)
+    if user_id and sent_message:
+        await forward_to_dump_channel(bot, sent_message, user_id, caption if spec.caption else None, source_url)
+
+    transfer_metrics.record(upload_progress.estimator)
+    memory_monitor.log_memory_snapshot("Upload Complete", f"User {user_id or 'unknown'}: {file_name} ({media_type})", silent=True)
+    return True
 
 
 PER_FILE_TIMEOUT_SECONDS = 2700
@@ -923,37 +638,27 @@ async def _process_single_media_file(
         tuple: (result_path, upload_success)
     """
     # STEP 1: Download this file
-    def media_group_download_progress(current, total):
-        try:
-            if total > 0 and progress_message:
-                percent = int((current / total) * 100)
-                elapsed = time() - file_start_time
-                if elapsed > 0:
-                    speed_mbps = (current / elapsed) / 1024 / 1024
-                    remaining_time = (total - current) / (current / elapsed) if current > 0 else 0
-                    eta_str = f"{int(remaining_time)}s" if remaining_time < 60 else f"{int(remaining_time / 60)}m"
-                    try:
-                        import asyncio
-                        asyncio.create_task(progress_message.edit_text(
-                            f"**📥 Downloading {idx}/{total_files}: {percent}%**\n"
-                            f"Speed: {speed_mbps:.1f} MB/s\n"
-                            f"ETA: {eta_str}"
-                        ))
-                    except:
-                        pass
-        except:
-            pass
-    
-    result_path = await download_media_fast(
-        client=client_for_download,
-        message=msg,
-        file=download_path,
-        progress_callback=media_group_download_progress
+    from helpers.transfer_stats import create_progress_reporter, transfer_metrics
+    media_group_download_progress = create_progress_reporter(
+        progress_message, f"📥 Downloading {idx}/{total_files}", "download",
+        file_name=os.path.basename(download_path), user_id=user_id, start_time=file_start_time
     )
     
+    from tracing import tracer
+    async with tracer.span("download", file=idx) as span:
+        result_path = await download_media_fast(
+            client=client_for_download,
+            message=msg,
+            file=download_path,
+            progress_callback=media_group_download_progress
+        )
+        span.bytes = media_group_download_progress.estimator.last_bytes
+    
     if not result_path:
+        transfer_metrics.record(media_group_download_progress.estimator, "failed")
         LOGGER(__name__).warning(f"File {idx}/{total_files} download failed: no media path returned")
         return None, False
+    transfer_metrics.record(media_group_download_progress.estimator)
     
     # RAM OPTIMIZATION: Release download buffers before upload starts
     # This ensures peak RAM usage is minimized by clearing download memory before allocating upload buffers
@@ -985,7 +690,9 @@ async def _process_single_media_file(
         progress_message=progress_message,
         start_time=file_start_time,
         user_id=user_id,
-        source_url=source_url
+        source_url=source_url,
+        source_client=client_for_download,
+        source_message=msg
     )
     
     return result_path, upload_success
@@ -1031,7 +738,9 @@ async def processMediaGroup(chat_message, bot, message, user_id=None, user_clien
     grouped_id = chat_message.media_group_id
     
     # Get all messages in the media group
-    media_group_messages = await client_for_download.get_messages(
+    from rate_governor import rate_governor
+    media_group_messages = await rate_governor.call(
+        client_for_download.get_messages,
         chat_id,
         message_ids=[chat_message.id + i for i in range(-10, 11)]
     )
@@ -1091,7 +800,7 @@ async def processMediaGroup(chat_message, bot, message, user_id=None, user_clien
             
             # CRITICAL RAM FIX: Re-fetch the message fresh for each file
             # This prevents closure capture and allows each message to be GC'd after processing
-            msg = await client_for_download.get_messages(chat_id, message_ids=msg_id)
+            msg = await rate_governor.call(client_for_download.get_messages, chat_id, message_ids=msg_id)
             
             if not msg or not (msg.media or msg.photo or msg.video or msg.document or msg.audio or msg.voice or msg.video_note or msg.animation or msg.sticker):
                 LOGGER(__name__).warning(f"File {idx}/{total_files}: No media found in message {msg_id}")
@@ -0,0 +1,265 @@
+"""
+Download workspaces: every file a download job writes is handed out here.
+
+A job runs inside `with workspace_manager.job(user_id, job_id):` and owns one
+directory, downloads/<job_id>/, created the first time it asks for a path.
+`get_download_path` returns paths in the current workspace (a ContextVar, like
+the current trace), and each path is registered in an in-memory index along
+with the files derived from it (Pyrogram's .temp part, .tmp, .thumb.jpg).
+When the job's `with` block exits, the workspace removes what it registered
+and its directory, so nothing is left for a periodic sweep to find.
+
+The only full scan of downloads/ runs once at startup (`scan_orphans`): the
+index is empty then, so everything on disk is left over from a previous
+process. After that orphans are found from the index alone - `sweep()`
+retries removals that failed and closes workspaces whose task ended without
+leaving its `with` block - and never lists or stats the download tree.
+"""
+
+import os
+import shutil
+import asyncio
+from contextvars import ContextVar
+from secrets import token_hex
+from time import time
+from typing import Dict, Optional, Set, Tuple
+from logger import LOGGER
+from metrics import metrics
+
+DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR", "downloads")
+# Files written next to a download by Pyrogram (partial part) and send_media (thumbnail)
+DERIVED_SUFFIXES = (".temp", ".tmp", ".thumb.jpg")
+
+_current: ContextVar[Optional['DownloadWorkspace']] = ContextVar('current_workspace', default=None)
+
+
+class DownloadWorkspace:
+    """Files handed out to one job; removed when the job's `with` block exits"""
+
+    def __init__(self, manager: 'WorkspaceManager', job_id: str, owner: Optional[int]):
+        self.manager = manager
+        self.job_id = job_id
+        self.owner = owner
+        self.directory = os.path.abspath(os.path.join(manager.root, job_id))
+        self.created_at = time()
+        self.files: Set[str] = set()
+        self.closed = False
+        self._created_dir = False
+        self._task = None
+        self._token = None
+
+    def path(self, filename: str) -> str:
+        """Register and return a path for `filename` in this workspace"""
+        if not self._created_dir:
+            os.makedirs(self.directory, exist_ok=True)
+            self._created_dir = True
+        path = os.path.join(self.directory, os.path.basename(filename))
+        self.manager._register(path, self)
+        return path
+
+    def release(self, path: str) -> int:
+        """Delete one file (and its derived files) before the job ends"""
+        return self.manager.release(path)
+
+    def __enter__(self) -> 'DownloadWorkspace':
+        try:
+            self._task = asyncio.current_task()
+        except RuntimeError:
+            self._task = None
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.manager.close(self)
+        return False
+
+
+class WorkspaceManager:
+    def __init__(self, root: str = DOWNLOAD_DIR):
+        self.root = root
+        self.workspaces: Dict[str, DownloadWorkspace] = {}
+        # Absolute path -> owning workspace, for every file handed out and not yet removed
+        self._index: Dict[str, DownloadWorkspace] = {}
+        # Paths whose removal failed; retried by sweep()
+        self._pending: Set[str] = set()
+        self.files_registered = 0
+        self.files_removed = 0
+        self.bytes_freed = 0
+        self.orphans_removed = 0
+
+    def job(self, owner: Optional[int] = None, job_id: Optional[str] = None) -> DownloadWorkspace:
+        """Workspace for one job (use as `with`); job_id defaults to a fresh random ID"""
+        job_id = job_id or token_hex(4)
+        while job_id in self.workspaces:
+            job_id = token_hex(4)
+        workspace = DownloadWorkspace(self, job_id, owner)
+        self.workspaces[job_id] = workspace
+        return workspace
+
+    def current(self) -> Optional[DownloadWorkspace]:
+        return _current.get()
+
+    def owner_of(self, path: str) -> Optional[DownloadWorkspace]:
+        return self._index.get(os.path.abspath(path))
+
+    def _register(self, path: str, workspace: DownloadWorkspace):
+        if path not in self._index:
+            self.files_registered += 1
+        self._index[path] = workspace
+        workspace.files.add(path)
+
+    def _remove_file(self, path: str) -> int:
+        try:
+            size = os.stat(path).st_size
+            os.remove(path)
+        except FileNotFoundError:
+            self._pending.discard(path)
+            return 0
+        except OSError as e:
+            if path not in self._pending:
+                LOGGER(__name__).warning(f"Could not remove {path}, will retry: {e}")
+            self._pending.add(path)
+            return 0
+        self._pending.discard(path)
+        self.files_removed += 1
+        self.bytes_freed += size
+        return size
+
+    def _remove_directory(self, path: str):
+        try:
+            os.rmdir(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            # Something the job never registered (e.g. a tool's scratch file); the job is over, so it goes too
+            shutil.rmtree(path, ignore_errors=True)
+            if os.path.isdir(path):
+                self._pending.add(path)
+                return
+        self._pending.discard(path)
+
+    def release(self, path: str) -> int:
+        """Delete a file and its derived files now; returns bytes freed"""
+        path = os.path.abspath(path)
+        workspace = self._index.pop(path, None)
+        if workspace is not None:
+            workspace.files.discard(path)
+
+        from helpers.media_probe import media_probe
+        media_probe.invalidate(path)
+
+        freed = self._remove_file(path)
+        for suffix in DERIVED_SUFFIXES:
+            freed += self._remove_file(path + suffix)
+        return freed
+
+    def close(self, workspace: DownloadWorkspace) -> int:
+        """Remove everything the workspace handed out, then its directory"""
+        if workspace.closed:
+            return 0
+        workspace.closed = True
+        freed = 0
+        for path in list(workspace.files):
+            freed += self.release(path)
+        if workspace._created_dir:
+            self._remove_directory(workspace.directory)
+        workspace._task = None
+        self.workspaces.pop(workspace.job_id, None)
+        return freed
+
+    def sweep(self) -> Tuple[int, int]:
+        """
+        Orphan check from the index alone (no directory scan).
+
+        Retries failed removals and closes workspaces whose task finished
+        without exiting its `with` block. Returns (files_removed, bytes_freed).
+        """
+        files_before, bytes_before = self.files_removed, self.bytes_freed
+
+        for path in list(self._pending):
+            if os.path.isdir(path):
+                self._remove_directory(path)
+            else:
+                self._remove_file(path)
+
+        for workspace in list(self.workspaces.values()):
+            task = workspace._task
+            if task is not None and task.done():
+                LOGGER(__name__).warning(
+                    f"Workspace {workspace.job_id} (user {workspace.owner}) outlived its task, removing "
+                    f"{len(workspace.files)} file(s)"
+                )
+                self.close(workspace)
+
+        removed = self.files_removed - files_before
+        self.orphans_removed += removed
+        return removed, self.bytes_freed - bytes_before
+
+    def scan_orphans(self) -> Tuple[int, int]:
+        """
+        One full scan of the download directory, meant for startup: anything
+        not owned by a live workspace is left over from a previous process.
+        Returns (files_removed, bytes_freed).
+        """
+        files_removed = 0
+        bytes_freed = 0
+        if not os.path.isdir(self.root):
+            return 0, 0
+
+        live = {os.path.basename(workspace.directory) for workspace in self.workspaces.values()}
+        with os.scandir(self.root) as entries:
+            entries = [entry for entry in entries if entry.name not in live]
+
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                for root, dirs, files in os.walk(entry.path, topdown=False):
+                    for name in files:
+                        filepath = os.path.join(root, name)
+                        try:
+                            size = os.stat(filepath).st_size
+                            os.remove(filepath)
+                            files_removed += 1
+                            bytes_freed += size
+                        except OSError as e:
+                            LOGGER(__name__).warning(f"Failed to remove {filepath}: {e}")
+                    for name in dirs:
+                        try:
+                            os.rmdir(os.path.join(root, name))
+                        except OSError:
+                            pass
+                try:
+                    os.rmdir(entry.path)
+                except OSError:
+                    pass
+            elif os.path.abspath(entry.path) not in self._index:
+                try:
+                    size = entry.stat(follow_symlinks=False).st_size
+                    os.remove(entry.path)
+                    files_removed += 1
+                    bytes_freed += size
+                except OSError as e:
+                    LOGGER(__name__).warning(f"Failed to remove {entry.path}: {e}")
+
+        self.orphans_removed += files_removed
+        return files_removed, bytes_freed
+
+    def get_stats(self) -> dict:
+        return {
+            'workspaces': len(self.workspaces),
+            'files': len(self._index),
+            'pending_removals': len(self._pending),
+            'files_registered': self.files_registered,
+            'files_removed': self.files_removed,
+            'bytes_freed': self.bytes_freed,
+            'orphans_removed': self.orphans_removed,
+        }
+
+
+# Global workspace manager instance
+workspace_manager = WorkspaceManager()
+
+metrics.gauge('download_workspaces_active', 'Download jobs holding a workspace', function=lambda: len(workspace_manager.workspaces))
+metrics.gauge('download_workspace_files', 'Files registered to open download workspaces', function=lambda: len(workspace_manager._index))
+metrics.counter('download_files_removed_total', 'Downloaded files removed by their workspace', function=lambda: workspace_manager.files_removed)
+metrics.counter('download_orphans_removed_total', 'Leftover download files removed by the startup scan or sweep', function=lambda: workspace_manager.orphans_removed)
@@ -0,0 +1,183 @@
+"""
+Response compression and validation for the web server.
+
+finalize_response() adds a body-hash ETag to HTML/JSON/CSS/JS responses,
+answers a matching If-None-Match with 304, and gzip- or brotli-compresses
+bodies above HTTP_COMPRESS_MIN_BYTES for clients that accept it. Compressed
+bodies are cached by (ETag, encoding), so static pages such as the login
+form are compressed once. CompressionMiddleware applies this to the WSGI
+app; the ASGI front end calls finalize_response() directly for its native
+routes. Streamed responses (file downloads, DB exports) pass through as-is.
+"""
+
+import os
+import gzip
+import hashlib
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HTTP_COMPRESSION = os.getenv("HTTP_COMPRESSION", "1").lower() not in ("0", "false", "no")
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Compressed bodies kept in memory (only bodies up to COMPRESS_CACHE_MAX_BODY are cached)
+COMPRESS_CACHE_SIZE = 64
+COMPRESS_CACHE_MAX_BODY = 256 * 1024
+
+COMPRESSIBLE_TYPES = ('text/html', 'text/css', 'text/plain', 'text/csv', 'application/json', 'application/javascript', 'text/javascript')
+
+# Headers a 304 response keeps from the full response
+_NOT_MODIFIED_HEADERS = {'etag', 'cache-control', 'vary', 'expires', 'pragma', 'last-modified'}
+
+Headers = List[Tuple[str, str]]
+
+
+def _header(headers: Headers, name: str) -> Optional[str]:
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _without(headers: Headers, *names: str) -> Headers:
+    drop = {n.lower() for n in names}
+    return [(k, v) for k, v in headers if k.lower() not in drop]
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported encoding the client accepts (br > gzip), honouring q=0"""
+    accepted = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            param = param.strip()
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0 or (accepted.get('*', 0) > 0 and 'gzip' not in accepted):
+        return 'gzip'
+    return None
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag == etag or (tag.startswith('W/') and tag[2:] == opaque) or tag == opaque:
+            return True
+    return False
+
+
+class _CompressedCache:
+    def __init__(self, max_entries: int = COMPRESS_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+        return value
+
+    def put(self, key, value: bytes):
+        self.entries[key] = value
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+compressed_cache = _CompressedCache()
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def finalize_response(environ, status: str, headers: Headers, body: bytes) -> Tuple[str, Headers, bytes]:
+    """ETag/304 and compression for a fully buffered response"""
+    if not HTTP_COMPRESSION or not status.startswith('200'):
+        return status, headers, body
+
+    content_type = (_header(headers, 'Content-Type') or '').split(';')[0].strip().lower()
+    if content_type not in COMPRESSIBLE_TYPES or _header(headers, 'Content-Encoding'):
+        return status, headers, body
+
+    headers = list(headers)
+    etag = _header(headers, 'ETag')
+    if etag is None:
+        etag = 'W/"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        headers.append(('ETag', etag))
+
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and _etag_matches(if_none_match, etag):
+        kept = [(k, v) for k, v in headers if k.lower() in _NOT_MODIFIED_HEADERS]
+        return '304 Not Modified', kept, b''
+
+    if len(body) < HTTP_COMPRESS_MIN_BYTES:
+        return status, headers, body
+
+    headers.append(('Vary', 'Accept-Encoding'))
+    encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+    if encoding is None:
+        return status, headers, body
+
+    key = (etag, encoding)
+    compressed = compressed_cache.get(key)
+    if compressed is None:
+        compressed = _compress(body, encoding)
+        if len(body) <= COMPRESS_CACHE_MAX_BODY:
+            compressed_cache.put(key, compressed)
+    if len(compressed) >= len(body):
+        return status, headers, body
+
+    headers = _without(headers, 'Content-Length')
+    headers += [('Content-Encoding', encoding), ('Content-Length', str(len(compressed)))]
+    return status, headers, compressed
+
+
+class CompressionMiddleware:
+    """WSGI middleware applying finalize_response() to buffered (list) responses"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+            return lambda data: None
+
+        result = self.app(environ, capture)
+        if not isinstance(result, (list, tuple)):
+            # Streamed body (downloads, exports): forward untouched
+            start_response(captured['status'], captured['headers'])
+            return result
+
+        body = b''.join(result)
+        status, headers, body = finalize_response(environ, captured['status'], list(captured['headers']), body)
+        start_response(status, headers)
+        return [body]
@@ -0,0 +1,607 @@
+"""
+Incremental, compressed database backups.
+
+Each run snapshots the DB with the SQLite backup API into a temp file and walks
+it page by page: pages whose hash differs from the last shipped snapshot are
+written as (page number, page) records through a zlib stream into a spool file,
+which the backend uploads in chunks. A generation starts with a full archive
+(every page) followed by deltas; the engine rebases to a new full archive after
+BACKUP_REBASE_EVERY deltas or once the deltas outweigh BACKUP_REBASE_RATIO of
+the full archive, so a backup costs what changed rather than the size of the DB.
+
+Archives are named backup_<generation>_full.dbz and
+backup_<generation>_dNNNN-<snapshot time>.dbz, so sorting by name gives restore
+order and the name alone tells how old the newest backup is. Page hashes of the last shipped snapshot
+are kept next to the DB; when they are missing (fresh container) the next run
+ships a full archive.
+
+Backends: GitHub contents API (CLOUD_BACKUP_SERVICE=github) and a local directory
+(CLOUD_BACKUP_SERVICE=local, BACKUP_LOCAL_DIR), mainly for testing.
+"""
+
+import os
+import json
+import zlib
+import struct
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from logger import LOGGER
+
+BACKUP_REBASE_EVERY = int(os.getenv("BACKUP_REBASE_EVERY", "48"))
+BACKUP_REBASE_RATIO = float(os.getenv("BACKUP_REBASE_RATIO", "0.5"))
+BACKUP_KEEP_GENERATIONS = int(os.getenv("BACKUP_KEEP_GENERATIONS", "2"))
+BACKUP_LOCAL_DIR = os.getenv("BACKUP_LOCAL_DIR", "backups")
+BACKUP_COMPRESS_LEVEL = 6
+BACKUP_CHUNK_SIZE = 256 * 1024
+BACKUP_HTTP_TIMEOUT = int(os.getenv("BACKUP_HTTP_TIMEOUT", "60"))
+
+_HEADER = struct.Struct('>4sIII')  # magic, page_size, page_count, sequence
+_PGNO = struct.Struct('>I')
+_MAGIC = b'PGB2'
+# Archives without the checksum trailer
+_MAGIC_V1 = b'PGB1'
+_END_OF_PAGES = 0
+_DIGEST_SIZE = 32
+_HASH_SIZE = 8
+# Cap on decompressed bytes produced per step (all-zero pages compress ~1000x)
+_INFLATE_STEP = 1024 * 1024
+
+ARCHIVE_SUFFIX = '.dbz'
+LEGACY_SUFFIX = '.db'
+GENERATION_FORMAT = "%Y%m%d_%H%M%S"
+DELTA_TIME_FORMAT = "%Y%m%d%H%M%S"
+
+
+def archive_name(generation: str, sequence: int, taken: Optional[datetime] = None) -> str:
+    if sequence == 0:
+        return f"backup_{generation}_full{ARCHIVE_SUFFIX}"
+    stamp = f"-{taken.strftime(DELTA_TIME_FORMAT)}" if taken else ""
+    return f"backup_{generation}_d{sequence:04d}{stamp}{ARCHIVE_SUFFIX}"
+
+
+def parse_archive_name(name: str) -> Optional[Tuple[str, int]]:
+    """(generation, sequence) for an archive name; sequence -1 marks a legacy whole-DB backup"""
+    if not name.startswith('backup_'):
+        return None
+    stem = name[len('backup_'):]
+    if name.endswith(LEGACY_SUFFIX):
+        return stem[:-len(LEGACY_SUFFIX)], -1
+    if not name.endswith(ARCHIVE_SUFFIX):
+        return None
+    generation, _, part = stem[:-len(ARCHIVE_SUFFIX)].rpartition('_')
+    if part == 'full':
+        return generation, 0
+    part = part.partition('-')[0]
+    if part.startswith('d') and part[1:].isdigit():
+        return generation, int(part[1:])
+    return None
+
+
+def archive_time(name: str) -> Optional[float]:
+    """
+    When the snapshot in an archive was taken: the generation start for full
+    and legacy archives, the stamp in the name for deltas. None for deltas
+    named before they carried one.
+    """
+    parsed = parse_archive_name(name)
+    if not parsed:
+        return None
+    generation, sequence = parsed
+    try:
+        if sequence <= 0:
+            return datetime.strptime(generation, GENERATION_FORMAT).timestamp()
+        stamp = name[:-len(ARCHIVE_SUFFIX)].rpartition('_')[2].partition('-')[2]
+        return datetime.strptime(stamp, DELTA_TIME_FORMAT).timestamp() if stamp else None
+    except ValueError:
+        return None
+
+
+def _iter_file(path: str, chunk_size: int = BACKUP_CHUNK_SIZE) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class LocalDirectoryBackend:
+    """Archives as plain files in a directory"""
+    name = 'local'
+
+    def __init__(self, directory: str = BACKUP_LOCAL_DIR):
+        self.directory = directory
+
+    def list(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(os.listdir(self.directory))
+
+    def upload(self, name: str, path: str) -> bool:
+        os.makedirs(self.directory, exist_ok=True)
+        target = os.path.join(self.directory, name)
+        partial = target + '.part'
+        shutil.copyfile(path, partial)
+        os.replace(partial, target)
+        return True
+
+    def open(self, name: str) -> Iterator[bytes]:
+        return _iter_file(os.path.join(self.directory, name))
+
+    def delete(self, name: str):
+        os.remove(os.path.join(self.directory, name))
+
+
+class GitHubBackend:
+    """Archives in the backups/ folder of a GitHub repository (contents API)"""
+    name = 'github'
+
+    def __init__(self, token: str, repo: str):
+        self.token = token
+        self.repo = repo
+        self._entries: Dict[str, dict] = {}
+
+    def _headers(self) -> dict:
+        return {
+            "Authorization": f"token {self.token}",
+            "Accept": "application/vnd.github.v3+json"
+        }
+
+    def list(self) -> List[str]:
+        import urllib.request
+        import urllib.error
+        url = f"https://api.github.com/repos/{self.repo}/contents/backups"
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=self._headers()), timeout=BACKUP_HTTP_TIMEOUT) as response:
+                entries = json.loads(response.read().decode())
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return []
+            raise
+        self._entries = {entry['name']: entry for entry in entries}
+        return sorted(self._entries)
+
+    def upload(self, name: str, path: str) -> bool:
+        """PUT the archive, base64-encoding it from disk chunk by chunk"""
+        import base64
+        import urllib.request
+
+        size = os.path.getsize(path)
+        prefix = json.dumps({"message": f"Automated backup - {name}"})[:-1].encode() + b', "content": "'
+        suffix = b'"}'
+        encoded_size = 4 * ((size + 2) // 3)
+
+        def body():
+            yield prefix
+            # Multiple of 3 so chunks encode without padding except at the end
+            for chunk in _iter_file(path, 3 * 64 * 1024):
+                yield base64.b64encode(chunk)
+            yield suffix
+
+        headers = self._headers()
+        headers['Content-Type'] = 'application/json'
+        headers['Content-Length'] = str(len(prefix) + encoded_size + len(suffix))
+        url = f"https://api.github.com/repos/{self.repo}/contents/backups/{name}"
+        req = urllib.request.Request(url, data=body(), headers=headers, method='PUT')
+        with urllib.request.urlopen(req, timeout=BACKUP_HTTP_TIMEOUT) as response:
+            if response.status in (200, 201):
+                return True
+            LOGGER(__name__).error(f"GitHub upload of {name} failed: {response.status}")
+            return False
+
+    def open(self, name: str) -> Iterator[bytes]:
+        import urllib.request
+        entry = self._entries.get(name)
+        url = entry['download_url'] if entry else f"https://raw.githubusercontent.com/{self.repo}/main/backups/{name}"
+        with urllib.request.urlopen(urllib.request.Request(url), timeout=BACKUP_HTTP_TIMEOUT) as response:
+            while True:
+                chunk = response.read(BACKUP_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    def delete(self, name: str):
+        import urllib.request
+        entry = self._entries.get(name)
+        if entry is None:
+            return
+        data = {"message": f"Cleanup: Remove old backup {name}", "sha": entry['sha']}
+        url = f"https://api.github.com/repos/{self.repo}/contents/{entry['path']}"
+        req = urllib.request.Request(url, data=json.dumps(data).encode(), headers=self._headers(), method='DELETE')
+        with urllib.request.urlopen(req, timeout=BACKUP_HTTP_TIMEOUT):
+            pass
+        self._entries.pop(name, None)
+
+
+def _counting(chunks: Iterable[bytes], sizes: List[int]) -> Iterator[bytes]:
+    """Pass chunks through, appending their total size to sizes when exhausted"""
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        yield chunk
+    sizes.append(total)
+
+
+def backend_for_service(service: str):
+    """Backend for a CLOUD_BACKUP_SERVICE value, or None when not configured"""
+    if service == 'local':
+        return LocalDirectoryBackend()
+    if service == 'github':
+        token = os.getenv("GITHUB_TOKEN")
+        repo = os.getenv("GITHUB_BACKUP_REPO")
+        if not token or not repo:
+            LOGGER(__name__).error("GITHUB_TOKEN or GITHUB_BACKUP_REPO not set")
+            return None
+        return GitHubBackend(token, repo)
+    return None
+
+
+def _page_size_of(path: str) -> int:
+    with open(path, 'rb') as f:
+        header = f.read(100)
+    page_size = int.from_bytes(header[16:18], 'big')
+    return 65536 if page_size == 1 else page_size
+
+
+def _page_hashes(path: str, page_size: int) -> bytearray:
+    hashes = bytearray()
+    with open(path, 'rb') as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                return hashes
+            hashes += hashlib.blake2b(page, digest_size=_HASH_SIZE).digest()
+
+
+def snapshot_digest(page_hashes: bytes) -> bytes:
+    """Checksum of a database image, computed from its page hashes"""
+    return hashlib.sha256(page_hashes).digest()
+
+
+def quick_check(path: str) -> bool:
+    """PRAGMA quick_check on a database file"""
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return conn.execute("PRAGMA quick_check").fetchone()[0] == 'ok'
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        LOGGER(__name__).warning(f"quick_check failed for {path}: {e}")
+        return False
+
+
+def write_archive(snapshot_path: str, out_path: str, sequence: int,
+                  previous_hashes: Optional[bytes]) -> Tuple[bytearray, int]:
+    """
+    Write the pages of snapshot_path that differ from previous_hashes (all
+    pages when None) as a compressed archive.
+
+    Returns:
+        (page hashes of the snapshot, number of pages written)
+    """
+    page_size = _page_size_of(snapshot_path)
+    page_count = os.path.getsize(snapshot_path) // page_size
+    compressor = zlib.compressobj(BACKUP_COMPRESS_LEVEL)
+    hashes = bytearray()
+    written = 0
+    with open(snapshot_path, 'rb') as src, open(out_path, 'wb') as out:
+        out.write(compressor.compress(_HEADER.pack(_MAGIC, page_size, page_count, sequence)))
+        for pgno in range(1, page_count + 1):
+            page = src.read(page_size)
+            digest = hashlib.blake2b(page, digest_size=_HASH_SIZE).digest()
+            hashes += digest
+            if previous_hashes is not None:
+                offset = (pgno - 1) * _HASH_SIZE
+                if previous_hashes[offset:offset + _HASH_SIZE] == digest:
+                    continue
+            out.write(compressor.compress(_PGNO.pack(pgno) + page))
+            written += 1
+        # Trailer: checksum of the whole snapshot, verified after a restore
+        out.write(compressor.compress(_PGNO.pack(_END_OF_PAGES) + snapshot_digest(hashes)))
+        out.write(compressor.flush())
+    return hashes, written
+
+
+def apply_archive(chunks: Iterable[bytes], target_path: str,
+                  expected_sequence: Optional[int] = None) -> Tuple[int, Optional[bytes]]:
+    """
+    Apply a compressed archive to target_path (created for a full archive),
+    streaming: memory use is one inflate step plus one page.
+
+    Returns:
+        (sequence number, snapshot checksum or None for archives without one)
+    """
+    decompressor = zlib.decompressobj()
+    buffer = bytearray()
+    header = None
+    finished = False
+    digest = None
+    mode = 'r+b' if os.path.exists(target_path) else 'w+b'
+
+    with open(target_path, mode) as target:
+        def consume():
+            nonlocal header, finished, digest
+            if header is None:
+                if len(buffer) < _HEADER.size:
+                    return
+                magic, page_size, page_count, sequence = _HEADER.unpack_from(buffer)
+                if magic not in (_MAGIC, _MAGIC_V1):
+                    raise ValueError("Not a backup archive")
+                if expected_sequence is not None and sequence != expected_sequence:
+                    raise ValueError(f"Archive sequence {sequence}, expected {expected_sequence}")
+                if sequence == 0:
+                    target.truncate(0)
+                header = (page_size, page_count, sequence, magic == _MAGIC)
+                del buffer[:_HEADER.size]
+            page_size = header[0]
+            if finished:
+                if header[3] and digest is None and len(buffer) >= _DIGEST_SIZE:
+                    digest = bytes(buffer[:_DIGEST_SIZE])
+                    del buffer[:_DIGEST_SIZE]
+                return
+            while len(buffer) >= _PGNO.size:
+                pgno = _PGNO.unpack_from(buffer)[0]
+                if pgno == _END_OF_PAGES:
+                    finished = True
+                    del buffer[:_PGNO.size]
+                    consume()
+                    return
+                if len(buffer) < _PGNO.size + page_size:
+                    return
+                target.seek((pgno - 1) * page_size)
+                target.write(buffer[_PGNO.size:_PGNO.size + page_size])
+                del buffer[:_PGNO.size + page_size]
+
+        for chunk in chunks:
+            data = decompressor.decompress(chunk, _INFLATE_STEP)
+            while True:
+                buffer.extend(data)
+                consume()
+                if not decompressor.unconsumed_tail:
+                    break
+                data = decompressor.decompress(decompressor.unconsumed_tail, _INFLATE_STEP)
+        buffer.extend(decompressor.flush())
+        consume()
+
+        # eof is only set once zlib has verified the stream's own checksum
+        if header is None or not finished or not decompressor.eof or (header[3] and digest is None):
+            raise ValueError("Truncated backup archive")
+        target.truncate(header[0] * header[1])
+    return header[2], digest
+
+
+class IncrementalBackup:
+    """Ships page deltas of the database to a backend; see module docstring"""
+
+    def __init__(self, db_path: str, backend):
+        self.db_path = db_path
+        self.backend = backend
+        self.state_path = f"{db_path}.backup-state"
+        self.hashes_path = f"{db_path}.backup-pages"
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.bytes_shipped = 0
+
+    def _load_state(self) -> Tuple[Optional[dict], Optional[bytes]]:
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            with open(self.hashes_path, 'rb') as f:
+                hashes = f.read()
+        except (OSError, ValueError):
+            return None, None
+        if state.get('service') != self.backend.name:
+            return None, None
+        return state, hashes
+
+    def _save_state(self, state: dict, hashes: bytes):
+        for path, data, flags in ((self.hashes_path, bytes(hashes), 'wb'),
+                                  (self.state_path, json.dumps(state).encode(), 'wb')):
+            partial = path + '.tmp'
+            with open(partial, flags) as f:
+                f.write(data)
+            os.replace(partial, path)
+
+    def _snapshot(self) -> str:
+        fd, path = tempfile.mkstemp(prefix='backup_snapshot_', suffix='.db',
+                                    dir=os.path.dirname(os.path.abspath(self.db_path)))
+        os.close(fd)
+        source = sqlite3.connect(self.db_path)
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        return path
+
+    def run(self) -> bool:
+        """Ship a delta (or a full archive when rebasing); True on success or when nothing changed"""
+        if not os.path.exists(self.db_path):
+            LOGGER(__name__).warning(f"Database file not found: {self.db_path}")
+            return False
+
+        with self._lock:
+            snapshot = spool = None
+            try:
+                taken = datetime.now()
+                snapshot = self._snapshot()
+                page_size = _page_size_of(snapshot)
+                state, previous = self._load_state()
+                rebase = (
+                    state is None
+                    or state['page_size'] != page_size
+                    or state['sequence'] >= BACKUP_REBASE_EVERY
+                    or state['delta_bytes'] > state['full_bytes'] * BACKUP_REBASE_RATIO
+                )
+                if rebase:
+                    generation = taken.strftime(GENERATION_FORMAT)
+                    sequence = 0
+                    previous = None
+                else:
+                    generation = state['generation']
+                    sequence = state['sequence'] + 1
+
+                spool = snapshot + '.dbz'
+                hashes, pages = write_archive(snapshot, spool, sequence, previous)
+                size = os.path.getsize(spool)
+                if not rebase and pages == 0 and len(hashes) == len(previous):
+                    LOGGER(__name__).debug("Backup skipped: no pages changed")
+                    return True
+
+                name = archive_name(generation, sequence, taken)
+                if not self.backend.upload(name, spool):
+                    return False
+
+                if rebase:
+                    state = {'service': self.backend.name, 'generation': generation, 'sequence': 0,
+                             'page_size': page_size, 'full_bytes': size, 'delta_bytes': 0}
+                else:
+                    state = dict(state, sequence=sequence, delta_bytes=state['delta_bytes'] + size)
+                self._save_state(state, hashes)
+                self.uploads += 1
+                self.bytes_shipped += size
+
+                kind = "full" if rebase else "delta"
+                LOGGER(__name__).info(f"✅ Backup uploaded to {self.backend.name}: {name} ({kind}, {pages} pages, {size / 1024:.1f} KB)")
+                if rebase:
+                    self._prune(generation)
+                return True
+            except Exception as e:
+                LOGGER(__name__).error(f"❌ Incremental backup failed: {e}")
+                return False
+            finally:
+                for path in (snapshot, spool):
+                    if path and os.path.exists(path):
+                        os.remove(path)
+
+    def _prune(self, current_generation: str):
+        """Delete archives of generations older than the newest BACKUP_KEEP_GENERATIONS"""
+        try:
+            names = self.backend.list()
+            generations = sorted({parsed[0] for parsed in map(parse_archive_name, names) if parsed}, reverse=True)
+            keep = set(generations[:BACKUP_KEEP_GENERATIONS]) | {current_generation}
+            for name in names:
+                parsed = parse_archive_name(name)
+                if parsed and parsed[0] not in keep:
+                    try:
+                        self.backend.delete(name)
+                        LOGGER(__name__).info(f"🗑️ Deleted old backup: {name}")
+                    except Exception as e:
+                        LOGGER(__name__).warning(f"Failed to delete {name}: {e}")
+        except Exception as e:
+            LOGGER(__name__).warning(f"Cleanup failed: {e}")
+
+    def latest_chain(self) -> List[str]:
+        """Archive names that rebuild the newest generation, in apply order"""
+        chains: Dict[str, Dict[int, str]] = {}
+        for name in self.backend.list():
+            parsed = parse_archive_name(name)
+            if parsed:
+                chains.setdefault(parsed[0], {})[parsed[1]] = name
+        for generation in sorted(chains, reverse=True):
+            parts = chains[generation]
+            if -1 in parts:
+                return [parts[-1]]
+            if 0 not in parts:
+                continue
+            chain = [parts[0]]
+            # Stop at the first gap: later deltas depend on the missing one
+            sequence = 1
+            while sequence in parts:
+                chain.append(parts[sequence])
+                sequence += 1
+            return chain
+        return []
+
+    def restore_to(self, target_path: str, install: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        """
+        Rebuild and verify the newest backup in target_path. install(target_path)
+        runs under the backup lock, so no backup can ship the pre-restore DB in
+        between; only when it succeeds is the chain adopted as the base for the
+        next delta.
+
+        Returns:
+            Name of the last archive applied, or None when there is no backup
+            or install failed
+        """
+        with self._lock:
+            restored = self._restore_to(target_path)
+            if restored is None:
+                return None
+            name, state, hashes = restored
+            if install is not None and not install(target_path):
+                return None
+            if state is not None:
+                self._save_state(state, hashes)
+            return name
+
+    def _restore_to(self, target_path: str):
+        chain = self.latest_chain()
+        if not chain:
+            return None
+
+        if chain[0].endswith(LEGACY_SUFFIX):
+            with open(target_path, 'wb') as f:
+                for chunk in self.backend.open(chain[0]):
+                    f.write(chunk)
+            if not quick_check(target_path):
+                raise ValueError(f"{chain[0]} failed quick_check")
+            return chain[0], None, None
+
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        sizes = []
+        digest = None
+        for expected, name in enumerate(chain):
+            _, digest = apply_archive(_counting(self.backend.open(name), sizes), target_path, expected)
+        full_bytes, delta_bytes = sizes[0], sum(sizes[1:])
+
+        page_size = _page_size_of(target_path)
+        hashes = _page_hashes(target_path, page_size)
+        if digest is not None and snapshot_digest(hashes) != digest:
+            raise ValueError(f"Checksum mismatch after applying {chain[-1]}")
+        if not quick_check(target_path):
+            raise ValueError(f"Restored database failed quick_check ({chain[-1]})")
+
+        generation, sequence = parse_archive_name(chain[-1])
+        state = {'service': self.backend.name, 'generation': generation, 'sequence': sequence,
+                 'page_size': page_size, 'full_bytes': full_bytes, 'delta_bytes': delta_bytes}
+        return chain[-1], state, hashes
+
+    def local_is_current(self) -> bool:
+        """
+        True when the local database needs no restore: it passes quick_check
+        and is at least as new as the newest backup - either it shipped or
+        restored that archive itself, or (without local backup state) it has
+        users and was modified after the newest archive in the chain (the last
+        delta, not the full archive) was taken. A delta named without its
+        snapshot time can't be dated, so it always counts as newer.
+        """
+        if not os.path.exists(self.db_path) or not quick_check(self.db_path):
+            return False
+        chain = self.latest_chain()
+        if not chain:
+            return True
+        generation, sequence = parse_archive_name(chain[-1])
+        state, _ = self._load_state()
+        if state is not None:
+            return (state['generation'], state['sequence']) >= (generation, sequence)
+        try:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            try:
+                has_users = conn.execute("SELECT EXISTS(SELECT 1 FROM users)").fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return False
+        backup_time = archive_time(chain[-1])
+        if backup_time is None:
+            return False
+        return bool(has_users) and os.path.getmtime(self.db_path) > backup_time
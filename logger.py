@@ -1,11 +1,52 @@
 import logging
 import os
 import glob
-from logging.handlers import RotatingFileHandler
+import json
+import time
+import queue
+import atexit
+from datetime import datetime
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 # Optimized for Render free plan (512MB RAM constraint)
 # Total log storage: ~3MB max (1MB current + 1MB x 2 backups)
 # Old logs automatically deleted when rotation happens
+#
+# Callers only put records on a queue; a listener thread does the file and
+# console I/O, so logging never blocks the bot's event loop.
+#
+# Environment:
+#   LOG_LEVEL        root level (default INFO)
+#   LOG_LEVELS       per-module overrides, e.g. "helpers.transfer=WARNING,rate_governor=DEBUG"
+#   LOG_FORMAT       "text" (default, same lines as before) or "json" (one object per line)
+#   LOG_QUEUE_SIZE   records buffered for the listener; beyond it records are dropped, never waited on
+#   LOG_RATE_LIMITED_MODULES  chatty modules whose INFO/DEBUG lines are rate limited per call site
+#   LOG_RATE_BURST / LOG_RATE_PER_SECOND  token bucket for those call sites
+#
+# Hot paths log with %-style arguments (formatted only if the record is
+# emitted) and emit their [RAM] lines at DEBUG, guarded by isEnabledFor(), so
+# psutil is only sampled when verbose RAM logging is on for that module:
+#   LOG_LEVELS="helpers.transfer=DEBUG,queue_manager=DEBUG"
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_RATE_LIMITED_MODULES = tuple(
+    name.strip() for name in os.getenv(
+        "LOG_RATE_LIMITED_MODULES", "helpers.transfer,helpers.utils,helpers.transfer_stats,helpers.session_manager"
+    ).split(",") if name.strip()
+)
+LOG_RATE_BURST = float(os.getenv("LOG_RATE_BURST", "20"))
+LOG_RATE_PER_SECOND = float(os.getenv("LOG_RATE_PER_SECOND", "2"))
+
+TEXT_FORMAT = "[%(asctime)s - %(levelname)s] - %(funcName)s() - Line %(lineno)d: %(name)s - %(message)s"
+TEXT_DATEFMT = "%d-%b-%y %I:%M:%S %p"
+
+# Third-party loggers kept quiet unless LOG_LEVELS says otherwise
+# FIXED: Changed from "telethon" to "pyrogram" for Pyrogram-based bot
+DEFAULT_LEVELS = {"pyrogram": "ERROR"}
+
 
 def cleanup_old_logs():
     """Clean up old backup logs beyond the backupCount to save storage"""
@@ -23,26 +64,156 @@ def cleanup_old_logs():
     except Exception:
         pass  # Fail silently if cleanup fails
 
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; exception text is already folded into the message by the queue"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "func": record.funcName,
+            "line": record.lineno,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per call site (logger, line) for chatty modules.
+
+    WARNING and above always pass. A suppressed line is counted and the count
+    is appended to the next line that gets through from the same call site.
+    """
+
+    def __init__(self, modules, burst: float = LOG_RATE_BURST, per_second: float = LOG_RATE_PER_SECOND):
+        super().__init__()
+        self.modules = tuple(modules)
+        self.burst = burst
+        self.per_second = per_second
+        self._buckets = {}
+        self.suppressed = 0
+
+    def _limited(self, name: str) -> bool:
+        for module in self.modules:
+            if name == module or name.startswith(module + "."):
+                return True
+        return False
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self._limited(record.name):
+            return True
+        key = (record.name, record.lineno)
+        now = time.monotonic()
+        tokens, last, skipped = self._buckets.get(key, (self.burst, now, 0))
+        tokens = min(self.burst, tokens + (now - last) * self.per_second)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now, skipped + 1)
+            self.suppressed += 1
+            return False
+        if skipped:
+            record.msg = f"{record.msg} (+{skipped} similar suppressed)"
+        self._buckets[key] = (tokens - 1, now, 0)
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = dict(DEFAULT_LEVELS)
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _configure():
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT, datefmt=TEXT_DATEFMT)
+    file_handler = RotatingFileHandler(
+        "logs.txt",
+        mode="a",  # Append mode instead of w+ to preserve logs across restarts
+        maxBytes=1000000,  # 1MB per file (reduced from 5MB)
+        backupCount=2,  # Keep only 2 backup files (reduced from 10)
+    )
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    rate_limiter = RateLimitFilter(LOG_RATE_LIMITED_MODULES)
+    queue_handler.addFilter(rate_limiter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    # Drain the queue on interpreter exit so the last lines reach logs.txt
+    atexit.register(listener.stop)
+    return queue_handler, rate_limiter, listener
+
+
 # Clean up old logs on startup
 cleanup_old_logs()
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="[%(asctime)s - %(levelname)s] - %(funcName)s() - Line %(lineno)d: %(name)s - %(message)s",
-    datefmt="%d-%b-%y %I:%M:%S %p",
-    handlers=[
-        RotatingFileHandler(
-            "logs.txt",
-            mode="a",  # Append mode instead of w+ to preserve logs across restarts
-            maxBytes=1000000,  # 1MB per file (reduced from 5MB)
-            backupCount=2,  # Keep only 2 backup files (reduced from 10)
-        ),
-        logging.StreamHandler(),
-    ],
-)
+_queue_handler, _rate_limiter, _listener = _configure()
 
-# FIXED: Changed from "telethon" to "pyrogram" for Pyrogram-based bot
-logging.getLogger("pyrogram").setLevel(logging.ERROR)
+
+class _Lazy:
+    __slots__ = ("_func", "_args")
+
+    def __init__(self, func, args):
+        self._func = func
+        self._args = args
+
+    def __str__(self):
+        return str(self._func(*self._args))
+
+    def __float__(self):
+        return float(self._func(*self._args))
+
+    def __int__(self):
+        return int(self._func(*self._args))
+
+
+def lazy(func, *args):
+    """
+    Log argument evaluated only when the record is formatted, e.g.
+    log.debug("RAM: %.1fMB", lazy(get_ram_usage_mb)) never calls psutil at INFO.
+    """
+    return _Lazy(func, args)
+
+
+def get_logging_stats() -> dict:
+    """Queue depth and records dropped (queue full) or suppressed (rate limit)"""
+    return {
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "suppressed": _rate_limiter.suppressed,
+    }
 
 
 def LOGGER(name: str) -> logging.Logger:
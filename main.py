@@ -20,6 +20,9 @@ from helpers.utils import (
 )
 
 from helpers.transfer import download_media_fast
+from helpers.transfer_stats import create_progress_reporter, transfer_metrics
+from helpers.workspace import workspace_manager
+from tracing import tracer
 
 from helpers.files import (
     get_download_path,
@@ -41,6 +44,7 @@ from database_sqlite import db
 from legal_acceptance import show_legal_acceptance, get_terms_preview, get_privacy_preview, get_full_terms, get_full_privacy
 from phone_auth import PhoneAuthHandler
 from ad_monetization import ad_monetization, PREMIUM_DOWNLOADS
+from cloud_backup import hydration_pending
 from access_control import admin_only, paid_or_admin_only, check_download_limit, register_user, check_user_session, get_user_client, force_subscribe
 from admin_commands import (
     add_admin_command,
@@ -49,10 +53,13 @@ from admin_commands import (
     remove_premium_command,
     broadcast_command,
     admin_stats_command,
+    memory_profile_command,
+    traces_command,
     broadcast_callback_handler,
     user_info_command
 )
 from queue_manager import download_manager
+from rate_governor import rate_governor, Priority
 
 # Initialize the bot client with settings optimized for Render's 512MB RAM / Replit resource limits
 # Detect platform for optimal resource allocation
@@ -152,6 +159,20 @@ def cancel_user_tasks(user_id):
             cancelled += 1
     return cancelled
 
+# While the startup restore runs in the background, writes to the local database
+# would be lost when the restored one is swapped in - so nothing reaches the handlers
+HYDRATION_NOTICE = "⏳ **The bot is restoring its data after a restart.** Please try again in a minute."
+
+@bot.on_message(filters.private & filters.create(lambda _, __, m: hydration_pending()), group=-2)
+async def hold_messages_during_restore(_, message: Message):
+    await message.reply(HYDRATION_NOTICE)
+    message.stop_propagation()
+
+@bot.on_callback_query(filters.create(lambda _, __, q: hydration_pending()), group=-2)
+async def hold_callbacks_during_restore(_, callback_query: CallbackQuery):
+    await callback_query.answer("⏳ Restoring data after a restart, please try again in a minute.", show_alert=True)
+    callback_query.stop_propagation()
+
 # Auto-add OWNER_ID as admin on startup
 @bot.on_message(filters.command("start") & filters.create(lambda _, __, m: m.from_user.id == PyroConf.OWNER_ID), group=-1)
 async def auto_add_owner_as_admin(_, message: Message):
@@ -317,18 +338,29 @@ async def handle_download(bot: Client, message: Message, post_url: str, user_cli
     
     IMPORTANT: user_client is managed by SessionManager - DO NOT call .stop() on it!
     The SessionManager will automatically reuse and cleanup sessions to prevent memory leaks.
+    
+    Every call is traced as one job (stage spans in the /traces ring buffer) and
+    downloads into its own workspace, downloads/<job_id>/, removed when it ends.
     """
     # Cut off URL at '?' if present
     if "?" in post_url:
         post_url = post_url.split("?", 1)[0]
 
+    async with tracer.job("download", message.from_user.id, url=post_url) as trace:
+        with workspace_manager.job(message.from_user.id, trace.job_id):
+            await _handle_download(bot, message, post_url, user_client, increment_usage)
+
+
+async def _handle_download(bot: Client, message: Message, post_url: str, user_client, increment_usage):
     try:
-        chat_id, message_id = getChatMsgID(post_url)
+        with tracer.span("parse_url"):
+            chat_id, message_id = getChatMsgID(post_url)
 
         # Use user's personal session (required for all users, including admins)
         client_to_use = user_client
         
         if not client_to_use:
+                tracer.set_outcome("no_session")
                 await message.reply(
                     "❌ **No active session found.**\n\n"
                     "Please login with your phone number:\n"
@@ -342,11 +374,13 @@ async def handle_download(bot: Client, message: Message, post_url: str, user_cli
         if isinstance(chat_id, str) and not chat_id.startswith('-'):
             try:
                 # Resolve username to chat ID
-                chat = await client_to_use.get_chat(chat_id)
+                async with tracer.span("resolve_username"):
+                    chat = await rate_governor.call(client_to_use.get_chat, chat_id)
                 resolved_chat_id = chat.id
                 LOGGER(__name__).info(f"Resolved username '{chat_id}' to chat ID {resolved_chat_id}")
             except Exception as e:
                 LOGGER(__name__).error(f"Failed to resolve username '{chat_id}': {e}")
+                tracer.set_outcome("chat_unresolved")
                 await message.reply(f"**Could not access channel '@{chat_id}'**\n\nMake sure you've joined the channel and the link is valid.")
                 return
         
@@ -356,7 +390,8 @@ async def handle_download(bot: Client, message: Message, post_url: str, user_cli
         
         # Approach 1: Direct get_chat() call
         try:
-            chat_obj = await client_to_use.get_chat(resolved_chat_id)
+            async with tracer.span("get_chat"):
+                chat_obj = await rate_governor.call(client_to_use.get_chat, resolved_chat_id)
             chat_found = True
             LOGGER(__name__).info(f"Met peer directly for chat ID {resolved_chat_id}")
         except Exception as e:
@@ -365,22 +400,27 @@ async def handle_download(bot: Client, message: Message, post_url: str, user_cli
         # Approach 2: Search in dialogs if direct access failed (for private channels)
         if not chat_found and isinstance(resolved_chat_id, int):
             try:
-                async for dialog in client_to_use.get_dialogs():
-                    if dialog.chat.id == resolved_chat_id:
-                        chat_obj = dialog.chat
-                        chat_found = True
-                        LOGGER(__name__).info(f"Found chat {resolved_chat_id} in dialogs")
-                        break
+                async with tracer.span("search_dialogs"):
+                    async for dialog in client_to_use.get_dialogs():
+                        if dialog.chat.id == resolved_chat_id:
+                            chat_obj = dialog.chat
+                            chat_found = True
+                            LOGGER(__name__).info(f"Found chat {resolved_chat_id} in dialogs")
+                            break
             except Exception as e:
                 pass
         
         # If still not found, show error
         if not chat_found:
             LOGGER(__name__).error(f"Could not access chat {resolved_chat_id} via any method")
+            tracer.set_outcome("chat_not_found")
             await message.reply(f"**Could not access this channel.**\n\nMake sure:\n• You have permission to access it\n• The channel still exists\n• You've joined the channel if it's private")
             return
 
-        chat_message = await client_to_use.get_messages(chat_id=resolved_chat_id, message_ids=message_id)
+        async with tracer.span("get_messages"):
+            chat_message = await rate_governor.call(
+                client_to_use.get_messages, chat_id=resolved_chat_id, message_ids=message_id
+            )
 
         LOGGER(__name__).info(f"Downloading media from URL: {post_url}")
 
@@ -402,6 +442,7 @@ async def handle_download(bot: Client, message: Message, post_url: str, user_cli
                 is_premium = False
 
             if not await fileSizeLimit(file_size, message, "download", is_premium):
+                tracer.set_outcome("too_large")
                 return
 
         parsed_caption = await get_parsed_msg(
@@ -414,15 +455,19 @@ async def handle_download(bot: Client, message: Message, post_url: str, user_cli
         if chat_message.media_group_id:
             # Download media group - CRITICAL: Pass user_client for private channel access
             LOGGER(__name__).info(f"Media group detected for user {message.from_user.id}")
-            files_sent = await processMediaGroup(chat_message, bot, message, message.from_user.id, user_client=client_to_use, source_url=post_url)
+            async with tracer.span("media_group") as span:
+                files_sent = await processMediaGroup(chat_message, bot, message, message.from_user.id, user_client=client_to_use, source_url=post_url)
+                span.set(files=files_sent)
             
             if files_sent == 0:
+                tracer.set_outcome("empty_media_group")
                 await message.reply("**Could not extract any valid media from the media group.**")
                 return
             
             # Increment usage by actual file count after successful download
             if increment_usage:
-                success = db.increment_usage(message.from_user.id, files_sent)
+                with tracer.span("increment_usage"):
+                    success = db.increment_usage(message.from_user.id, files_sent)
                 if not success:
                     LOGGER(__name__).error(f"Failed to increment usage for user {message.from_user.id} after media group download")
                 
@@ -454,50 +499,21 @@ async def handle_download(bot: Client, message: Message, post_url: str, user_cli
             download_path = get_download_path(message.id, filename)
 
             # CRITICAL FIX: Use client_to_use for download (user's client for private channels)
-            # Create sync progress callback with throttling to avoid RAM overhead
-            last_update = {"time": time(), "percent": 0}
-            def download_progress_callback(current, total):
-                """Sync callback with throttling - update max every 2 seconds or 5% change"""
-                try:
-                    if total > 0:
-                        now = time()
-                        percent = int((current / total) * 100)
-                        elapsed = now - start_time
-                        
-                        # Throttle updates: only update if 5+ seconds passed OR 10% progress changed OR completion
-                        should_update = (
-                            (now - last_update["time"] >= 5) or  # 5 seconds minimum between updates
-                            (percent - last_update["percent"] >= 10) or  # 10% progress change
-                            (percent == 100)  # Always show completion
-                        )
-                        
-                        if should_update and elapsed > 0:
-                            last_update["time"] = now
-                            last_update["percent"] = percent
-                            
-                            speed_mbps = (current / elapsed) / 1024 / 1024
-                            remaining_time = (total - current) / (current / elapsed) if current > 0 else 0
-                            eta_str = f"{int(remaining_time)}s" if remaining_time < 60 else f"{int(remaining_time / 60)}m"
-                            
-                            # Update message (non-blocking, safe for RAM)
-                            try:
-                                import asyncio
-                                asyncio.create_task(progress_message.edit_text(
-                                    f"**📥 Downloading: {percent}%**\n"
-                                    f"Speed: {speed_mbps:.1f} MB/s\n"
-                                    f"ETA: {eta_str}"
-                                ))
-                            except:
-                                pass
-                except:
-                    pass
-            
-            media_path = await download_media_fast(
-                client=client_to_use,
-                message=chat_message,
-                file=download_path,
-                progress_callback=download_progress_callback
+            # Sync progress callback backed by the EWMA speed estimator
+            download_progress_callback = create_progress_reporter(
+                progress_message, "📥 Downloading", "download",
+                file_name=filename, user_id=message.from_user.id, start_time=start_time
             )
+            
+            async with tracer.span("download") as span:
+                media_path = await download_media_fast(
+                    client=client_to_use,
+                    message=chat_message,
+                    file=download_path,
+                    progress_callback=download_progress_callback
+                )
+                span.bytes = download_progress_callback.estimator.last_bytes
+            transfer_metrics.record(download_progress_callback.estimator, "ok" if media_path else "failed")
             LOGGER(__name__).info(f"Downloaded media: {media_path}")
 
             try:
@@ -527,14 +543,17 @@ async def handle_download(bot: Client, message: Message, post_url: str, user_cli
                     progress_message,
                     start_time,
                     message.from_user.id,
-                    source_url=post_url
+                    source_url=post_url,
+                    source_client=client_to_use,
+                    source_message=chat_message
                 )
 
                 await progress_message.delete()
 
                 # Only increment usage after successful download
                 if increment_usage:
-                    db.increment_usage(message.from_user.id)
+                    with tracer.span("increment_usage"):
+                        db.increment_usage(message.from_user.id)
                     
                     # Show completion message for all users
                     user_type = db.get_user_type(message.from_user.id)
@@ -558,11 +577,13 @@ async def handle_download(bot: Client, message: Message, post_url: str, user_cli
         elif chat_message.text or chat_message.caption:
             # Send text message to user
             text_content = parsed_text or parsed_caption
-            sent_msg = await message.reply(text_content)
+            async with tracer.span("send_text"):
+                sent_msg = await message.reply(text_content)
             
             # Increment usage for text download
             if increment_usage:
-                db.increment_usage(message.from_user.id)
+                with tracer.span("increment_usage"):
+                    db.increment_usage(message.from_user.id)
                 
                 # Forward to dump channel using same method as videos/photos (RAM-efficient, no re-upload)
                 from helpers.utils import forward_to_dump_channel
@@ -585,10 +606,12 @@ async def handle_download(bot: Client, message: Message, post_url: str, user_cli
                     await message.reply("✅ **Download complete**")
         else:
             LOGGER(__name__).warning(f"Message {message_id} in chat {resolved_chat_id} has no media/text - possible restricted content or empty message")
+            tracer.set_outcome("no_content")
             await message.reply("**No media or text found in the post URL.**\n\nThe message may be:\n• Restricted/premium content\n• A forwarded message without media\n• Empty or deleted\n• Accessible only with premium account")
 
     except (PeerIdInvalid, BadRequest, KeyError) as e:
         LOGGER(__name__).error(f"Access error for URL {post_url}: {e}")
+        tracer.set_outcome(f"access_error:{type(e).__name__}")
         error_str = str(e)
         if "PEER_ID_INVALID" in error_str:
             await message.reply(
@@ -601,6 +624,7 @@ async def handle_download(bot: Client, message: Message, post_url: str, user_cli
         else:
             await message.reply("**Could not access the message.**\n\nMake sure:\n• You've joined the channel\n• The link is valid\n• The message still exists")
     except Exception as e:
+        tracer.set_outcome(f"error:{type(e).__name__}")
         error_message = f"**❌ {str(e)}**"
         await message.reply(error_message)
         LOGGER(__name__).error(e)
@@ -621,6 +645,7 @@ async def download_media(bot: Client, message: Message):
         error_msgs = {
             'no_session': "❌ **No active session found.**\n\nPlease login with `/login <phone>`",
             'slots_full': "⏳ **All session slots are currently busy!**\n\nPlease wait a few minutes and try again.",
+            'memory_pressure': "⏳ **The server is under heavy load.**\n\nPlease try again in a few minutes.",
             'error': "❌ **Session error occurred.**\n\nPlease try logging in again with `/login <phone>`"
         }
         await message.reply(error_msgs.get(error_code, "❌ **Error getting session.**"))
@@ -702,7 +727,7 @@ async def download_range(bot: Client, message: Message):
             return
 
     try:
-        await client_to_use.get_chat(start_chat)
+        await rate_governor.call(client_to_use.get_chat, start_chat, priority=Priority.BULK)
     except Exception:
         pass
 
@@ -715,7 +740,13 @@ async def download_range(bot: Client, message: Message):
     for msg_id in range(start_id, end_id + 1):
         url = f"{prefix}/{msg_id}"
         try:
-            chat_msg = await client_to_use.get_messages(chat_id=start_chat, message_ids=msg_id)
+            # Paced by the rate governor (per-session get_messages bucket + exact FloodWait pauses)
+            chat_msg = await rate_governor.call(
+                client_to_use.get_messages,
+                chat_id=start_chat,
+                message_ids=msg_id,
+                priority=Priority.BULK
+            )
             if not chat_msg:
                 skipped += 1
                 continue
@@ -766,8 +797,6 @@ async def download_range(bot: Client, message: Message):
             failed += 1
             LOGGER(__name__).error(f"Error at {url}: {e}")
 
-        await asyncio.sleep(3)
-
     await loading.delete()
     
     # SessionManager will handle client cleanup - no need to stop() here
@@ -942,7 +971,7 @@ async def global_queue_status_command(client: Client, message: Message):
     status = await download_manager.get_global_status()
     await message.reply(status)
 
-@bot.on_message(filters.private & new_updates_only & ~filters.command(["start", "help", "dl", "stats", "logs", "killall", "bdl", "myinfo", "upgrade", "premiumlist", "getpremium", "verifypremium", "login", "verify", "password", "logout", "cancel", "canceldownload", "queue", "qstatus", "setthumb", "delthumb", "viewthumb", "addadmin", "removeadmin", "setpremium", "removepremium", "ban", "unban", "broadcast", "adminstats", "userinfo", "testdump"]))
+@bot.on_message(filters.private & new_updates_only & ~filters.command(["start", "help", "dl", "stats", "logs", "killall", "bdl", "myinfo", "upgrade", "premiumlist", "getpremium", "verifypremium", "login", "verify", "password", "logout", "cancel", "canceldownload", "queue", "qstatus", "setthumb", "delthumb", "viewthumb", "addadmin", "removeadmin", "setpremium", "removepremium", "ban", "unban", "broadcast", "adminstats", "memprofile", "traces", "userinfo", "testdump"]))
 @force_subscribe
 @check_download_limit
 async def handle_any_message(bot: Client, message: Message):
@@ -1132,6 +1161,14 @@ async def broadcast_handler(client: Client, message: Message):
 async def admin_stats_handler(client: Client, message: Message):
     await admin_stats_command(client, message, download_mgr=download_manager)
 
+@bot.on_message(filters.command("memprofile") & filters.private)
+async def memory_profile_handler(client: Client, message: Message):
+    await memory_profile_command(client, message)
+
+@bot.on_message(filters.command("traces") & filters.private)
+async def traces_handler(client: Client, message: Message):
+    await traces_command(client, message)
+
 @bot.on_message(filters.command("getpremium") & filters.private)
 @register_user
 async def get_premium_command(client: Client, message: Message):
@@ -1312,25 +1349,32 @@ async def premium_list_command(client: Client, message: Message):
         await message.reply("❌ **This command is only available to the bot owner.**")
         return
     
-    premium_users = db.get_premium_users()
-    
-    if not premium_users:
-        await message.reply("ℹ️ **No premium users found.**")
-        return
-    
+    # Streamed from SQLite and sent in chunks - never holds the whole list in memory
+    # and stays under Telegram's 4096-character message limit
+    PREMIUM_LIST_CHUNK = 40
     premium_text = "💎 **Premium Users List**\n\n"
+    total = 0
     
-    for idx, user in enumerate(premium_users, 1):
+    for user in db.iter_premium_users():
+        total += 1
         user_id = user.get('user_id', 'Unknown')
         username = user.get('username', 'N/A')
         expiry_date = user.get('premium_expiry', 'N/A')
         
-        premium_text += f"{idx}. **User ID:** `{user_id}`\n"
+        premium_text += f"{total}. **User ID:** `{user_id}`\n"
         if username and username != 'N/A':
             premium_text += f"   **Username:** @{username}\n"
         premium_text += f"   **Expires:** {expiry_date}\n\n"
+        
+        if total % PREMIUM_LIST_CHUNK == 0:
+            await message.reply(premium_text)
+            premium_text = ""
+    
+    if total == 0:
+        await message.reply("ℹ️ **No premium users found.**")
+        return
     
-    premium_text += f"**Total Premium Users:** {len(premium_users)}"
+    premium_text += f"**Total Premium Users:** {total}"
     
     await message.reply(premium_text)
 
@@ -113,7 +113,6 @@ class MemoryMonitor:
     def log_memory_snapshot(self, operation="", context="", silent=False):
         """Log memory snapshot. Set silent=True for routine operations."""
         mem = self.get_memory_info()
-        state = self.get_detailed_state()
         
         # Store operation history
         snapshot = (
@@ -126,6 +125,8 @@ class MemoryMonitor:
         
         # Check for critical memory (near crash)
         if mem['rss_mb'] > 480:
+            # Detailed state (a DB count, an fd scan) is only gathered when it gets reported
+            state = self.get_detailed_state()
             critical_msg = f"🚨 CRITICAL: {mem['rss_mb']:.0f}MB - Sessions:{state['active_sessions']} DLs:{state['active_downloads']} - {operation}"
             self.logger.error(critical_msg)
             self._write_to_memory_log(critical_msg, force_write=True)
@@ -219,18 +220,18 @@ class MemoryMonitor:
             ]
         }
         
+        from memory_pressure import memory_pressure
+        response["pressure"] = memory_pressure.get_stats()
+        
+        from memory_profiler import memory_profiler
+        response["profiler"] = memory_profiler.get_report()
+        
         self._write_to_memory_log(f"/memory-debug: {mem['rss_mb']:.0f}MB", force_write=True)
         return response
     
     def _get_memory_status(self, rss_mb):
-        if rss_mb > 480:
-            return "CRITICAL"
-        elif rss_mb >= 400:
-            return "HIGH"
-        elif rss_mb >= 300:
-            return "ELEVATED"
-        else:
-            return "OK"
+        from memory_pressure import level_for
+        return level_for(rss_mb).name
     
     async def periodic_monitor(self, interval=300):
         while True:
@@ -0,0 +1,237 @@
+"""
+Memory-pressure controller: turns RSS into graduated load shedding.
+
+Every MEMORY_PRESSURE_INTERVAL seconds RSS is mapped to a level (the same
+OK/ELEVATED/HIGH/CRITICAL bands /memory-debug reports) and the level drives:
+
+    ELEVATED  cache shrunk to 50%, half the bot's parallel file transmissions
+    HIGH      cache at 25%, idle sessions evicted, downloads and sessions admitted
+              up to half their normal limits, a quarter of the transmissions
+    CRITICAL  cache cleared, every session without an active download evicted,
+              no new downloads or sessions, one transmission at a time
+
+Transmissions are limited live by holding permits of the Pyrogram transfer
+semaphores of the bot and of every user session (max_concurrent_transmissions
+is fixed at construction, so new sessions are also built with the current
+limit). Sessions unregister when they are disconnected.
+
+Admission limits are computed from the current level on every check, so the
+process recovers on its own: a level is only left once RSS is
+MEMORY_PRESSURE_HYSTERESIS_MB below its threshold, which keeps a process
+hovering at a boundary from flapping.
+"""
+
+import os
+import gc
+import asyncio
+from enum import IntEnum
+from time import time
+from logger import LOGGER
+from metrics import metrics
+
+MEMORY_ELEVATED_MB = int(os.getenv("MEMORY_ELEVATED_MB", "300"))
+MEMORY_HIGH_MB = int(os.getenv("MEMORY_HIGH_MB", "400"))
+MEMORY_CRITICAL_MB = int(os.getenv("MEMORY_CRITICAL_MB", "480"))
+MEMORY_PRESSURE_HYSTERESIS_MB = int(os.getenv("MEMORY_PRESSURE_HYSTERESIS_MB", "20"))
+MEMORY_PRESSURE_INTERVAL = int(os.getenv("MEMORY_PRESSURE_INTERVAL", "15"))
+
+
+class PressureLevel(IntEnum):
+    OK = 0
+    ELEVATED = 1
+    HIGH = 2
+    CRITICAL = 3
+
+
+_THRESHOLDS = (
+    (PressureLevel.CRITICAL, MEMORY_CRITICAL_MB),
+    (PressureLevel.HIGH, MEMORY_HIGH_MB),
+    (PressureLevel.ELEVATED, MEMORY_ELEVATED_MB),
+)
+
+# Share of the normal limit admitted at each level
+_CACHE_FACTOR = {PressureLevel.OK: 1.0, PressureLevel.ELEVATED: 0.5, PressureLevel.HIGH: 0.25, PressureLevel.CRITICAL: 0.0}
+_ADMISSION_FACTOR = {PressureLevel.OK: 1.0, PressureLevel.ELEVATED: 1.0, PressureLevel.HIGH: 0.5, PressureLevel.CRITICAL: 0.0}
+_TRANSFER_FACTOR = {PressureLevel.OK: 1.0, PressureLevel.ELEVATED: 0.5, PressureLevel.HIGH: 0.25, PressureLevel.CRITICAL: 0.0}
+
+
+def level_for(rss_mb: float, current: PressureLevel = PressureLevel.OK) -> PressureLevel:
+    """Pressure level for an RSS reading; falling below a band needs the hysteresis margin"""
+    for level, threshold in _THRESHOLDS:
+        if level <= current:
+            threshold -= MEMORY_PRESSURE_HYSTERESIS_MB
+        if rss_mb >= threshold:
+            return level
+    return PressureLevel.OK
+
+
+class _TransmissionHold:
+    """Keeps `target` permits of a transfer semaphore out of circulation"""
+
+    def __init__(self, client, semaphore: asyncio.Semaphore, permits: int):
+        self.client = client
+        self.semaphore = semaphore
+        self.permits = permits
+        self.target = 0
+        self.held = 0
+        self._task = None
+
+    def set_target(self, target: int):
+        self.target = target
+        while self.held > self.target:
+            self.semaphore.release()
+            self.held -= 1
+        if self.held < self.target and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._acquire())
+
+    async def _acquire(self):
+        # Waits for running transfers to finish; never interrupts one
+        while self.held < self.target:
+            await self.semaphore.acquire()
+            if self.held >= self.target:
+                self.semaphore.release()
+                break
+            self.held += 1
+
+    def cancel(self):
+        """Stop acquiring and give back every held permit"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        self.target = 0
+        while self.held > 0:
+            self.semaphore.release()
+            self.held -= 1
+
+
+def _scaled(limit: int, factor: float) -> int:
+    if factor <= 0:
+        return 0
+    return max(1, int(limit * factor))
+
+
+class MemoryPressureController:
+    def __init__(self):
+        self.level = PressureLevel.OK
+        self.rss_mb = 0.0
+        self.changed_at = time()
+        self.transitions = 0
+        self.rejected_downloads = 0
+        self.rejected_sessions = 0
+        self.evicted_sessions = 0
+        self._holds = []
+
+    # Admission checks used by DownloadManager / SessionManager / transfers
+
+    def download_limit(self, max_concurrent: int) -> int:
+        return _scaled(max_concurrent, _ADMISSION_FACTOR[self.level])
+
+    def session_limit(self, max_sessions: int) -> int:
+        return _scaled(max_sessions, _ADMISSION_FACTOR[self.level])
+
+    def transfer_limit(self, max_count: int) -> int:
+        """Connection/transmission count for a new transfer (never below 1)"""
+        return max(1, int(max_count * _TRANSFER_FACTOR[self.level]))
+
+    def register_transfer_client(self, client, transmissions: int):
+        """
+        Let the controller throttle a client's parallel uploads/downloads.
+
+        `transmissions` is the client's full max_concurrent_transmissions; the
+        current level is applied right away by holding permits, so capacity
+        comes back when pressure drops.
+        """
+        for attr in ('save_file_semaphore', 'get_file_semaphore'):
+            semaphore = getattr(client, attr, None)
+            if semaphore is not None:
+                hold = _TransmissionHold(client, semaphore, transmissions)
+                hold.set_target(transmissions - self.transfer_limit(transmissions))
+                self._holds.append(hold)
+
+    def unregister_transfer_client(self, client):
+        """Drop a disconnected client's holds (a session being evicted or removed)"""
+        remaining = []
+        for hold in self._holds:
+            if hold.client is client:
+                hold.cancel()
+            else:
+                remaining.append(hold)
+        self._holds = remaining
+
+    # Control loop
+
+    async def update(self, rss_mb: float):
+        """Apply the level for this reading; actions run on every tick at HIGH and above"""
+        previous = self.level
+        level = level_for(rss_mb, previous)
+        self.rss_mb = rss_mb
+
+        if level != previous:
+            self.level = level
+            self.changed_at = time()
+            self.transitions += 1
+            log = LOGGER(__name__).warning if level > previous else LOGGER(__name__).info
+            log(f"Memory pressure {previous.name} -> {level.name} ({rss_mb:.0f}MB)")
+            self._resize_cache()
+            for hold in self._holds:
+                hold.set_target(hold.permits - self.transfer_limit(hold.permits))
+
+        if level >= PressureLevel.HIGH or level > previous:
+            await self._shed(level)
+
+    def _resize_cache(self):
+        try:
+            from cache import get_cache
+            cache = get_cache()
+            cache.resize(int(cache.base_max_size * _CACHE_FACTOR[self.level]))
+        except Exception as e:
+            LOGGER(__name__).error(f"Cache resize under memory pressure failed: {e}")
+
+    async def _shed(self, level: PressureLevel):
+        if level >= PressureLevel.HIGH:
+            try:
+                from helpers.session_manager import session_manager
+                # HIGH: sessions idle for a minute; CRITICAL: every session without a download
+                max_idle = 0 if level == PressureLevel.CRITICAL else 60
+                self.evicted_sessions += await session_manager.cleanup_idle_sessions(max_idle_seconds=max_idle)
+            except Exception as e:
+                LOGGER(__name__).error(f"Session eviction under memory pressure failed: {e}")
+        if level >= PressureLevel.ELEVATED:
+            collected = gc.collect()
+            if collected:
+                LOGGER(__name__).debug(f"Memory pressure GC collected {collected} objects")
+
+    async def run(self, interval: int = MEMORY_PRESSURE_INTERVAL):
+        from memory_monitor import memory_monitor
+        LOGGER(__name__).info(
+            f"Memory pressure controller started (ELEVATED {MEMORY_ELEVATED_MB}MB, HIGH {MEMORY_HIGH_MB}MB, "
+            f"CRITICAL {MEMORY_CRITICAL_MB}MB, every {interval}s)"
+        )
+        while True:
+            try:
+                await self.update(memory_monitor.get_memory_info()['rss_mb'])
+                await asyncio.sleep(interval)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                LOGGER(__name__).error(f"Memory pressure controller error: {e}")
+                await asyncio.sleep(interval)
+
+    def get_stats(self) -> dict:
+        return {
+            'level': self.level.name,
+            'rss_mb': round(self.rss_mb, 1),
+            'since_seconds': int(time() - self.changed_at),
+            'transitions': self.transitions,
+            'rejected_downloads': self.rejected_downloads,
+            'rejected_sessions': self.rejected_sessions,
+            'evicted_sessions': self.evicted_sessions,
+            'held_transmissions': sum(hold.held for hold in self._holds),
+        }
+
+
+# Global memory pressure controller instance
+memory_pressure = MemoryPressureController()
+
+metrics.gauge('memory_pressure_level', 'Memory pressure level (0 OK, 1 ELEVATED, 2 HIGH, 3 CRITICAL)', function=lambda: int(memory_pressure.level))
+metrics.gauge('memory_rss_megabytes', 'Process RSS at the last pressure check', function=lambda: memory_pressure.rss_mb)
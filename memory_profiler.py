@@ -0,0 +1,223 @@
+"""
+Opt-in allocation profiler built on tracemalloc (MEMORY_PROFILER=1 or /memprofile on).
+
+Every MEMORY_PROFILER_INTERVAL seconds a snapshot is grouped per source file
+and per subsystem and diffed against the previous one, so /memory-debug and
+/memprofile show *what* grew, not just that RSS did. Only the per-file totals
+of the previous snapshot are kept (a few hundred entries), never the
+snapshot itself.
+
+Tracing keeps MEMORY_PROFILER_FRAMES frames per allocation (default 1: the
+allocating line), which holds tracemalloc's own overhead to roughly one small
+record per live block - cheap enough to leave on in production.
+"""
+
+import os
+import asyncio
+import linecache
+import tracemalloc
+from threading import Lock
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from logger import LOGGER
+
+MEMORY_PROFILER = os.getenv("MEMORY_PROFILER", "").lower() in ("1", "true", "yes")
+MEMORY_PROFILER_INTERVAL = int(os.getenv("MEMORY_PROFILER_INTERVAL", "300"))
+MEMORY_PROFILER_FRAMES = int(os.getenv("MEMORY_PROFILER_FRAMES", "1"))
+MEMORY_PROFILER_TOP = 10
+
+# First match wins; paths are compared with '/' separators
+SUBSYSTEMS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ('session_manager', ('helpers/session_manager.py', 'phone_auth.py', 'access_control.py')),
+    ('progress_throttles', ('helpers/transfer_stats.py', 'rate_governor.py', 'helpers/msg.py')),
+    ('transfer', ('helpers/transfer.py', 'helpers/utils.py', 'helpers/files.py', 'helpers/workspace.py',
+                  'helpers/ffmpeg_pool.py', 'helpers/media_probe.py', 'queue_manager.py')),
+    ('cache', ('/cache.py', 'file_index.py', 'web_templates.py', 'http_compression.py')),
+    ('database', ('database_sqlite.py', 'db_browser.py', '/sqlite3/')),
+    ('backup', ('cloud_backup.py', 'incremental_backup.py')),
+    ('web', ('server_wsgi.py', 'asgi_app.py', 'file_responder.py', '/waitress/', '/uvicorn/')),
+    ('pyrogram', ('/pyrogram/', '/tgcrypto', '/pyaes/')),
+    ('asyncio', ('/asyncio/', '/uvloop/')),
+)
+
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+_PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__)).replace('\\', '/') + '/'
+_STDLIB_ROOT = os.path.dirname(os.__file__).replace('\\', '/') + '/'
+
+
+def subsystem_for(filename: str) -> str:
+    path = filename.replace('\\', '/')
+    for name, patterns in SUBSYSTEMS:
+        for pattern in patterns:
+            if pattern in path:
+                return name
+    return 'other'
+
+
+def _short_path(filename: str) -> str:
+    path = filename.replace('\\', '/')
+    for marker in ('/site-packages/', '/dist-packages/'):
+        if marker in path:
+            return path.split(marker, 1)[1]
+    for root in (_PROJECT_ROOT, _STDLIB_ROOT):
+        if path.startswith(root):
+            return path[len(root):]
+    return path
+
+
+class MemoryProfiler:
+    def __init__(self):
+        self.enabled = False
+        # Whether start() turned tracemalloc on (it may already run via PYTHONTRACEMALLOC)
+        self._owns_tracing = False
+        # take() runs from the periodic task's thread and from /memory-debug
+        self._lock = Lock()
+        self.snapshots = 0
+        self._previous_files: Dict[str, int] = {}
+        self._previous_subsystems: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.last_report: Optional[dict] = None
+
+    def start(self) -> bool:
+        if self.enabled:
+            return False
+        self._owns_tracing = not tracemalloc.is_tracing()
+        if self._owns_tracing:
+            tracemalloc.start(MEMORY_PROFILER_FRAMES)
+        self.enabled = True
+        self._previous_files = {}
+        self._previous_subsystems = {}
+        LOGGER(__name__).info(f"Memory profiler started ({MEMORY_PROFILER_FRAMES} frame(s), every {MEMORY_PROFILER_INTERVAL}s)")
+        return True
+
+    def stop(self) -> bool:
+        if not self.enabled:
+            return False
+        self.enabled = False
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        with self._lock:
+            if self._owns_tracing:
+                tracemalloc.stop()
+                self._owns_tracing = False
+            self._previous_files = {}
+            self._previous_subsystems = {}
+        LOGGER(__name__).info("Memory profiler stopped")
+        return True
+
+    def take(self) -> Optional[dict]:
+        """Snapshot, diff against the previous one and store the report"""
+        with self._lock:
+            return self._take()
+
+    def _take(self) -> Optional[dict]:
+        if not self.enabled:
+            return None
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        files: Dict[str, int] = {}
+        counts: Dict[str, int] = {}
+        for stat in snapshot.statistics('filename'):
+            filename = stat.traceback[0].filename
+            files[filename] = stat.size
+            counts[filename] = stat.count
+
+        subsystems: Dict[str, int] = {}
+        for filename, size in files.items():
+            name = subsystem_for(filename)
+            subsystems[name] = subsystems.get(name, 0) + size
+
+        first = not self._previous_files
+        growers: List[Tuple[int, str]] = []
+        for filename in files.keys() | self._previous_files.keys():
+            delta = files.get(filename, 0) - self._previous_files.get(filename, 0)
+            if delta:
+                growers.append((delta, filename))
+        growers.sort(reverse=True)
+
+        top_lines = snapshot.statistics('lineno')[:MEMORY_PROFILER_TOP]
+        del snapshot
+
+        current, peak = tracemalloc.get_traced_memory()
+        report = {
+            'taken_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'baseline': first,
+            'traced_mb': round(current / 1024 / 1024, 2),
+            'peak_mb': round(peak / 1024 / 1024, 2),
+            'overhead_mb': round(tracemalloc.get_tracemalloc_memory() / 1024 / 1024, 2),
+            'subsystems': [
+                {
+                    'name': name,
+                    'kb': round(size / 1024, 1),
+                    'delta_kb': 0.0 if first else round((size - self._previous_subsystems.get(name, 0)) / 1024, 1),
+                }
+                for name, size in sorted(subsystems.items(), key=lambda item: item[1], reverse=True)
+            ],
+            'top_growers': [] if first else [
+                {
+                    'file': _short_path(filename),
+                    'subsystem': subsystem_for(filename),
+                    'kb': round(files.get(filename, 0) / 1024, 1),
+                    'delta_kb': round(delta / 1024, 1),
+                    'blocks': counts.get(filename, 0),
+                }
+                for delta, filename in growers[:MEMORY_PROFILER_TOP] if delta > 0
+            ],
+            'top_lines': [
+                {
+                    'line': f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                    'kb': round(stat.size / 1024, 1),
+                    'blocks': stat.count,
+                }
+                for stat in top_lines
+            ],
+        }
+
+        self._previous_files = files
+        self._previous_subsystems = subsystems
+        self.snapshots += 1
+        self.last_report = report
+        return report
+
+    async def take_async(self) -> Optional[dict]:
+        return await asyncio.to_thread(self.take)
+
+    def ensure_running(self):
+        """Start the periodic snapshot task on the current loop if profiling is on"""
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._periodic())
+
+    async def _periodic(self):
+        while self.enabled:
+            try:
+                report = await self.take_async()
+                if report and report['top_growers']:
+                    top = report['top_growers'][0]
+                    LOGGER(__name__).info(
+                        f"Memory profile: traced {report['traced_mb']}MB, top grower {top['file']} "
+                        f"+{top['delta_kb']}KB ({top['subsystem']})"
+                    )
+                await asyncio.sleep(MEMORY_PROFILER_INTERVAL)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                LOGGER(__name__).error(f"Memory profiler error: {e}")
+                await asyncio.sleep(MEMORY_PROFILER_INTERVAL)
+
+    def get_report(self) -> dict:
+        if not self.enabled:
+            return {'enabled': False}
+        return dict(self.last_report or {}, enabled=True, snapshots=self.snapshots)
+
+
+# Global memory profiler instance
+memory_profiler = MemoryProfiler()
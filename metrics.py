@@ -0,0 +1,239 @@
+"""
+In-process metrics registry with a Prometheus text exposition (/metrics).
+
+Counters, gauges and histograms keep their values in preallocated
+array('d') slots: one slot per label set (histograms: one per bucket plus
+count and sum), reserved when the label set is first seen. Label sets known
+up front (outcomes, rejection reasons) are reserved at import, so an update
+on the hot path is a cached child lookup plus a float add under a lock -
+no allocation per sample.
+
+State that the owning object already tracks (active downloads, cache hits)
+is exported through function-backed metrics, read only at scrape time.
+"""
+
+import os
+from array import array
+from bisect import bisect_left
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from logger import LOGGER, get_logging_stats
+
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "bot")
+
+# Latency buckets in seconds, from a cache hit to a slow DB write
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_INF_LABEL = 'le="+Inf"'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Child:
+    """A metric bound to one label set; resolves to a fixed offset in the value array"""
+    __slots__ = ('_metric', '_offset')
+
+    def __init__(self, metric: '_Metric', offset: int):
+        self._metric = metric
+        self._offset = offset
+
+    def inc(self, amount: float = 1.0):
+        metric = self._metric
+        with metric._lock:
+            metric._values[self._offset] += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        metric = self._metric
+        with metric._lock:
+            metric._values[self._offset] = value
+
+    def observe(self, value: float):
+        metric = self._metric
+        buckets = metric.buckets
+        offset = self._offset
+        index = bisect_left(buckets, value)
+        with metric._lock:
+            values = metric._values
+            if index < len(buckets):
+                values[offset + index] += 1
+            values[offset + len(buckets)] += 1
+            values[offset + len(buckets) + 1] += value
+
+
+class _Metric:
+    kind = 'untyped'
+    buckets: Tuple[float, ...] = ()
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._lock = Lock()
+        self._values = array('d')
+        self._children: Dict[Tuple[str, ...], _Child] = {}
+        self._default = None if self.labelnames or function else self.labels()
+
+    @property
+    def _width(self) -> int:
+        return 1
+
+    def labels(self, *values) -> _Child:
+        """Child for a label set (reserved on first use, then cached)"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = _Child(self, len(self._values))
+                    self._values.extend([0.0] * self._width)
+                    self._children[key] = child
+        return child
+
+    def prepare(self, *label_sets: Sequence[str]):
+        """Reserve slots for label sets known up front"""
+        for label_set in label_sets:
+            self.labels(*label_set)
+        return self
+
+    def _label_text(self, key: Tuple[str, ...], extra: str = '') -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def _snapshot(self) -> Tuple[List[Tuple[Tuple[str, ...], int]], array]:
+        with self._lock:
+            return [(key, child._offset) for key, child in self._children.items()], array('d', self._values)
+
+    def render(self, full_name: str) -> List[str]:
+        lines = [f"# HELP {full_name} {self.help}", f"# TYPE {full_name} {self.kind}"]
+        if self.function is not None:
+            lines.append(f"{full_name} {_format_value(float(self.function()))}")
+            return lines
+        children, values = self._snapshot()
+        for key, offset in children:
+            lines.append(f"{full_name}{self._label_text(key)} {_format_value(values[offset])}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.inc(-amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames)
+
+    @property
+    def _width(self) -> int:
+        # One count per bucket, then total count and sum
+        return len(self.buckets) + 2
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def render(self, full_name: str) -> List[str]:
+        lines = [f"# HELP {full_name} {self.help}", f"# TYPE {full_name} histogram"]
+        children, values = self._snapshot()
+        width = len(self.buckets)
+        for key, offset in children:
+            cumulative = 0.0
+            for index, bound in enumerate(self.buckets):
+                cumulative += values[offset + index]
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{full_name}_bucket{self._label_text(key, le)} {_format_value(cumulative)}")
+            count = values[offset + width]
+            lines.append(f"{full_name}_bucket{self._label_text(key, _INF_LABEL)} {_format_value(count)}")
+            lines.append(f"{full_name}_count{self._label_text(key)} {_format_value(count)}")
+            lines.append(f"{full_name}_sum{self._label_text(key)} {_format_value(values[offset + width + 1])}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self, namespace: str = METRICS_NAMESPACE):
+        self.namespace = namespace
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Re-registration (module reload, second import path) keeps the first series
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                function: Optional[Callable[[], float]] = None) -> Counter:
+        return self._register(Counter(name, help_text, labelnames, function))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames, function))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in Prometheus text format (version 0.0.4)"""
+        lines: List[str] = []
+        for name, metric in sorted(self._metrics.items()):
+            full_name = f"{self.namespace}_{name}" if self.namespace else name
+            try:
+                lines.extend(metric.render(full_name))
+            except Exception as e:
+                LOGGER(__name__).warning(f"Metric {full_name} could not be collected: {e}")
+        lines.append('')
+        return '\n'.join(lines)
+
+
+# Global metrics registry instance
+metrics = MetricsRegistry()
+
+# The logging pipeline can't import this module (it logs through it), so its counters live here
+metrics.counter('log_records_dropped_total', 'Log records dropped because the log queue was full',
+                function=lambda: get_logging_stats()['dropped'])
+metrics.counter('log_records_suppressed_total', 'Log records suppressed by per-call-site rate limits',
+                function=lambda: get_logging_stats()['suppressed'])
+metrics.gauge('log_queue_depth', 'Log records waiting for the writer thread',
+              function=lambda: get_logging_stats()['queued'])
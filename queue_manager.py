@@ -1,13 +1,29 @@
 import os
 import asyncio
+import logging
 from datetime import datetime
 from typing import Dict, Set, List, Optional, Tuple, Union
 from logger import LOGGER
 
 from database_sqlite import db
+from metrics import metrics
 
 from config import PyroConf
 
+_log = LOGGER(__name__)
+
+_DOWNLOADS_STARTED = metrics.counter('downloads_started_total', 'Downloads admitted by the download manager')
+_DOWNLOADS_REJECTED = metrics.counter(
+    'downloads_rejected_total', 'Downloads refused at admission', ('reason',)
+).prepare(('cooldown',), ('busy',), ('capacity',), ('memory_pressure',))
+_DOWNLOADS_FINISHED = metrics.counter(
+    'downloads_finished_total', 'Finished download tasks', ('outcome',)
+).prepare(('ok',), ('cancelled',), ('error',))
+_DOWNLOAD_SECONDS = metrics.histogram(
+    'download_duration_seconds', 'Wall time of a download task',
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 3600)
+)
+
 class DownloadManager:
     """Simplified download manager - just tracks active downloads and concurrency limits"""
     
@@ -75,6 +91,7 @@ class DownloadManager:
                     minutes = remaining // 60
                     seconds = remaining % 60
                     
+                    _DOWNLOADS_REJECTED.labels('cooldown').inc()
                     tier_name = "PREMIUM" if is_premium else "FREE"
                     time_str = f"{minutes}m {seconds}s" if minutes > 0 else f"{seconds}s"
                     
@@ -86,6 +103,7 @@ class DownloadManager:
                     )
             
             if user_id in self.active_downloads:
+                _DOWNLOADS_REJECTED.labels('busy').inc()
                 return False, (
                     "You already have a download in progress!\n\n"
                     "Please wait for it to complete.\n\n"
@@ -94,20 +112,35 @@ class DownloadManager:
                 )
             
             if len(self.active_downloads) >= self.max_concurrent:
+                _DOWNLOADS_REJECTED.labels('capacity').inc()
                 return False, (
                     f"Server is busy!\n\n"
                     f"Active Downloads: {len(self.active_downloads)}/{self.max_concurrent}\n\n"
                     f"Please try again in a few minutes."
                 )
             
+            from memory_pressure import memory_pressure
+            if len(self.active_downloads) >= memory_pressure.download_limit(self.max_concurrent):
+                memory_pressure.rejected_downloads += 1
+                _DOWNLOADS_REJECTED.labels('memory_pressure').inc()
+                return False, (
+                    "Server is under heavy load!\n\n"
+                    "New downloads are paused for a moment to keep running ones alive.\n\n"
+                    "Please try again in a few minutes."
+                )
+            
             self.add_active_download(user_id)
             task = asyncio.create_task(self._execute_download(user_id, download_coro, message))
             self.active_tasks[user_id] = task
+            _DOWNLOADS_STARTED.inc()
             
             return True, None
     
     async def _execute_download(self, user_id: int, download_coro, message):
         import gc
+        from time import perf_counter
+        started = perf_counter()
+        outcome = 'error'
         try:
             from memory_monitor import memory_monitor
             from helpers.session_manager import session_manager
@@ -121,12 +154,14 @@ class DownloadManager:
             try:
                 await download_coro
             except asyncio.CancelledError:
-                LOGGER(__name__).info(f"Download cancelled for user {user_id}")
+                _log.info("Download cancelled for user %s", user_id)
                 raise
             
             memory_monitor.log_memory_snapshot("Download Completed", f"User {user_id} | Active: {len(self.active_downloads)}", silent=True)
+            outcome = 'ok'
         except asyncio.CancelledError:
-            LOGGER(__name__).info(f"Download task cancelled for user {user_id}")
+            outcome = 'cancelled'
+            _log.info("Download task cancelled for user %s", user_id)
             try:
                 await message.reply("Download cancelled")
             except:
@@ -140,6 +175,8 @@ class DownloadManager:
             except:
                 pass
         finally:
+            _DOWNLOADS_FINISHED.labels(outcome).inc()
+            _DOWNLOAD_SECONDS.observe(perf_counter() - started)
             async with self._lock:
                 self.remove_active_download(user_id)
                 self.active_tasks.pop(user_id, None)
@@ -148,21 +185,22 @@ class DownloadManager:
                 from helpers.session_manager import session_manager
                 from helpers.transfer import get_ram_usage_mb
                 
-                before_cleanup = get_ram_usage_mb()
+                # RSS is only sampled for the [RAM] debug line
+                verbose = _log.isEnabledFor(logging.DEBUG)
+                before_cleanup = get_ram_usage_mb() if verbose else 0.0
                 await session_manager.remove_session(user_id)
                 
                 gc.collect()
-                after_cleanup = get_ram_usage_mb()
-                ram_released = before_cleanup - after_cleanup
-                
-                LOGGER(__name__).info(
-                    f"[RAM] SESSION CLEANUP: User {user_id} - "
-                    f"RAM after cleanup: {after_cleanup:.1f}MB (released: {ram_released:.1f}MB)"
-                )
+                if verbose:
+                    after_cleanup = get_ram_usage_mb()
+                    _log.debug(
+                        "[RAM] SESSION CLEANUP: User %s - RAM after cleanup: %.1fMB (released: %.1fMB)",
+                        user_id, after_cleanup, before_cleanup - after_cleanup
+                    )
             except Exception as e:
                 gc.collect()
             
-            LOGGER(__name__).info(f"Download completed for user {user_id}. Active: {len(self.active_downloads)}. Session+GC cleanup done.")
+            _log.info("Download completed for user %s. Active: %d. Session+GC cleanup done.", user_id, len(self.active_downloads))
             
             try:
                 user_type = db.get_user_type(user_id)
@@ -172,11 +210,9 @@ class DownloadManager:
                 async with self._lock:
                     self.user_cooldowns[user_id] = datetime.now().timestamp() + delay
                 
-                LOGGER(__name__).info(
-                    f"Download cooldown set for user {user_id} ({user_type}): {delay}s until next download allowed"
-                )
+                _log.info("Download cooldown set for user %s (%s): %ss until next download allowed", user_id, user_type, delay)
             except Exception as e:
-                LOGGER(__name__).warning(f"Could not set download cooldown for user {user_id}: {e}")
+                _log.warning("Could not set download cooldown for user %s: %s", user_id, e)
     
     async def get_status(self, user_id: int) -> str:
         async with self._lock:
@@ -289,3 +325,6 @@ IS_CONSTRAINED = bool(
 MAX_CONCURRENT = 10 if IS_CONSTRAINED else 20
 
 download_manager = DownloadManager(max_concurrent=MAX_CONCURRENT)
+
+metrics.gauge('downloads_active', 'Downloads currently running', function=lambda: len(download_manager.active_downloads))
+metrics.gauge('downloads_max_concurrent', 'Configured download concurrency', function=lambda: download_manager.max_concurrent)
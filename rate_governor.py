@@ -0,0 +1,352 @@
+"""
+Central Telegram API rate governor.
+
+Every bot and user-session API call that can hit FloodWait should go through
+rate_governor.call() (or acquire()/try_acquire() when the call can't be wrapped).
+It keeps token buckets per (client, method) and, for sends and edits, per
+(client, chat), turns
+FloodWait/SlowmodeWait errors into exact pauses instead of guessed sleeps, and
+gives user-facing sends precedence over progress edits, broadcasts and
+dump-channel copies by letting lower priorities only spend tokens above a
+reserve.
+"""
+
+import os
+import re
+import asyncio
+from enum import IntEnum
+from time import monotonic
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, Any
+from logger import LOGGER
+
+
+class Priority(IntEnum):
+    USER_SEND = 0       # Files/messages the user is waiting for
+    PROGRESS_EDIT = 1   # Progress message edits (droppable)
+    BULK = 2            # Broadcasts and batch reads
+    DUMP_COPY = 3       # Dump channel copies (monitoring only)
+
+
+# Fraction of a bucket's burst capacity that each priority must leave untouched.
+# USER_SEND can drain the bucket; lower priorities back off earlier.
+PRIORITY_RESERVE = {
+    Priority.USER_SEND: 0.0,
+    Priority.PROGRESS_EDIT: 0.1,
+    Priority.BULK: 0.2,
+    Priority.DUMP_COPY: 0.3,
+}
+
+# (rate per second, burst) - Telegram documents ~30 msg/s per bot overall,
+# ~1 msg/s per private chat and ~20 msg/min per group/channel.
+GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))
+DEFAULT_METHOD_LIMIT = (GLOBAL_RATE, GLOBAL_RATE)
+METHOD_LIMITS: Dict[str, Tuple[float, float]] = {
+    "edit_message_text": (10.0, 10.0),
+    "copy_message": (20.0, 20.0),
+    "get_messages": (float(os.getenv("TG_GET_MESSAGES_RATE", "3")), 10.0),
+    "get_chat": (3.0, 10.0),
+}
+# Bound Message shortcuts and the client API method they call, so both paths share one bucket
+MESSAGE_METHODS = {
+    "edit": "edit_message_text",
+    "edit_text": "edit_message_text",
+    "edit_caption": "edit_message_caption",
+    "edit_media": "edit_message_media",
+    "edit_reply_markup": "edit_message_reply_markup",
+    "reply": "send_message",
+    "reply_text": "send_message",
+    "reply_photo": "send_photo",
+    "reply_video": "send_video",
+    "reply_audio": "send_audio",
+    "reply_document": "send_document",
+    "reply_animation": "send_animation",
+    "reply_voice": "send_voice",
+    "reply_video_note": "send_video_note",
+    "reply_sticker": "send_sticker",
+    "reply_media_group": "send_media_group",
+    "delete": "delete_messages",
+    "forward": "forward_messages",
+    "copy": "copy_message",
+    "pin": "pin_chat_message",
+    "unpin": "unpin_chat_message",
+}
+# Bound CallbackQuery methods that aren't named after the client API method
+CALLBACK_QUERY_METHODS = {
+    "answer": "answer_callback_query",
+}
+# Per-chat limits are on messages posted to a chat; reads (get_messages, get_chat...)
+# only count against their method bucket
+CHAT_LIMITED_PREFIXES = ("send_", "edit_message_", "copy_", "forward_")
+PRIVATE_CHAT_LIMIT = (1.0, 3.0)
+GROUP_CHAT_LIMIT = (20.0 / 60.0, 5.0)
+
+# Hard cap on per-chat buckets kept in memory (LRU eviction)
+MAX_CHAT_BUCKETS = 2000
+
+# FloodWaits longer than this are not retried automatically
+MAX_AUTO_WAIT_SECONDS = float(os.getenv("TG_MAX_AUTO_WAIT", "300"))
+
+_WAIT_PATTERN = re.compile(r"wait of (\d+) seconds", re.IGNORECASE)
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def wait_time(self, reserve: float, now: float) -> float:
+        """Seconds until one token can be spent while keeping `reserve` tokens"""
+        self._refill(now)
+        needed = 1.0 + reserve * self.capacity
+        needed = min(needed, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1.0
+
+
+class RateGovernor:
+    def __init__(self):
+        self.method_buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self.chat_buckets: "OrderedDict[Tuple[str, Any], TokenBucket]" = OrderedDict()
+        self.pauses: Dict[Tuple[str, Any], float] = {}
+        self.counters = {
+            'calls': 0,
+            'throttled': 0,
+            'throttled_seconds': 0.0,
+            'dropped': 0,
+            'flood_waits': 0,
+            'flood_wait_seconds': 0,
+            'slowmode_waits': 0,
+            'retries': 0,
+            'errors': 0,
+        }
+        self.calls_by_priority = {p.name: 0 for p in Priority}
+
+    # ---- helpers -------------------------------------------------------
+
+    @staticmethod
+    def scope_of(client) -> str:
+        """Bucket namespace for a client: the bot and each user session are limited separately"""
+        if client is None:
+            return "bot"
+        if isinstance(client, str):
+            return client
+        return getattr(client, 'name', None) or "bot"
+
+    @staticmethod
+    def parse_wait(error) -> Tuple[Optional[float], Optional[str]]:
+        """
+        Extract the pause Telegram asked for.
+
+        Returns:
+            (seconds, kind) where kind is 'flood' or 'slowmode', or (None, None)
+        """
+        try:
+            from pyrogram.errors import FloodWait, SlowmodeWait
+            if isinstance(error, SlowmodeWait):
+                return float(error.value), 'slowmode'
+            if isinstance(error, FloodWait):
+                return float(error.value), 'flood'
+        except ImportError:
+            pass
+
+        text = str(error)
+        match = _WAIT_PATTERN.search(text)
+        if match:
+            kind = 'slowmode' if 'SLOWMODE' in text.upper() else 'flood'
+            return float(match.group(1)), kind
+        return None, None
+
+    def _method_bucket(self, scope: str, method: str) -> TokenBucket:
+        key = (scope, method)
+        bucket = self.method_buckets.get(key)
+        if bucket is None:
+            rate, burst = METHOD_LIMITS.get(method, DEFAULT_METHOD_LIMIT)
+            bucket = TokenBucket(rate, burst)
+            self.method_buckets[key] = bucket
+        return bucket
+
+    @staticmethod
+    def _chat_limited(method: str, chat_id) -> bool:
+        return chat_id is not None and method.startswith(CHAT_LIMITED_PREFIXES)
+
+    def _chat_bucket(self, scope: str, method: str, chat_id) -> Optional[TokenBucket]:
+        if not self._chat_limited(method, chat_id):
+            return None
+        key = (scope, chat_id)
+        bucket = self.chat_buckets.get(key)
+        if bucket is None:
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            rate, burst = PRIVATE_CHAT_LIMIT if is_private else GROUP_CHAT_LIMIT
+            bucket = TokenBucket(rate, burst)
+            self.chat_buckets[key] = bucket
+            if len(self.chat_buckets) > MAX_CHAT_BUCKETS:
+                self.chat_buckets.popitem(last=False)
+        else:
+            self.chat_buckets.move_to_end(key)
+        return bucket
+
+    def _pause_remaining(self, scope: str, method: str, chat_id, now: float) -> float:
+        remaining = 0.0
+        keys = [(scope, method)]
+        if self._chat_limited(method, chat_id):
+            keys.append((scope, ('chat', chat_id)))
+        for key in keys:
+            until = self.pauses.get(key)
+            if until is None:
+                continue
+            if until <= now:
+                del self.pauses[key]
+            else:
+                remaining = max(remaining, until - now)
+        return remaining
+
+    def _wait_time(self, scope: str, method: str, chat_id, priority: Priority) -> float:
+        now = monotonic()
+        reserve = PRIORITY_RESERVE.get(priority, 0.0)
+        wait = self._pause_remaining(scope, method, chat_id, now)
+        wait = max(wait, self._method_bucket(scope, method).wait_time(reserve, now))
+        chat_bucket = self._chat_bucket(scope, method, chat_id)
+        if chat_bucket is not None:
+            wait = max(wait, chat_bucket.wait_time(reserve, now))
+        return wait
+
+    def _consume(self, scope: str, method: str, chat_id, priority: Priority):
+        self._method_bucket(scope, method).consume()
+        chat_bucket = self._chat_bucket(scope, method, chat_id)
+        if chat_bucket is not None:
+            chat_bucket.consume()
+        self.counters['calls'] += 1
+        self.calls_by_priority[priority.name] += 1
+
+    @staticmethod
+    def _resolve(func, args, kwargs) -> Tuple[Any, str, Any]:
+        """Work out (client, method name, chat id) for a bound Pyrogram method"""
+        owner = getattr(func, '__self__', None)
+        method = getattr(func, '__name__', 'call')
+        chat_id = kwargs.get('chat_id', args[0] if args else None)
+        client = owner
+        if owner is not None and hasattr(owner, 'chat') and hasattr(owner, 'id'):
+            # Bound Message method (edit_text, delete, reply...): charge the client API method it calls
+            method = MESSAGE_METHODS.get(method, method)
+            chat_id = getattr(getattr(owner, 'chat', None), 'id', None)
+            client = getattr(owner, '_client', None)
+        elif owner is not None and hasattr(owner, 'message') and hasattr(owner, 'data'):
+            # Bound CallbackQuery method (edit_message_text, answer...): its arguments are
+            # the new text/markup, the chat is the one of the message the button is on
+            method = CALLBACK_QUERY_METHODS.get(method, method)
+            chat_id = getattr(getattr(getattr(owner, 'message', None), 'chat', None), 'id', None)
+            client = getattr(owner, '_client', None)
+        return client, method, chat_id
+
+    # ---- public API ----------------------------------------------------
+
+    def try_acquire(self, client, method: str, chat_id=None,
+                    priority: Priority = Priority.PROGRESS_EDIT) -> bool:
+        """Non-blocking acquire for droppable calls (progress edits). Returns False if throttled."""
+        scope = self.scope_of(client)
+        if self._wait_time(scope, method, chat_id, priority) > 0:
+            self.counters['dropped'] += 1
+            return False
+        self._consume(scope, method, chat_id, priority)
+        return True
+
+    async def acquire(self, client, method: str, chat_id=None,
+                      priority: Priority = Priority.USER_SEND):
+        """Wait until a call is allowed, then spend its tokens"""
+        scope = self.scope_of(client)
+        while True:
+            wait = self._wait_time(scope, method, chat_id, priority)
+            if wait <= 0:
+                break
+            self.counters['throttled'] += 1
+            self.counters['throttled_seconds'] += wait
+            await asyncio.sleep(wait)
+        self._consume(scope, method, chat_id, priority)
+
+    def note_wait(self, client, method: str, chat_id, seconds: float, kind: str = 'flood'):
+        """Record a FloodWait/SlowmodeWait so every caller on that bucket pauses exactly that long"""
+        scope = self.scope_of(client)
+        until = monotonic() + seconds
+        if kind == 'slowmode':
+            key = (scope, ('chat', chat_id))
+            self.counters['slowmode_waits'] += 1
+        else:
+            key = (scope, method)
+            self.counters['flood_waits'] += 1
+            self.counters['flood_wait_seconds'] += int(seconds)
+        self.pauses[key] = max(self.pauses.get(key, 0.0), until)
+        LOGGER(__name__).warning(
+            f"[RATE] {kind} wait {seconds:.0f}s on {scope}.{method} (chat {chat_id}) - pausing that bucket"
+        )
+
+    async def call(self, func, *args, priority: Priority = Priority.USER_SEND,
+                   max_retries: int = 3, **kwargs):
+        """
+        Run a Pyrogram client/message method under the governor.
+
+        The method name is taken from the bound function and the target chat from
+        its chat_id argument (first positional or chat_id=), or from the bound
+        Message/CallbackQuery for message.edit_text()-style calls. Per-chat
+        buckets only apply to sends and edits. FloodWait/SlowmodeWait are
+        recorded and retried after the exact pause, up to max_retries times.
+        """
+        client, method, chat_id = self._resolve(func, args, kwargs)
+
+        attempt = 0
+        while True:
+            await self.acquire(client, method, chat_id, priority)
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                seconds, kind = self.parse_wait(e)
+                if seconds is None:
+                    self.counters['errors'] += 1
+                    raise
+                self.note_wait(client, method, chat_id, seconds, kind)
+                if attempt >= max_retries or seconds > MAX_AUTO_WAIT_SECONDS:
+                    raise
+                attempt += 1
+                self.counters['retries'] += 1
+
+    async def try_call(self, func, *args, priority: Priority = Priority.PROGRESS_EDIT, **kwargs):
+        """
+        Droppable variant for progress edits: skipped when throttled, never
+        retried and never raises. Returns None if skipped or failed.
+        """
+        client, method, chat_id = self._resolve(func, args, kwargs)
+        if not self.try_acquire(client, method, chat_id, priority):
+            return None
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            seconds, kind = self.parse_wait(e)
+            if seconds is not None:
+                self.note_wait(client, method, chat_id, seconds, kind)
+            return None
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.counters)
+        stats['throttled_seconds'] = round(stats['throttled_seconds'], 1)
+        stats['calls_by_priority'] = dict(self.calls_by_priority)
+        stats['active_pauses'] = sum(1 for until in self.pauses.values() if until > monotonic())
+        stats['chat_buckets'] = len(self.chat_buckets)
+        return stats
+
+
+# Global rate governor instance
+rate_governor = RateGovernor()
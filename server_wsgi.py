@@ -5,69 +5,24 @@ Optimized for constrained environments (Render 512MB, Replit)
 """
 import os
 import sys
-from urllib.parse import parse_qs
+from urllib.parse import parse_qs, quote
 from html import escape
 from logger import LOGGER
+from wsgi_router import Router
+from web_templates import templates
+from http_compression import CompressionMiddleware, finalize_response
+from metrics import metrics
+from time import perf_counter
 
 # Initialize module logger
 _logger = LOGGER(__name__)
 
 def load_landing_page(session_id):
-    """Landing page shown before ad verification - prevents premature code generation"""
-    html = f'''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <meta name="robots" content="noindex, nofollow">
-    <title>Complete Verification</title>
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; display: flex; align-items: center; justify-content: center; padding: 20px; }}
-        .container {{ background: white; border-radius: 20px; padding: 40px; max-width: 500px; width: 100%; box-shadow: 0 20px 60px rgba(0, 0, 0, 0.3); text-align: center; }}
-        .icon {{ font-size: 64px; margin-bottom: 20px; animation: scaleIn 0.5s ease-out; }}
-        @keyframes scaleIn {{ from {{ transform: scale(0); opacity: 0; }} to {{ transform: scale(1); opacity: 1; }} }}
-        h1 {{ color: #2d3748; margin-bottom: 15px; font-size: 28px; }}
-        .message {{ color: #718096; margin-bottom: 30px; font-size: 16px; line-height: 1.6; }}
-        .instructions {{ background: #edf2f7; border-radius: 12px; padding: 20px; text-align: left; margin: 25px 0; }}
-        .instructions h3 {{ color: #2d3748; font-size: 18px; margin-bottom: 15px; }}
-        .instructions ol {{ color: #4a5568; padding-left: 20px; line-height: 1.8; }}
-        .btn {{ border: none; padding: 16px 40px; border-radius: 8px; font-size: 18px; font-weight: 600; cursor: pointer; margin: 10px 5px; transition: all 0.3s ease; display: inline-block; text-decoration: none; min-width: 250px; }}
-        .btn-primary {{ background: #48bb78; color: white; }}
-        .btn-primary:hover {{ background: #38a169; transform: translateY(-2px); box-shadow: 0 6px 20px rgba(72, 187, 120, 0.4); }}
-        @media (max-width: 500px) {{
-            .container {{ padding: 30px 20px; }}
-            h1 {{ font-size: 24px; }}
-            .btn {{ min-width: 100%; margin: 8px 0; }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="icon">🎯</div>
-        <h1>Almost There!</h1>
-        <p class="message">You've successfully completed the ad. Click the button below to get your verification code.</p>
-        
-        <div class="instructions">
-            <h3>📋 What happens next?</h3>
-            <ol>
-                <li>Click "Get Verification Code" below</li>
-                <li>Copy your unique code</li>
-                <li>Go back to the Telegram bot</li>
-                <li>Enter the code to unlock premium downloads</li>
-            </ol>
-        </div>
-        
-        <a href="/verify-ad?session={escape(session_id)}&confirm=1" class="btn btn-primary">✅ Get Verification Code</a>
-    </div>
-</body>
-</html>'''
-    return html
+    """Landing page shown before ad verification - prevents premature code generation (encoded HTML)"""
+    return templates.render('landing.html', session_id=session_id)
 
 def load_template(code, title, message, bot_username):
-    """Minimal HTML template - replaces Jinja2"""
-    icon = '✅' if code else '❌'
-    
+    """Ad verification result page (encoded HTML) - precompiled template, replaces Jinja2"""
     if code:
         auto_verify_html = ''
         if bot_username:
@@ -75,141 +30,19 @@ def load_template(code, title, message, bot_username):
         else:
             auto_verify_html = '<div class="alert alert-info show">ℹ️ Bot username not configured. Use manual verification below.</div>'
         
-        code_section = f'''
-    <div class="code-box" id="codeBox">
-        <div class="code-label">Your Verification Code</div>
-        <div class="verification-code" id="code" onclick="copyCode()" title="Click to copy">{escape(code)}</div>
-    </div>
-    
-    <div class="timer-warning" id="timerWarning">
-        ⏰ This code expires in <span id="timeRemaining">30:00</span> minutes
-    </div>
-    
-    {auto_verify_html}
-    
-    <button class="btn btn-secondary" id="copyBtn" onclick="copyCode()">📋 Copy Code</button>
-    
-    <div class="instructions">
-        <h3>📱 Manual Verification:</h3>
-        <ol>
-            <li>Go back to the Telegram bot</li>
-            <li>Send this command:<br><code id="manualCommand">/verifypremium {escape(code)}</code></li>
-            <li>Enjoy your free downloads!</li>
-        </ol>
-    </div>
-    
-    <div style="margin-top: 20px; padding: 15px; background: #f7fafc; border-radius: 8px;">
-        <p style="font-size: 14px; color: #4a5568; margin-bottom: 10px;">
-            <strong>💡 Troubleshooting:</strong>
-        </p>
-        <ul style="text-align: left; font-size: 13px; color: #718096; padding-left: 25px;">
-            <li>Code saved in your browser for safety</li>
-            <li>Don't refresh this page - code will expire</li>
-            <li>If button doesn't work, copy code manually</li>
-            <li>Code valid for 30 minutes only</li>
-        </ul>
-    </div>
-    '''
+        code_section = templates.render('verify_code_section.html', code=code, auto_verify_html=auto_verify_html)
     else:
-        code_section = f'''
-    <div class="instructions">
-        <h3>❓ What happened?</h3>
-        <p style="margin-bottom: 15px;">{escape(message)}</p>
-        <ol>
-            <li>Go back to the Telegram bot</li>
-            <li>Use <code>/getpremium</code> to get a new ad link</li>
-            <li>Complete the ad verification</li>
-            <li>You'll receive a valid code</li>
-        </ol>
-    </div>
-    '''
-    
-    escaped_code = escape(code) if code else ''
+        code_section = templates.render('verify_error_section.html', message=message)
     
-    html = f'''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <meta name="robots" content="noindex, nofollow">
-    <title>Verification {'Successful' if code else 'Failed'}</title>
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; display: flex; align-items: center; justify-content: center; padding: 20px; }}
-        .container {{ background: white; border-radius: 20px; padding: 40px; max-width: 500px; width: 100%; box-shadow: 0 20px 60px rgba(0, 0, 0, 0.3); text-align: center; }}
-        .success-icon {{ font-size: 64px; margin-bottom: 20px; animation: scaleIn 0.5s ease-out; }}
-        @keyframes scaleIn {{ from {{ transform: scale(0); opacity: 0; }} to {{ transform: scale(1); opacity: 1; }} }}
-        h1 {{ color: #2d3748; margin-bottom: 15px; font-size: 28px; }}
-        .message {{ color: #718096; margin-bottom: 30px; font-size: 16px; line-height: 1.6; }}
-        .code-box {{ background: #f7fafc; border: 2px dashed #667eea; border-radius: 12px; padding: 20px; margin: 25px 0; }}
-        .code-label {{ color: #4a5568; font-size: 14px; font-weight: 600; margin-bottom: 10px; text-transform: uppercase; letter-spacing: 1px; }}
-        .verification-code {{ font-size: 32px; font-weight: bold; color: #667eea; font-family: 'Courier New', monospace; letter-spacing: 4px; user-select: all; cursor: pointer; padding: 10px; background: white; border-radius: 8px; transition: all 0.3s ease; }}
-        .verification-code:hover {{ background: #edf2f7; transform: scale(1.05); }}
-        .timer-warning {{ background: #fef5e7; border: 1px solid #f39c12; border-radius: 8px; padding: 12px; margin: 15px 0; color: #856404; font-size: 14px; }}
-        .instructions {{ background: #edf2f7; border-radius: 12px; padding: 20px; text-align: left; margin-top: 25px; }}
-        .instructions h3 {{ color: #2d3748; font-size: 18px; margin-bottom: 15px; }}
-        .instructions ol {{ color: #4a5568; padding-left: 20px; line-height: 1.8; }}
-        .instructions code {{ background: white; padding: 2px 8px; border-radius: 4px; font-family: 'Courier New', monospace; color: #667eea; font-size: 14px; }}
-        .btn {{ border: none; padding: 14px 32px; border-radius: 8px; font-size: 16px; font-weight: 600; cursor: pointer; margin: 10px 5px; transition: all 0.3s ease; display: inline-block; text-decoration: none; min-width: 200px; }}
-        .btn-primary {{ background: #48bb78; color: white; }}
-        .btn-primary:hover {{ background: #38a169; transform: translateY(-2px); box-shadow: 0 4px 12px rgba(72, 187, 120, 0.4); }}
-        .btn-secondary {{ background: #667eea; color: white; }}
-        .btn-secondary:hover {{ background: #5568d3; transform: translateY(-2px); box-shadow: 0 4px 12px rgba(102, 126, 234, 0.4); }}
-        .btn.success {{ background: #48bb78; }}
-        .alert {{ padding: 12px 16px; border-radius: 8px; margin: 15px 0; font-size: 14px; }}
-        .alert-info {{ background: #d1ecf1; color: #0c5460; border: 1px solid #bee5eb; }}
-        @media (max-width: 500px) {{
-            .container {{ padding: 30px 20px; }}
-            h1 {{ font-size: 24px; }}
-            .verification-code {{ font-size: 24px; letter-spacing: 2px; }}
-            .btn {{ min-width: 100%; margin: 8px 0; }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="success-icon">{icon}</div>
-        <h1>{escape(title)}</h1>
-        <p class="message">{escape(message)}</p>
-        <div id="alertContainer"></div>
-        {code_section}
-    </div>
-    <script>
-        const code = '{escaped_code}';
-        const hasCode = code && code !== '';
-        function copyCode() {{
-            if (!code) return;
-            const btn = document.getElementById('copyBtn');
-            navigator.clipboard.writeText(code).then(() => {{
-                btn.textContent = '✓ Copied!';
-                btn.classList.add('success');
-                setTimeout(() => {{ btn.textContent = '📋 Copy Code'; btn.classList.remove('success'); }}, 2000);
-            }}).catch(() => {{
-                const textArea = document.createElement('textarea');
-                textArea.value = code;
-                document.body.appendChild(textArea);
-                textArea.select();
-                document.execCommand('copy');
-                document.body.removeChild(textArea);
-                btn.textContent = '✓ Copied!';
-                setTimeout(() => {{ btn.textContent = '📋 Copy Code'; }}, 2000);
-            }});
-        }}
-        function trackClick(action) {{ try {{ localStorage.setItem('last_action', action); }} catch(e) {{}} }}
-        if (hasCode) {{
-            let expiryTime = new Date(Date.now() + 30 * 60 * 1000);
-            setInterval(() => {{
-                const remaining = expiryTime - Date.now();
-                if (remaining <= 0) {{ document.getElementById('timeRemaining').textContent = 'EXPIRED'; return; }}
-                const minutes = Math.floor(remaining / 60000);
-                const seconds = Math.floor((remaining % 60000) / 1000);
-                document.getElementById('timeRemaining').textContent = `${{minutes}}:${{seconds.toString().padStart(2, '0')}}`;
-            }}, 1000);
-        }}
-    </script>
-</body>
-</html>'''
-    return html
+    return templates.render(
+        'verify_result.html',
+        outcome='Successful' if code else 'Failed',
+        icon='✅' if code else '❌',
+        title=title,
+        message=message,
+        code_section=code_section,
+        code=code or '',
+    )
 
 import secrets
 import hashlib
@@ -267,95 +100,222 @@ def verify_password(password):
     admin_password = os.getenv('ADMIN_PASSWORD', '')
     return admin_password and password == admin_password
 
-def application(environ, start_response):
-    """Minimal WSGI application"""
-    path = environ.get('PATH_INFO', '/')
-    method = environ.get('REQUEST_METHOD', 'GET')
-    
-    headers_common = [
-        ('Cache-Control', 'no-cache, no-store, must-revalidate'),
-        ('Pragma', 'no-cache'),
-        ('Expires', '0')
-    ]
-    
+router = Router()
+
+NO_CACHE_HEADERS = (
+    ('Cache-Control', 'no-cache, no-store, must-revalidate'),
+    ('Pragma', 'no-cache'),
+    ('Expires', '0'),
+)
+# Pages that may be kept by the browser but must be revalidated (ETag -> 304)
+REVALIDATE_HEADERS = (('Cache-Control', 'no-cache'),)
+# Same for admin pages, which shared caches must never store
+PRIVATE_REVALIDATE_HEADERS = (('Cache-Control', 'private, no-cache'),)
+
+
+# Static responses are built once; the hot path only copies the header list
+_INDEX_BODY = b'{"status": "online", "message": "Telegram Bot is running!", "bot": "Restricted Content Downloader"}'
+_INDEX_HEADERS = (
+    ('Content-Type', 'application/json; charset=utf-8'),
+    ('Content-Length', str(len(_INDEX_BODY))),
+) + NO_CACHE_HEADERS
+_HEALTH_HEADERS = NO_CACHE_HEADERS
+
+# Optional bearer token for /metrics (open when unset, like /memory-debug)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+_METRICS_HEADERS = (('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),) + NO_CACHE_HEADERS
+
+_HTTP_REQUESTS = metrics.counter('http_requests_total', 'HTTP requests by route, method and status', ('route', 'method', 'status'))
+_HTTP_SECONDS = metrics.histogram('http_request_duration_seconds', 'Time until the response starts (streamed bodies excluded)', ('route',))
+_HTTP_METHODS = frozenset(('GET', 'HEAD', 'POST'))
+
+
+def _record_request(route, method, status, started):
+    # Unknown paths and methods share one series each, so scanners can't grow the label set
+    _HTTP_REQUESTS.labels(route, method if method in _HTTP_METHODS else 'other', status[:3]).inc()
+    _HTTP_SECONDS.labels(route).observe(perf_counter() - started)
+
+
+@router.route('/')
+def _index(environ, start_response, headers_common):
+    """Service status JSON"""
+    start_response('200 OK', list(_INDEX_HEADERS))
+    return [_INDEX_BODY]
+
+
+@router.route('/health')
+def _health(environ, start_response, headers_common):
+    """Health check for the hosting platform"""
+    start_response('204 No Content', list(_HEALTH_HEADERS))
+    return [b'']
+
+
+@router.route('/metrics', 'GET')
+def _metrics(environ, start_response, headers_common):
+    """Prometheus text exposition of the in-process metrics registry"""
+    if METRICS_TOKEN and not secrets.compare_digest(
+        environ.get('HTTP_AUTHORIZATION', '').encode('utf-8'), f'Bearer {METRICS_TOKEN}'.encode('utf-8')
+    ):
+        start_response('401 Unauthorized', [('Content-Type', 'text/plain; charset=utf-8'), ('WWW-Authenticate', 'Bearer')] + headers_common)
+        return [b'Unauthorized']
+    body = metrics.render().encode('utf-8')
+    start_response('200 OK', list(_METRICS_HEADERS))
+    return [body]
+
+
+@router.route('/traces', 'GET')
+def _traces(environ, start_response, headers_common):
+    """Recent download traces as JSON (?job=<id> for one, ?limit=N)"""
+    import json
+    from tracing import tracer
+
+    if not check_admin_auth(environ):
+        start_response('403 Forbidden', [('Content-Type', 'application/json; charset=utf-8')] + headers_common)
+        return [b'{"error": "Unauthorized"}']
+
+    params = parse_qs(environ.get('QUERY_STRING', ''))
+    job_id = params.get('job', [''])[0]
+    if job_id:
+        trace = tracer.get(job_id)
+        if trace is None:
+            start_response('404 Not Found', [('Content-Type', 'application/json; charset=utf-8')] + headers_common)
+            return [b'{"error": "Trace not found"}']
+        result = trace
+    else:
+        try:
+            limit = int(params.get('limit', ['20'])[0])
+        except ValueError:
+            limit = 20
+        result = {'traces': tracer.recent(limit), 'stages': tracer.stage_summary()}
+
+    body = json.dumps(result).encode('utf-8')
+    start_response('200 OK', [('Content-Type', 'application/json; charset=utf-8')] + headers_common)
+    return [body]
+
+
+@router.route('/memory-debug')
+def _memory_debug(environ, start_response, headers_common):
+    """Current memory state as JSON"""
     try:
-        if path == '/':
-            status = '200 OK'
-            body = b'{"status": "online", "message": "Telegram Bot is running!", "bot": "Restricted Content Downloader"}'
-            headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-            start_response(status, headers)
-            return [body]
-        
-        elif path == '/health':
-            status = '204 No Content'
-            headers = headers_common
-            start_response(status, headers)
-            return [b'']
-        
-        elif path == '/memory-debug':
-            try:
-                from memory_monitor import memory_monitor
-                import json
-                from datetime import datetime
-                
-                # Get current memory state and log it to file
-                mem_data = memory_monitor.get_memory_state_for_endpoint()
-                
-                # Format as pretty JSON
-                status = '200 OK'
-                body = json.dumps(mem_data, indent=2).encode('utf-8')
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-            except Exception as e:
-                status = '500 Internal Server Error'
-                body = f'{{"error": "{escape(str(e))}"}}'.encode('utf-8')
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-        
-        elif path == '/verify-ad' and method == 'GET':
-            from ad_monetization import ad_monetization
-            from config import PyroConf
-            from logger import LOGGER
-            
-            query_string = environ.get('QUERY_STRING', '')
-            params = parse_qs(query_string)
-            session_id = params.get('session', [''])[0].strip()
-            confirm = params.get('confirm', [''])[0].strip()
-            
-            # Log all verification attempts for debugging
-            LOGGER(__name__).info(f"Received /verify-ad request with session: {session_id[:16] if session_id else 'empty'}... | confirm={confirm}")
-            
-            if not session_id:
-                html = load_template('', 'Invalid Request', 'No session ID provided. Please use the link from /getpremium command.', PyroConf.BOT_USERNAME or '')
-            elif confirm != '1':
-                # Show landing page - prevents shortener services from triggering code generation
-                LOGGER(__name__).info(f"Showing landing page for session {session_id[:16]}... (no confirm parameter)")
-                html = load_landing_page(session_id)
-            else:
-                # User clicked "Continue" button - now generate the code
-                success, code, message = ad_monetization.verify_ad_completion(session_id)
-                
-                if success:
-                    LOGGER(__name__).info(f"✅ Ad verification SUCCESS for session {session_id[:16]}... | Code: {code}")
-                    html = load_template(code, 'Ad Completed Successfully! 🎉', 'Congratulations! You have successfully completed the ad verification.', PyroConf.BOT_USERNAME or '')
-                else:
-                    LOGGER(__name__).warning(f"❌ Ad verification FAILED for session {session_id[:16] if session_id else 'empty'}... | Reason: {message}")
-                    html = load_template('', 'Verification Failed', message, PyroConf.BOT_USERNAME or '')
-            
-            status = '200 OK'
-            body = html.encode('utf-8')
-            headers = [
-                ('Content-Type', 'text/html; charset=utf-8'),
-                ('X-Content-Type-Options', 'nosniff'),
-                ('X-Frame-Options', 'DENY')
-            ] + headers_common
-            start_response(status, headers)
-            return [body]
+        from memory_monitor import memory_monitor
+        import json
+        from datetime import datetime
+
+        # ?profile=now takes a fresh profiler snapshot (when profiling is on); admins only,
+        # since a snapshot costs CPU and memory in proportion to the live blocks
+        if parse_qs(environ.get('QUERY_STRING', '')).get('profile', [''])[0] == 'now':
+            if not check_admin_auth(environ):
+                start_response('403 Forbidden', [('Content-Type', 'application/json; charset=utf-8')] + headers_common)
+                return [b'{"error": "Unauthorized"}']
+            from memory_profiler import memory_profiler
+            memory_profiler.take()
         
-        elif path == '/admin/login' and method == 'GET':
-            html = '''<!DOCTYPE html>
+        # Get current memory state and log it to file
+        mem_data = memory_monitor.get_memory_state_for_endpoint()
+
+        # Format as pretty JSON
+        status = '200 OK'
+        body = json.dumps(mem_data, indent=2).encode('utf-8')
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+    except Exception as e:
+        status = '500 Internal Server Error'
+        body = f'{{"error": "{escape(str(e))}"}}'.encode('utf-8')
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+
+_VERIFY_AD_BASE_HEADERS = (
+    ('Content-Type', 'text/html; charset=utf-8'),
+    ('X-Content-Type-Options', 'nosniff'),
+    ('X-Frame-Options', 'DENY')
+)
+# The landing page is stable per session and revalidates; pages carrying a code are never stored
+_LANDING_HEADERS = _VERIFY_AD_BASE_HEADERS + REVALIDATE_HEADERS
+_VERIFY_AD_HEADERS = _VERIFY_AD_BASE_HEADERS + NO_CACHE_HEADERS
+_VERIFY_AD_RESTORING_HEADERS = _VERIFY_AD_HEADERS + (('Retry-After', '60'),)
+
+
+def _parse_verify_ad(environ):
+    """Returns (session_id, needs_verification) for a /verify-ad request"""
+    from logger import LOGGER
+    
+    query_string = environ.get('QUERY_STRING', '')
+    params = parse_qs(query_string)
+    session_id = params.get('session', [''])[0].strip()
+    confirm = params.get('confirm', [''])[0].strip()
+    
+    # Log all verification attempts for debugging
+    LOGGER(__name__).info(f"Received /verify-ad request with session: {session_id[:16] if session_id else 'empty'}... | confirm={confirm}")
+    return session_id, bool(session_id) and confirm == '1'
+
+
+def _render_verify_ad(session_id, verification=None):
+    """
+    Page for a /verify-ad request. verification is the result of
+    ad_monetization.verify_ad_completion() when the user confirmed, else None.
+    """
+    from config import PyroConf
+    from logger import LOGGER
+    
+    if not session_id:
+        return load_template('', 'Invalid Request', 'No session ID provided. Please use the link from /getpremium command.', PyroConf.BOT_USERNAME or '')
+    if verification is None:
+        # Show landing page - prevents shortener services from triggering code generation
+        LOGGER(__name__).info(f"Showing landing page for session {session_id[:16]}... (no confirm parameter)")
+        return load_landing_page(session_id)
+    
+    # User clicked "Continue" button - the code has been generated
+    success, code, message = verification
+    if success:
+        LOGGER(__name__).info(f"✅ Ad verification SUCCESS for session {session_id[:16]}... | Code: {code}")
+        return load_template(code, 'Ad Completed Successfully! 🎉', 'Congratulations! You have successfully completed the ad verification.', PyroConf.BOT_USERNAME or '')
+    LOGGER(__name__).warning(f"❌ Ad verification FAILED for session {session_id[:16] if session_id else 'empty'}... | Reason: {message}")
+    return load_template('', 'Verification Failed', message, PyroConf.BOT_USERNAME or '')
+
+
+def _verify_ad_restoring(needs_verification):
+    """
+    Page shown instead of issuing a code while the startup restore runs (None
+    otherwise): a code written now would vanish when the restored database
+    replaces the local one. The session stays unused, so reloading works.
+    """
+    if not needs_verification:
+        return None
+    from cloud_backup import hydration_pending
+    if not hydration_pending():
+        return None
+    from config import PyroConf
+    return load_template(
+        '', 'Please Try Again Shortly',
+        'The bot is restoring its data after a restart, so no code can be issued yet. Please reload this page in a minute.',
+        PyroConf.BOT_USERNAME or ''
+    )
+
+
+@router.route('/verify-ad', 'GET')
+def _verify_ad(environ, start_response, headers_common):
+    """Ad verification landing page and code issuing"""
+    from ad_monetization import ad_monetization
+    
+    session_id, needs_verification = _parse_verify_ad(environ)
+    restoring = _verify_ad_restoring(needs_verification)
+    if restoring is not None:
+        start_response('503 Service Unavailable', list(_VERIFY_AD_RESTORING_HEADERS))
+        return [restoring]
+    verification = ad_monetization.verify_ad_completion(session_id) if needs_verification else None
+    body = _render_verify_ad(session_id, verification)
+    
+    start_response('200 OK', list(_LANDING_HEADERS if session_id and verification is None else _VERIFY_AD_HEADERS))
+    return [body]
+
+
+@router.route('/admin/login', 'GET')
+def _admin_login_page(environ, start_response, headers_common):
+    """Admin login form"""
+    html = '''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -390,30 +350,33 @@ def application(environ, start_response):
     </div>
 </body>
 </html>'''
-            status = '200 OK'
-            body = html.encode('utf-8')
-            headers = [('Content-Type', 'text/html; charset=utf-8')] + headers_common
+    status = '200 OK'
+    body = html.encode('utf-8')
+    headers = [('Content-Type', 'text/html; charset=utf-8')] + list(REVALIDATE_HEADERS)
+    start_response(status, headers)
+    return [body]
+
+
+@router.route('/admin/login', 'POST')
+def _admin_login_submit(environ, start_response, headers_common):
+    """Check the admin password and start a session"""
+    try:
+        content_length = int(environ.get('CONTENT_LENGTH', 0))
+        request_body = environ['wsgi.input'].read(content_length).decode('utf-8')
+        params = parse_qs(request_body)
+        password = params.get('password', [''])[0]
+
+        if verify_password(password):
+            session_id = create_admin_session()
+            status = '303 See Other'
+            headers = [
+                ('Location', '/files'),
+                ('Set-Cookie', f'admin_session={session_id}; Path=/; HttpOnly; Max-Age=86400; SameSite=Strict')
+            ] + headers_common
             start_response(status, headers)
-            return [body]
-        
-        elif path == '/admin/login' and method == 'POST':
-            try:
-                content_length = int(environ.get('CONTENT_LENGTH', 0))
-                request_body = environ['wsgi.input'].read(content_length).decode('utf-8')
-                params = parse_qs(request_body)
-                password = params.get('password', [''])[0]
-                
-                if verify_password(password):
-                    session_id = create_admin_session()
-                    status = '303 See Other'
-                    headers = [
-                        ('Location', '/files'),
-                        ('Set-Cookie', f'admin_session={session_id}; Path=/; HttpOnly; Max-Age=86400; SameSite=Strict')
-                    ] + headers_common
-                    start_response(status, headers)
-                    return [b'']
-                else:
-                    html = '''<!DOCTYPE html>
+            return [b'']
+        else:
+            html = '''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -447,93 +410,37 @@ def application(environ, start_response):
     </div>
 </body>
 </html>'''
-                    status = '200 OK'
-                    body = html.encode('utf-8')
-                    headers = [('Content-Type', 'text/html; charset=utf-8')] + headers_common
-                    start_response(status, headers)
-                    return [body]
-            except Exception as e:
-                status = '500 Internal Server Error'
-                body = b'{"error": "Login failed"}'
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-        
-        elif path == '/files' and method == 'GET':
-            import os
-            from datetime import datetime
-            
-            # Check authentication
-            if not check_admin_auth(environ):
-                status = '303 See Other'
-                headers = [('Location', '/admin/login')] + headers_common
-                start_response(status, headers)
-                return [b'']
-            
-            try:
-                files_list = []
-                base_dir = os.getcwd()
-                
-                for root, dirs, files in os.walk(base_dir):
-                    dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ['__pycache__', 'node_modules', '.git']]
-                    
-                    for filename in files:
-                        if filename.startswith('.'):
-                            continue
-                        
-                        filepath = os.path.join(root, filename)
-                        rel_path = os.path.relpath(filepath, base_dir)
-                        
-                        try:
-                            stat = os.stat(filepath)
-                            size = stat.st_size
-                            modified = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-                            
-                            if size < 1024:
-                                size_str = f"{size} B"
-                            elif size < 1024 * 1024:
-                                size_str = f"{size / 1024:.1f} KB"
-                            else:
-                                size_str = f"{size / (1024 * 1024):.1f} MB"
-                            
-                            files_list.append({
-                                'name': rel_path,
-                                'size': size_str,
-                                'size_bytes': size,
-                                'modified': modified
-                            })
-                        except:
-                            continue
-                
-                files_list.sort(key=lambda x: x['size_bytes'], reverse=True)
-                
-                files_html = ''
-                editable_extensions = ('.py', '.txt', '.md', '.json', '.xml', '.yaml', '.yml', '.toml', '.ini', '.cfg', '.conf', '.html', '.css', '.js')
-                for f in files_list:
-                    icon = '📄'
-                    if f['name'].endswith('.db'):
-                        icon = '🗄️'
-                    elif f['name'].endswith('.log'):
-                        icon = '📝'
-                    elif f['name'].endswith('.py'):
-                        icon = '🐍'
-                    elif f['name'].endswith(('.txt', '.md')):
-                        icon = '📋'
-                    
-                    # Add edit button for text-based files
-                    edit_button = ''
-                    if f['name'].endswith(editable_extensions):
-                        edit_button = f' <a href="/edit?file={escape(f["name"])}" class="edit-btn">✏️ Edit</a>'
-                    
-                    files_html += f'''
-                    <tr>
-                        <td>{icon} {escape(f['name'])}</td>
-                        <td>{escape(f['size'])}</td>
-                        <td>{escape(f['modified'])}</td>
-                        <td><a href="/download?file={escape(f['name'])}" class="download-btn">⬇️ Download</a>{edit_button}</td>
-                    </tr>'''
-                
-                html = f'''<!DOCTYPE html>
+            status = '200 OK'
+            body = html.encode('utf-8')
+            headers = [('Content-Type', 'text/html; charset=utf-8')] + headers_common
+            start_response(status, headers)
+            return [body]
+    except Exception as e:
+        status = '500 Internal Server Error'
+        body = b'{"error": "Login failed"}'
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+
+@router.route('/files', 'GET')
+def _files_page(environ, start_response, headers_common):
+    """File browser and SQL editor shell (rows come from /files/list)"""
+    import os
+
+    # Check authentication
+    if not check_admin_auth(environ):
+        status = '303 See Other'
+        headers = [('Location', '/admin/login')] + headers_common
+        start_response(status, headers)
+        return [b'']
+
+    try:
+        # Cached, incrementally refreshed index - rows are fetched page by page from /files/list
+        from file_index import file_index
+        summary = file_index.get_summary()
+
+        html = f'''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -578,6 +485,9 @@ def application(environ, start_response):
         .error-msg.show {{ display: block; }}
         .success-msg {{ background: #d4edda; color: #155724; padding: 12px; border-radius: 8px; margin-top: 10px; display: none; }}
         .success-msg.show {{ display: block; }}
+        .filter-box {{ padding: 8px 12px; border: 2px solid #e2e8f0; border-radius: 6px; font-size: 14px; }}
+        .filter-box:focus {{ outline: none; border-color: #667eea; }}
+        .pager {{ display: flex; gap: 15px; align-items: center; justify-content: center; margin-top: 20px; color: #4a5568; }}
         @media (max-width: 768px) {{
             table {{ font-size: 14px; }}
             th, td {{ padding: 10px 8px; }}
@@ -594,15 +504,15 @@ def application(environ, start_response):
         <div class="stats">
             <div class="stat-item">
                 <div class="stat-label">Total Files</div>
-                <div class="stat-value">{len(files_list)}</div>
+                <div class="stat-value">{summary['total_files']}</div>
             </div>
             <div class="stat-item">
                 <div class="stat-label">Total Size</div>
-                <div class="stat-value">{sum(f['size_bytes'] for f in files_list) / (1024*1024):.1f} MB</div>
+                <div class="stat-value">{summary['total_size'] / (1024*1024):.1f} MB</div>
             </div>
         </div>
         
-        <button class="refresh-btn" onclick="location.reload()">🔄 Refresh List</button>
+        <button class="refresh-btn" onclick="loadFiles(currentPage)">🔄 Refresh List</button>
         <button class="db-btn" onclick="toggleDatabase()">🗄️ Database Manager</button>
         
         <div class="db-section" id="dbSection">
@@ -625,6 +535,17 @@ def application(environ, start_response):
         </div>
         
         <h2 style="color: #2d3748; margin-top: 30px; margin-bottom: 15px;">📂 Files</h2>
+        <div class="btn-group">
+            <input id="fileFilter" class="filter-box" placeholder="Filter by name..." oninput="scheduleLoad()">
+            <select id="fileSort" class="filter-box" onchange="loadFiles(1)">
+                <option value="size:desc">Largest first</option>
+                <option value="size:asc">Smallest first</option>
+                <option value="modified:desc">Newest first</option>
+                <option value="modified:asc">Oldest first</option>
+                <option value="name:asc">Name A-Z</option>
+                <option value="name:desc">Name Z-A</option>
+            </select>
+        </div>
         <table>
             <thead>
                 <tr>
@@ -634,13 +555,73 @@ def application(environ, start_response):
                     <th>Action</th>
                 </tr>
             </thead>
-            <tbody>
-                {files_html}
+            <tbody id="filesBody">
+                <tr><td colspan="4">Loading...</td></tr>
             </tbody>
         </table>
+        <div class="pager">
+            <button class="btn-sm btn-secondary" id="prevPage" onclick="loadFiles(currentPage - 1)">◀ Prev</button>
+            <span id="pageInfo"></span>
+            <button class="btn-sm btn-secondary" id="nextPage" onclick="loadFiles(currentPage + 1)">Next ▶</button>
+        </div>
     </div>
     
     <script>
+        let currentPage = 1;
+        let filterTimer = null;
+        
+        function esc(text) {{
+            const div = document.createElement('div');
+            div.textContent = text;
+            return div.innerHTML;
+        }}
+        
+        function fileIcon(name) {{
+            if (name.endsWith('.db')) return '🗄️';
+            if (name.endsWith('.log')) return '📝';
+            if (name.endsWith('.py')) return '🐍';
+            if (name.endsWith('.txt') || name.endsWith('.md')) return '📋';
+            return '📄';
+        }}
+        
+        function scheduleLoad() {{
+            clearTimeout(filterTimer);
+            filterTimer = setTimeout(() => loadFiles(1), 300);
+        }}
+        
+        function loadFiles(page) {{
+            const [sort, order] = document.getElementById('fileSort').value.split(':');
+            const q = document.getElementById('fileFilter').value.trim();
+            const url = '/files/list?page=' + Math.max(1, page) + '&per_page=50&sort=' + sort + '&order=' + order + '&q=' + encodeURIComponent(q);
+            fetch(url)
+            .then(response => response.json())
+            .then(data => {{
+                if (data.error) {{
+                    document.getElementById('filesBody').innerHTML = '<tr><td colspan="4">' + esc(data.error) + '</td></tr>';
+                    return;
+                }}
+                currentPage = data.page;
+                let rows = '';
+                data.files.forEach(f => {{
+                    const link = encodeURIComponent(f.name);
+                    let actions = '<a href="/download?file=' + link + '" class="download-btn">⬇️ Download</a>';
+                    if (f.editable) {{
+                        actions += ' <a href="/edit?file=' + link + '" class="edit-btn">✏️ Edit</a>';
+                    }}
+                    rows += '<tr><td>' + fileIcon(f.name) + ' ' + esc(f.name) + '</td><td>' + esc(f.size) + '</td><td>' + esc(f.modified) + '</td><td>' + actions + '</td></tr>';
+                }});
+                document.getElementById('filesBody').innerHTML = rows || '<tr><td colspan="4">No files match</td></tr>';
+                document.getElementById('pageInfo').textContent = 'Page ' + data.page + ' of ' + data.pages + ' (' + data.total + ' files)';
+                document.getElementById('prevPage').disabled = data.page <= 1;
+                document.getElementById('nextPage').disabled = data.page >= data.pages;
+            }})
+            .catch(error => {{
+                document.getElementById('filesBody').innerHTML = '<tr><td colspan="4">Failed to load files: ' + esc(String(error)) + '</td></tr>';
+            }});
+        }}
+        
+        loadFiles(1);
+        
         function toggleDatabase() {{
             const dbSection = document.getElementById('dbSection');
             dbSection.classList.toggle('show');
@@ -690,7 +671,7 @@ def application(environ, start_response):
                 if (data.success) {{
                     if (data.rows && data.rows.length > 0) {{
                         // Display results in a table
-                        let html = '<h3 style="color: #2d3748; margin-bottom: 15px;">Query Results (' + data.row_count + ' rows)</h3>';
+                        let html = '<h3 style="color: #2d3748; margin-bottom: 15px;">Query Results (' + data.row_count + ' rows' + (data.truncated ? ', first ' + data.row_count + ' shown' : '') + ')</h3>';
                         html += '<table style="width: 100%; border-collapse: collapse;">';
                         html += '<thead style="background: #667eea; color: white;"><tr>';
                         data.columns.forEach(col => {{
@@ -729,138 +710,180 @@ def application(environ, start_response):
     </script>
 </body>
 </html>'''
-                
-                status = '200 OK'
-                body = html.encode('utf-8')
-                headers = [('Content-Type', 'text/html; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-                
-            except Exception as e:
-                status = '500 Internal Server Error'
-                body = f'{{"error": "{escape(str(e))}"}}'.encode('utf-8')
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-        
-        elif path == '/database/execute' and method == 'POST':
-            import sqlite3
-            
-            # Check authentication
-            if not check_admin_auth(environ):
-                status = '403 Forbidden'
-                body = b'{"success": false, "error": "Unauthorized"}'
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-            
+
+        status = '200 OK'
+        body = html.encode('utf-8')
+        headers = [('Content-Type', 'text/html; charset=utf-8')] + list(PRIVATE_REVALIDATE_HEADERS)
+        start_response(status, headers)
+        return [body]
+
+    except Exception as e:
+        status = '500 Internal Server Error'
+        body = f'{{"error": "{escape(str(e))}"}}'.encode('utf-8')
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+
+@router.route('/files/list', 'GET')
+def _files_list(environ, start_response, headers_common):
+    """One page of the file index as JSON"""
+    import json
+
+    # Check authentication
+    if not check_admin_auth(environ):
+        status = '403 Forbidden'
+        body = b'{"error": "Unauthorized"}'
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+    try:
+        from file_index import file_index
+        params = parse_qs(environ.get('QUERY_STRING', ''))
+
+        def _int_param(name, default):
             try:
-                content_length = int(environ.get('CONTENT_LENGTH', 0))
-                request_body = environ['wsgi.input'].read(content_length).decode('utf-8')
-                params = parse_qs(request_body)
-                
-                query = params.get('query', [''])[0].strip()
-                
-                if not query:
-                    status = '400 Bad Request'
-                    body = b'{"success": false, "error": "No query provided"}'
-                    headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                    start_response(status, headers)
-                    return [body]
-                
-                db_path = 'telegram_bot.db'
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                
-                cursor.execute(query)
-                
-                # Check if it's a SELECT query
-                if query.strip().upper().startswith('SELECT'):
-                    results = cursor.fetchall()
-                    columns = [description[0] for description in cursor.description] if cursor.description else []
-                    conn.close()
-                    
-                    import json
-                    response_data = {
-                        'success': True,
-                        'columns': columns,
-                        'rows': results,
-                        'row_count': len(results)
-                    }
-                    
-                    status = '200 OK'
-                    body = json.dumps(response_data).encode('utf-8')
-                    headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                    start_response(status, headers)
-                    return [body]
-                else:
-                    # For UPDATE, INSERT, DELETE queries
-                    conn.commit()
-                    affected_rows = cursor.rowcount
-                    conn.close()
-                    
-                    import json
-                    response_data = {
-                        'success': True,
-                        'affected_rows': affected_rows
-                    }
-                    
-                    status = '200 OK'
-                    body = json.dumps(response_data).encode('utf-8')
-                    headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                    start_response(status, headers)
-                    return [body]
-                
-            except Exception as e:
-                import json
-                status = '500 Internal Server Error'
-                body = json.dumps({'success': False, 'error': str(e)}).encode('utf-8')
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-        
-        elif path == '/edit' and method == 'GET':
-            import os
-            
-            # Check authentication
-            if not check_admin_auth(environ):
-                status = '303 See Other'
-                headers = [('Location', '/admin/login')] + headers_common
-                start_response(status, headers)
-                return [b'']
-            
-            query_string = environ.get('QUERY_STRING', '')
-            params = parse_qs(query_string)
-            filename = params.get('file', [''])[0].strip()
-            
-            if not filename:
-                status = '400 Bad Request'
-                body = b'{"error": "No file specified"}'
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-            
-            filepath = os.path.join(os.getcwd(), filename)
-            
-            if not os.path.exists(filepath) or not os.path.isfile(filepath):
-                status = '404 Not Found'
-                body = b'{"error": "File not found"}'
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-            
-            if '..' in filename or filename.startswith('/'):
-                status = '403 Forbidden'
-                body = b'{"error": "Access denied"}'
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-            
+                return int(params.get(name, [default])[0])
+            except (TypeError, ValueError):
+                return default
+
+        result = file_index.query(
+            page=_int_param('page', 1),
+            per_page=_int_param('per_page', 50),
+            sort=params.get('sort', ['size'])[0],
+            order=params.get('order', ['desc'])[0],
+            query=params.get('q', [''])[0],
+            ext=params.get('ext', [''])[0],
+        )
+
+        status = '200 OK'
+        body = json.dumps(result).encode('utf-8')
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+    except Exception as e:
+        status = '500 Internal Server Error'
+        body = json.dumps({'error': str(e)}).encode('utf-8')
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+
+@router.route('/database/execute', 'POST')
+def _database_execute(environ, start_response, headers_common):
+    """Run an admin SQL statement (SELECTs are capped and streamed)"""
+    # Check authentication
+    if not check_admin_auth(environ):
+        status = '403 Forbidden'
+        body = b'{"success": false, "error": "Unauthorized"}'
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+    try:
+        content_length = int(environ.get('CONTENT_LENGTH', 0))
+        request_body = environ['wsgi.input'].read(content_length).decode('utf-8')
+        params = parse_qs(request_body)
+
+        query = params.get('query', [''])[0].strip()
+
+        if not query:
+            status = '400 Bad Request'
+            body = b'{"success": false, "error": "No query provided"}'
+            headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+            start_response(status, headers)
+            return [body]
+
+        import db_browser
+
+        # SELECTs are capped and streamed - a bare "SELECT * FROM users" can't OOM the box
+        if db_browser.is_read_query(query):
+            conn = db_browser.connect(readonly=True)
             try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    file_content = f.read()
-                
-                html = f'''<!DOCTYPE html>
+                result = db_browser.run_query(conn, query, limit=db_browser.DB_BROWSER_MAX_ROWS)
+            except Exception:
+                conn.close()
+                raise
+            headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+            start_response('200 OK', headers)
+            return db_browser.stream_json(result, conn)
+        else:
+            conn = db_browser.connect(readonly=False)
+            cursor = conn.cursor()
+            cursor.execute(query)
+
+            # For UPDATE, INSERT, DELETE queries
+            conn.commit()
+            affected_rows = cursor.rowcount
+            conn.close()
+
+            import json
+            response_data = {
+                'success': True,
+                'affected_rows': affected_rows
+            }
+
+            status = '200 OK'
+            body = json.dumps(response_data).encode('utf-8')
+            headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+            start_response(status, headers)
+            return [body]
+
+    except Exception as e:
+        import json
+        status = '500 Internal Server Error'
+        body = json.dumps({'success': False, 'error': str(e)}).encode('utf-8')
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+
+@router.route('/edit', 'GET')
+def _edit_page(environ, start_response, headers_common):
+    """Text editor for a file in the working directory"""
+    import os
+
+    # Check authentication
+    if not check_admin_auth(environ):
+        status = '303 See Other'
+        headers = [('Location', '/admin/login')] + headers_common
+        start_response(status, headers)
+        return [b'']
+
+    query_string = environ.get('QUERY_STRING', '')
+    params = parse_qs(query_string)
+    filename = params.get('file', [''])[0].strip()
+
+    if not filename:
+        status = '400 Bad Request'
+        body = b'{"error": "No file specified"}'
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+    filepath = os.path.join(os.getcwd(), filename)
+
+    if not os.path.exists(filepath) or not os.path.isfile(filepath):
+        status = '404 Not Found'
+        body = b'{"error": "File not found"}'
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+    if '..' in filename or filename.startswith('/'):
+        status = '403 Forbidden'
+        body = b'{"error": "Access denied"}'
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            file_content = f.read()
+
+        html = f'''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -929,168 +952,226 @@ def application(environ, start_response):
     </script>
 </body>
 </html>'''
-                
-                status = '200 OK'
-                body = html.encode('utf-8')
-                headers = [('Content-Type', 'text/html; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-                
-            except Exception as e:
-                status = '500 Internal Server Error'
-                body = f'{{"error": "{escape(str(e))}"}}'.encode('utf-8')
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-        
-        elif path == '/save' and method == 'POST':
-            import os
-            
-            # Check authentication
-            if not check_admin_auth(environ):
-                status = '403 Forbidden'
-                body = b'{"success": false, "error": "Unauthorized"}'
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-            
-            try:
-                content_length = int(environ.get('CONTENT_LENGTH', 0))
-                request_body = environ['wsgi.input'].read(content_length).decode('utf-8')
-                params = parse_qs(request_body)
-                
-                filename = params.get('file', [''])[0].strip()
-                content = params.get('content', [''])[0]
-                
-                if not filename:
-                    status = '400 Bad Request'
-                    body = b'{{"success": false, "error": "No file specified"}}'
-                    headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                    start_response(status, headers)
-                    return [body]
-                
-                filepath = os.path.join(os.getcwd(), filename)
-                
-                if not os.path.exists(filepath) or not os.path.isfile(filepath):
-                    status = '404 Not Found'
-                    body = b'{{"success": false, "error": "File not found"}}'
-                    headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                    start_response(status, headers)
-                    return [body]
-                
-                if '..' in filename or filename.startswith('/'):
-                    status = '403 Forbidden'
-                    body = b'{{"success": false, "error": "Access denied"}}'
-                    headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                    start_response(status, headers)
-                    return [body]
-                
-                # Save the file
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                
-                status = '200 OK'
-                body = b'{{"success": true}}'
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-                
-            except Exception as e:
-                from logger import LOGGER
-                LOGGER(__name__).error(f"Error saving file: {e}")
-                status = '500 Internal Server Error'
-                body = f'{{"success": false, "error": "{escape(str(e))}"}}'.encode('utf-8')
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-        
-        elif path == '/download' and method == 'GET':
-            import os
-            
-            query_string = environ.get('QUERY_STRING', '')
-            params = parse_qs(query_string)
-            filename = params.get('file', [''])[0].strip()
-            
-            if not filename:
-                status = '400 Bad Request'
-                body = b'{"error": "No file specified"}'
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-            
-            filepath = os.path.join(os.getcwd(), filename)
-            
-            if not os.path.exists(filepath) or not os.path.isfile(filepath):
+
+        status = '200 OK'
+        body = html.encode('utf-8')
+        headers = [('Content-Type', 'text/html; charset=utf-8')] + list(PRIVATE_REVALIDATE_HEADERS)
+        start_response(status, headers)
+        return [body]
+
+    except Exception as e:
+        status = '500 Internal Server Error'
+        body = f'{{"error": "{escape(str(e))}"}}'.encode('utf-8')
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+
+@router.route('/save', 'POST')
+def _save_file(environ, start_response, headers_common):
+    """Save a file from the editor"""
+    import os
+
+    # Check authentication
+    if not check_admin_auth(environ):
+        status = '403 Forbidden'
+        body = b'{"success": false, "error": "Unauthorized"}'
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+    try:
+        content_length = int(environ.get('CONTENT_LENGTH', 0))
+        request_body = environ['wsgi.input'].read(content_length).decode('utf-8')
+        params = parse_qs(request_body)
+
+        filename = params.get('file', [''])[0].strip()
+        content = params.get('content', [''])[0]
+
+        if not filename:
+            status = '400 Bad Request'
+            body = b'{{"success": false, "error": "No file specified"}}'
+            headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+            start_response(status, headers)
+            return [body]
+
+        filepath = os.path.join(os.getcwd(), filename)
+
+        if not os.path.exists(filepath) or not os.path.isfile(filepath):
+            status = '404 Not Found'
+            body = b'{{"success": false, "error": "File not found"}}'
+            headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+            start_response(status, headers)
+            return [body]
+
+        if '..' in filename or filename.startswith('/'):
+            status = '403 Forbidden'
+            body = b'{{"success": false, "error": "Access denied"}}'
+            headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+            start_response(status, headers)
+            return [body]
+
+        # Save the file
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+        from file_index import file_index
+        file_index.invalidate()
+
+        status = '200 OK'
+        body = b'{{"success": true}}'
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+    except Exception as e:
+        from logger import LOGGER
+        LOGGER(__name__).error(f"Error saving file: {e}")
+        status = '500 Internal Server Error'
+        body = f'{{"success": false, "error": "{escape(str(e))}"}}'.encode('utf-8')
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+
+@router.route('/download', 'GET', 'HEAD')
+def _download(environ, start_response, headers_common):
+    """Stream a file from the working directory"""
+    import os
+    from file_responder import serve_file
+
+    # Check authentication (downloads include the database and logs)
+    if not check_admin_auth(environ):
+        status = '403 Forbidden'
+        body = b'{"error": "Unauthorized"}'
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+    query_string = environ.get('QUERY_STRING', '')
+    params = parse_qs(query_string)
+    filename = params.get('file', [''])[0].strip()
+
+    if not filename:
+        status = '400 Bad Request'
+        body = b'{"error": "No file specified"}'
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+    base_dir = os.path.realpath(os.getcwd())
+    filepath = os.path.realpath(os.path.join(base_dir, filename))
+
+    if '..' in filename or filename.startswith('/') or not filepath.startswith(base_dir + os.sep):
+        status = '403 Forbidden'
+        body = b'{"error": "Access denied"}'
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+    if not os.path.isfile(filepath):
+        status = '404 Not Found'
+        body = b'{"error": "File not found"}'
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+    try:
+        # Streamed with Range/ETag support - constant memory for any file size
+        return serve_file(environ, start_response, filepath, download_name=os.path.basename(filepath),
+                          extra_headers=headers_common)
+
+    except Exception as e:
+        status = '500 Internal Server Error'
+        body = f'{{"error": "{escape(str(e))}"}}'.encode('utf-8')
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        # exc_info lets the server replace headers if they were already started
+        start_response(status, headers, sys.exc_info())
+        return [body]
+
+
+@router.route('/database', 'GET')
+def _database_page(environ, start_response, headers_common):
+    """Database table browser"""
+    import os
+    import db_browser
+
+    # Check authentication
+    if not check_admin_auth(environ):
+        status = '303 See Other'
+        headers = [('Location', '/admin/login')] + headers_common
+        start_response(status, headers)
+        return [b'']
+
+    conn = None
+    try:
+        if not os.path.exists(db_browser.get_db_path()):
+            status = '404 Not Found'
+            body = b'{"error": "Database not found"}'
+            headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+            start_response(status, headers)
+            return [body]
+
+        conn = db_browser.connect(readonly=True)
+        tables = db_browser.list_tables(conn)
+
+        query_string = environ.get('QUERY_STRING', '')
+        params = parse_qs(query_string)
+        selected_table = params.get('table', [''])[0].strip()
+        after = params.get('after', [''])[0].strip() or None
+        output_format = params.get('format', ['html'])[0]
+        try:
+            limit = int(params.get('limit', [0])[0])
+        except ValueError:
+            limit = 0
+
+        if output_format in ('json', 'csv'):
+            if selected_table not in tables:
+                conn.close()
                 status = '404 Not Found'
-                body = b'{"error": "File not found"}'
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-            
-            if '..' in filename or filename.startswith('/'):
-                status = '403 Forbidden'
-                body = b'{"error": "Access denied"}'
+                body = b'{"error": "Table not found"}'
                 headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
                 start_response(status, headers)
                 return [body]
-            
-            try:
-                with open(filepath, 'rb') as f:
-                    file_data = f.read()
-                
-                safe_filename = os.path.basename(filename)
-                status = '200 OK'
+
+            if output_format == 'csv':
+                # Full export, streamed row by row (constant memory, no row cap needed)
+                result = db_browser.browse_table(conn, selected_table, after, limit=None)
                 headers = [
-                    ('Content-Type', 'application/octet-stream'),
-                    ('Content-Disposition', f'attachment; filename="{safe_filename}"'),
-                    ('Content-Length', str(len(file_data)))
+                    ('Content-Type', 'text/csv; charset=utf-8'),
+                    ('Content-Disposition', f'attachment; filename="{selected_table}.csv"')
                 ] + headers_common
-                start_response(status, headers)
-                return [file_data]
-                
-            except Exception as e:
-                status = '500 Internal Server Error'
-                body = f'{{"error": "{escape(str(e))}"}}'.encode('utf-8')
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-        
-        elif path == '/database' and method == 'GET':
-            import sqlite3
-            import os
-            
-            try:
-                db_path = 'telegram_bot.db'
-                if not os.path.exists(db_path):
-                    status = '404 Not Found'
-                    body = b'{"error": "Database not found"}'
-                    headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                    start_response(status, headers)
-                    return [body]
-                
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
-                tables = [row[0] for row in cursor.fetchall()]
-                
-                query_string = environ.get('QUERY_STRING', '')
-                params = parse_qs(query_string)
-                selected_table = params.get('table', [''])[0].strip()
-                
-                table_data_html = ''
-                if selected_table and selected_table in tables:
-                    cursor.execute(f"PRAGMA table_info({selected_table})")
-                    columns = [row[1] for row in cursor.fetchall()]
-                    
-                    cursor.execute(f"SELECT * FROM {selected_table} LIMIT 100")
-                    rows = cursor.fetchall()
-                    
-                    if rows:
-                        table_data_html = f'''
+                start_response('200 OK', headers)
+                return db_browser.stream_csv(result, conn)
+
+            result = db_browser.browse_table(conn, selected_table, after, db_browser.clamp_limit(limit))
+            headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+            start_response('200 OK', headers)
+            return db_browser.stream_json(result, conn)
+
+        table_data_html = ''
+        if selected_table and selected_table in tables:
+            result = db_browser.browse_table(conn, selected_table, after, db_browser.DB_BROWSER_PAGE_SIZE)
+            columns = result.columns
+            rows_html = ''.join(
+                "<tr style='border-bottom: 1px solid #e2e8f0;'>" +
+                "".join(f"<td style='padding: 10px;'>{escape(str(cell)) if cell is not None else 'NULL'}</td>" for cell in row) +
+                "</tr>"
+                for row in result
+            )
+
+            table_link = quote(selected_table)
+            nav_html = f'<a href="/database?table={table_link}" class="table-btn" style="background: #718096; color: white; padding: 8px 16px; border-radius: 8px; text-decoration: none; display: inline-block; margin: 5px;">⏮ First page</a>'
+            if result.next_token:
+                nav_html += f'<a href="/database?table={table_link}&after={result.next_token}" class="table-btn" style="background: #667eea; color: white; padding: 8px 16px; border-radius: 8px; text-decoration: none; display: inline-block; margin: 5px;">Next page →</a>'
+            nav_html += f'<a href="/database?table={table_link}&format=csv" class="table-btn" style="background: #48bb78; color: white; padding: 8px 16px; border-radius: 8px; text-decoration: none; display: inline-block; margin: 5px;">⬇️ Export CSV</a>'
+
+            if result.row_count:
+                table_data_html = f'''
                         <div style="margin-top: 30px;">
                             <h2 style="color: #2d3748; margin-bottom: 15px;">📊 Table: {escape(selected_table)}</h2>
-                            <p style="color: #718096; margin-bottom: 15px;">Showing {len(rows)} rows (max 100)</p>
+                            <p style="color: #718096; margin-bottom: 15px;">Showing {result.row_count} rows (page size {db_browser.DB_BROWSER_PAGE_SIZE})</p>
+                            <div style="margin-bottom: 15px;">{nav_html}</div>
                             <div style="overflow-x: auto;">
                                 <table style="width: 100%; border-collapse: collapse; background: white; border-radius: 8px; overflow: hidden;">
                                     <thead style="background: #667eea; color: white;">
@@ -1099,28 +1180,24 @@ def application(environ, start_response):
                                         </tr>
                                     </thead>
                                     <tbody>
-                                        {"".join(
-                                            f"<tr style='border-bottom: 1px solid #e2e8f0;'>" +
-                                            "".join(f"<td style='padding: 10px;'>{escape(str(cell)) if cell is not None else 'NULL'}</td>" for cell in row) +
-                                            "</tr>"
-                                            for row in rows
-                                        )}
+                                        {rows_html}
                                     </tbody>
                                 </table>
                             </div>
                         </div>
                         '''
-                    else:
-                        table_data_html = f'<div style="margin-top: 20px; padding: 20px; background: #f7fafc; border-radius: 8px; color: #718096;">Table "{escape(selected_table)}" is empty</div>'
-                
-                conn.close()
-                
-                tables_buttons = ''.join(
-                    f'<a href="/database?table={escape(table)}" class="table-btn" style="background: {"#48bb78" if table == selected_table else "#667eea"}; color: white; padding: 10px 20px; border-radius: 8px; text-decoration: none; display: inline-block; margin: 5px; transition: all 0.3s;">{escape(table)}</a>'
-                    for table in tables
-                )
-                
-                html = f'''<!DOCTYPE html>
+            else:
+                table_data_html = f'<div style="margin-top: 20px; padding: 20px; background: #f7fafc; border-radius: 8px; color: #718096;">Table "{escape(selected_table)}" has no {"more " if after else ""}rows</div>'
+
+        conn.close()
+        conn = None
+
+        tables_buttons = ''.join(
+            f'<a href="/database?table={quote(table)}" class="table-btn" style="background: {"#48bb78" if table == selected_table else "#667eea"}; color: white; padding: 10px 20px; border-radius: 8px; text-decoration: none; display: inline-block; margin: 5px; transition: all 0.3s;">{escape(table)}</a>'
+            for table in tables
+        )
+
+        html = f'''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -1155,84 +1232,167 @@ def application(environ, start_response):
     </div>
 </body>
 </html>'''
-                
-                status = '200 OK'
-                body = html.encode('utf-8')
-                headers = [('Content-Type', 'text/html; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-                
-            except Exception as e:
-                status = '500 Internal Server Error'
-                body = f'{{"error": "{escape(str(e))}"}}'.encode('utf-8')
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-        
-        elif path == '/database/query' and method == 'POST':
-            import sqlite3
-            import os
-            
-            try:
-                content_length = int(environ.get('CONTENT_LENGTH', 0))
-                request_body = environ['wsgi.input'].read(content_length).decode('utf-8')
-                params = parse_qs(request_body)
-                
-                query = params.get('query', [''])[0].strip()
-                
-                if not query:
-                    status = '400 Bad Request'
-                    body = b'{"error": "No query provided"}'
-                    headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                    start_response(status, headers)
-                    return [body]
-                
-                query_upper = query.upper()
-                if any(keyword in query_upper for keyword in ['DROP', 'DELETE', 'TRUNCATE', 'ALTER']):
-                    status = '403 Forbidden'
-                    body = b'{"error": "Destructive queries not allowed through web interface"}'
-                    headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                    start_response(status, headers)
-                    return [body]
-                
-                db_path = 'telegram_bot.db'
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                
-                cursor.execute(query)
-                results = cursor.fetchall()
-                columns = [description[0] for description in cursor.description] if cursor.description else []
-                
-                conn.close()
-                
-                import json
-                response_data = {
-                    'success': True,
-                    'columns': columns,
-                    'rows': results,
-                    'row_count': len(results)
-                }
-                
-                status = '200 OK'
-                body = json.dumps(response_data).encode('utf-8')
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
-                
-            except Exception as e:
-                import json
-                status = '500 Internal Server Error'
-                body = json.dumps({'success': False, 'error': str(e)}).encode('utf-8')
-                headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-                start_response(status, headers)
-                return [body]
+
+        status = '200 OK'
+        body = html.encode('utf-8')
+        headers = [('Content-Type', 'text/html; charset=utf-8')] + list(PRIVATE_REVALIDATE_HEADERS)
+        start_response(status, headers)
+        return [body]
+
+    except Exception as e:
+        if conn is not None:
+            conn.close()
+        status = '500 Internal Server Error'
+        body = f'{{"error": "{escape(str(e))}"}}'.encode('utf-8')
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+
+@router.route('/database/query', 'POST')
+def _database_query(environ, start_response, headers_common):
+    """Read-only query with capped, streamed results"""
+    import json
+    import db_browser
+
+    # Check authentication
+    if not check_admin_auth(environ):
+        status = '403 Forbidden'
+        body = b'{"success": false, "error": "Unauthorized"}'
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+    conn = None
+    try:
+        content_length = int(environ.get('CONTENT_LENGTH', 0) or 0)
+        request_body = environ['wsgi.input'].read(content_length).decode('utf-8')
+        params = parse_qs(request_body)
+
+        query = params.get('query', [''])[0].strip()
+        after = params.get('after', [''])[0].strip() or None
+        output_format = params.get('format', ['json'])[0]
+        try:
+            limit = int(params.get('limit', [0])[0])
+        except ValueError:
+            limit = 0
+
+        if not query:
+            status = '400 Bad Request'
+            body = b'{"error": "No query provided"}'
+            headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+            start_response(status, headers)
+            return [body]
+
+        if not db_browser.is_read_query(query):
+            status = '403 Forbidden'
+            body = b'{"error": "Only SELECT queries are allowed here - use /database/execute for changes"}'
+            headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+            start_response(status, headers)
+            return [body]
+
+        # Read-only connection: nothing sent here can modify the live database
+        conn = db_browser.connect(readonly=True)
+
+        if output_format == 'csv':
+            result = db_browser.run_query(conn, query, after, limit=None)
+            headers = [
+                ('Content-Type', 'text/csv; charset=utf-8'),
+                ('Content-Disposition', 'attachment; filename="query.csv"')
+            ] + headers_common
+            start_response('200 OK', headers)
+            return db_browser.stream_csv(result, conn)
+
+        result = db_browser.run_query(conn, query, after, db_browser.clamp_limit(limit, db_browser.DB_BROWSER_MAX_ROWS))
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response('200 OK', headers)
+        return db_browser.stream_json(result, conn)
+
+    except Exception as e:
+        if conn is not None:
+            conn.close()
+        status = '500 Internal Server Error'
+        body = json.dumps({'success': False, 'error': str(e)}).encode('utf-8')
+        headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
+        start_response(status, headers)
+        return [body]
+
+
+def build_asgi_app():
+    """
+    ASGI front end (WEB_SERVER_MODE=asgi): /, /health and /verify-ad run as
+    coroutines on the serving loop, every other route goes through application().
+    """
+    import asyncio
+    from asgi_app import AsgiApp
+    
+    app = AsgiApp(application)
+    
+    def observed(route):
+        def decorator(handler):
+            async def wrapper(environ):
+                started = perf_counter()
+                response = await handler(environ)
+                _record_request(route, environ['REQUEST_METHOD'], response[0], started)
+                return response
+            return wrapper
+        return decorator
+    
+    @app.route('/')
+    @observed('/')
+    async def index(environ):
+        return '200 OK', list(_INDEX_HEADERS), _INDEX_BODY
+    
+    @app.route('/health')
+    @observed('/health')
+    async def health(environ):
+        return '204 No Content', list(_HEALTH_HEADERS), b''
+    
+    @app.route('/verify-ad', 'GET')
+    @observed('/verify-ad')
+    async def verify_ad(environ):
+        session_id, needs_verification = _parse_verify_ad(environ)
+        restoring = _verify_ad_restoring(needs_verification)
+        if restoring is not None:
+            return finalize_response(environ, '503 Service Unavailable', list(_VERIFY_AD_RESTORING_HEADERS), restoring)
+        verification = None
+        if needs_verification:
+            from ad_monetization import ad_monetization
+            # SQLite work off the loop; the landing page itself never touches the DB
+            verification = await asyncio.to_thread(ad_monetization.verify_ad_completion, session_id)
+        headers = _LANDING_HEADERS if session_id and verification is None else _VERIFY_AD_HEADERS
+        return finalize_response(environ, '200 OK', list(headers), _render_verify_ad(session_id, verification))
+    
+    return app
+
+
+def server_port():
+    # Replit requires port 5000 for webview workflows
+    return int(os.environ.get('PORT', 5000))
+
+
+def _dispatch(environ, start_response):
+    """Minimal WSGI application - dispatches through the route table"""
+    path = environ.get('PATH_INFO', '/')
+    method = environ.get('REQUEST_METHOD', 'GET')
+    
+    headers_common = list(NO_CACHE_HEADERS)
+    
+    try:
+        handler, allowed = router.resolve(path, method)
+        if handler is not None:
+            return handler(environ, start_response, headers_common)
         
+        if allowed:
+            status = '405 Method Not Allowed'
+            body = b'{"error": "Method Not Allowed"}'
+            headers = [('Content-Type', 'application/json; charset=utf-8'), ('Allow', allowed)] + headers_common
         else:
             status = '404 Not Found'
             body = b'{"error": "Not Found"}'
             headers = [('Content-Type', 'application/json; charset=utf-8')] + headers_common
-            start_response(status, headers)
-            return [body]
+        start_response(status, headers)
+        return [body]
     
     except Exception as e:
         from logger import LOGGER
@@ -1243,6 +1403,26 @@ def application(environ, start_response):
         start_response(status, headers)
         return [body]
 
+
+def _observe(app):
+    """Count and time every request (outermost, so 304s and compression are included)"""
+    def observed(environ, start_response):
+        started = perf_counter()
+        path = environ.get('PATH_INFO', '/')
+        route = path if path in router.routes else 'unmatched'
+        method = environ.get('REQUEST_METHOD', 'GET')
+        
+        def start(status, headers, exc_info=None):
+            _record_request(route, method, status, started)
+            return start_response(status, headers, exc_info)
+        
+        return app(environ, start)
+    return observed
+
+
+# ETag/304 and gzip/brotli for buffered responses; streamed downloads pass through
+application = _observe(CompressionMiddleware(_dispatch))
+
 async def periodic_gc_task():
     """Periodic garbage collection for memory-constrained environments"""
     import gc
@@ -1264,12 +1444,31 @@ async def periodic_gc_task():
             from logger import LOGGER
             LOGGER(__name__).error(f"Garbage collection error: {e}")
 
+async def periodic_stats_snapshot_task():
+    """Refresh windowed admin stats and record an hourly history snapshot"""
+    import asyncio
+    from logger import LOGGER
+    from database_sqlite import db
+    
+    while True:
+        try:
+            # Offloaded so the two index range counts never block the bot loop
+            await asyncio.to_thread(db.refresh_stats)
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            LOGGER(__name__).info("Stats snapshot task cancelled")
+            break
+        except Exception as e:
+            LOGGER(__name__).error(f"Stats snapshot error: {e}")
+            await asyncio.sleep(3600)
+
 async def cleanup_watchdog_task():
     """Cleanup watchdog to prevent memory leaks from ad sessions and orphaned downloads.
     Runs every 5 minutes to purge:
         pass
     1. Expired ad sessions (>30 min old) and their cache entries
     2. Orphaned download tasks that failed to clean up properly
+    3. Download files whose workspace outlived its job (index only, no disk scan)
     """
     import asyncio
     from logger import LOGGER
@@ -1301,6 +1500,18 @@ async def cleanup_watchdog_task():
             except Exception as e:
                 LOGGER(__name__).error(f"Error in download cleanup: {e}")
             
+            # Retry failed removals and close workspaces left by vanished tasks
+            try:
+                from helpers.workspace import workspace_manager
+                files_removed, bytes_freed = workspace_manager.sweep()
+                if files_removed > 0:
+                    LOGGER(__name__).warning(
+                        f"🧹 Cleanup watchdog: removed {files_removed} orphaned download files "
+                        f"({bytes_freed / (1024*1024):.1f} MB freed)"
+                    )
+            except Exception as e:
+                LOGGER(__name__).error(f"Error in download workspace sweep: {e}")
+            
             # Clean up expired cache entries
             try:
                 from cache import get_cache
@@ -1348,7 +1559,13 @@ def run_bot():
         base_wait = 2  # Start with 2 seconds
         
         try:
+            # ASGI mode: serve HTTP on this loop before the (possibly slow) Telegram login
+            from asgi_app import asgi_enabled, serve_asgi, ASGI_LOOP
+            if asgi_enabled() and ASGI_LOOP == 'bot':
+                background_tasks.append(asyncio.create_task(serve_asgi(build_asgi_app(), '0.0.0.0', server_port())))
+            
             # CRITICAL: Cleanup orphaned files from previous crashes FIRST
+            # (the only full scan of downloads/; afterwards each job's workspace removes its own files)
             from helpers.files import cleanup_orphaned_files
             files_removed, bytes_freed = cleanup_orphaned_files()
             if files_removed > 0:
@@ -1396,10 +1613,6 @@ def run_bot():
             
             main.phone_auth_handler.start_cleanup_task()
             
-            from helpers.cleanup import start_periodic_cleanup
-            background_tasks.append(asyncio.create_task(start_periodic_cleanup(interval_minutes=30)))
-            main.LOGGER(__name__).info("Started periodic download cleanup task")
-            
             from helpers.session_manager import session_manager
             await session_manager.start_cleanup_task()
             main.LOGGER(__name__).info("Started periodic session cleanup task (10min idle timeout)")
@@ -1410,10 +1623,24 @@ def run_bot():
             background_tasks.append(asyncio.create_task(cleanup_watchdog_task()))
             main.LOGGER(__name__).info("Started cleanup watchdog task (removes expired ad sessions every 5 min)")
             
+            background_tasks.append(asyncio.create_task(periodic_stats_snapshot_task()))
+            main.LOGGER(__name__).info("Started hourly stats snapshot task")
+            
             from memory_monitor import memory_monitor
             background_tasks.append(asyncio.create_task(memory_monitor.periodic_monitor(interval=300)))
             main.LOGGER(__name__).info("Started periodic memory monitoring (5-minute intervals)")
             
+            # Graduated load shedding (cache, sessions, admissions) as RSS rises
+            from memory_pressure import memory_pressure
+            memory_pressure.register_transfer_client(main.bot, main.concurrent)
+            background_tasks.append(asyncio.create_task(memory_pressure.run()))
+            
+            # Opt-in tracemalloc profiling (MEMORY_PROFILER=1; also /memprofile on)
+            from memory_profiler import memory_profiler, MEMORY_PROFILER
+            if MEMORY_PROFILER:
+                memory_profiler.start()
+                memory_profiler.ensure_running()
+            
             # Start download manager
             from queue_manager import download_manager
             await download_manager.start_processor()
@@ -1421,14 +1648,14 @@ def run_bot():
             
             memory_monitor.log_memory_snapshot("Bot Startup", "Initial state after bot start")
             
-            # Cloud backup tasks (GitHub backups every 10 minutes)
+            # Cloud backup tasks (incremental backups every 10 minutes)
             try:
                 from cloud_backup import periodic_cloud_backup, restore_latest_from_cloud
                 cloud_service = main.PyroConf.CLOUD_BACKUP_SERVICE
                 if cloud_service:
                     _logger.info(f"Cloud backup configured: {cloud_service}")
-                    # Always restore from GitHub on startup (cloud-only approach)
-                    _logger.info("Restoring database from GitHub...")
+                    # Always restore from the cloud backup on startup (cloud-only approach)
+                    _logger.info(f"Restoring database from {cloud_service}...")
                     result = await restore_latest_from_cloud()
                     if result:
                         _logger.info(f"✅ Database restored from {cloud_service}")
@@ -1444,26 +1671,9 @@ def run_bot():
             except Exception as e:
                 _logger.warning(f"Cloud backup error: {e}")
             
-            # Periodic orphaned file cleanup (every 1 hour) to prevent storage bloat from crashes
-            async def periodic_orphaned_cleanup():
-                while True:
-                    try:
-                        await asyncio.sleep(3600)  # 1 hour
-                        from helpers.files import cleanup_orphaned_files
-                        files, bytes_freed = cleanup_orphaned_files()
-                        if files > 0:
-                            main.LOGGER(__name__).warning(
-                                f"⏰ Periodic cleanup: Removed {files} orphaned files "
-                                f"({bytes_freed / (1024*1024):.1f} MB freed)"
-                            )
-                    except asyncio.CancelledError:
-                        main.LOGGER(__name__).info("Periodic orphaned cleanup task cancelled")
-                        break
-                    except Exception as e:
-                        main.LOGGER(__name__).error(f"Periodic orphaned cleanup error: {e}")
-            
-            background_tasks.append(asyncio.create_task(periodic_orphaned_cleanup()))
-            main.LOGGER(__name__).info("Started periodic orphaned file cleanup (every 1h)")
+            # Resume broadcasts interrupted by a restart (waits for a restore still running in the background)
+            from broadcast_engine import broadcast_engine
+            background_tasks.append(asyncio.create_task(broadcast_engine.resume_unfinished(main.bot)))
             
             _logger.info("Bot is now running and listening for updates...")
             while True:
@@ -1506,9 +1716,11 @@ import threading
 bot_started = False
 bot_lock = threading.Lock()
 
+bot_thread = None
+
 def start_bot_once():
     """Start bot only once to prevent duplicate instances"""
-    global bot_started
+    global bot_started, bot_thread
     with bot_lock:
         if not bot_started:
             _logger.info("Starting Telegram bot in background thread...")
@@ -1519,9 +1731,18 @@ def start_bot_once():
 start_bot_once()
 
 if __name__ == '__main__':
-    from waitress import serve
+    from asgi_app import asgi_enabled, serve_asgi, ASGI_LOOP
     
-    # Replit requires port 5000 for webview workflows
-    port = int(os.environ.get('PORT', 5000))
-    _logger.info(f"Starting Waitress WSGI server on 0.0.0.0:{port} (minimal RAM mode)")
-    serve(application, host='0.0.0.0', port=port, threads=4, channel_timeout=60)
+    port = server_port()
+    if asgi_enabled() and ASGI_LOOP == 'bot':
+        # HTTP is served by the bot's event loop; keep the main thread alive
+        _logger.info(f"Serving HTTP on the bot event loop (ASGI) on 0.0.0.0:{port}")
+        bot_thread.join()
+    elif asgi_enabled():
+        import asyncio
+        _logger.info(f"Starting ASGI server on a dedicated event loop on 0.0.0.0:{port}")
+        asyncio.run(serve_asgi(build_asgi_app(), '0.0.0.0', port))
+    else:
+        from waitress import serve
+        _logger.info(f"Starting Waitress WSGI server on 0.0.0.0:{port} (minimal RAM mode)")
+        serve(application, host='0.0.0.0', port=port, threads=4, channel_timeout=60)
@@ -0,0 +1,250 @@
+"""
+Per-job tracing for the download pipeline.
+
+Each job (one /dl request or one batch item) runs inside `tracer.job(...)` and
+gets a short job ID. Stages run inside `tracer.span("get_messages")` (sync or
+async `with`) and record their offset from the job start, duration, bytes and
+outcome. The current trace travels in a ContextVar, so helpers deep in the
+pipeline (send_media, forward_to_dump_channel) add spans without any argument
+threading, and code running outside a job only pays a ContextVar lookup.
+
+Finished traces go into a ring buffer of TRACE_BUFFER_SIZE jobs, exported by
+/traces (admin command) and the /traces JSON endpoint. Stage durations also
+feed the pipeline_stage_seconds histogram on /metrics.
+"""
+
+import os
+import asyncio
+import secrets
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from time import perf_counter, time
+from typing import Dict, List, Optional
+from metrics import metrics
+
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "100"))
+# Spans kept per job (a large media group adds ~5 per file)
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "128"))
+
+_STAGE_SECONDS = metrics.histogram(
+    'pipeline_stage_seconds', 'Duration of download pipeline stages', ('stage',),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 15.0, 60.0, 300.0, 1200.0)
+)
+
+_current: ContextVar[Optional['Trace']] = ContextVar('current_trace', default=None)
+
+
+def _outcome_for(exc_type) -> str:
+    if issubclass(exc_type, asyncio.CancelledError):
+        return 'cancelled'
+    return f"error:{exc_type.__name__}"
+
+
+class Span:
+    __slots__ = ('name', 'start', 'duration', 'bytes', 'outcome', 'depth', 'attrs', '_trace', '_t0')
+
+    def __init__(self, trace: 'Trace', name: str, attrs: Dict):
+        self.name = name
+        self.start = 0.0
+        self.duration = 0.0
+        self.bytes = 0
+        self.outcome = 'ok'
+        self.depth = 0
+        self.attrs = attrs
+        self._trace = trace
+        self._t0 = 0.0
+
+    def __enter__(self) -> 'Span':
+        trace = self._trace
+        self._t0 = perf_counter()
+        self.start = self._t0 - trace.t0
+        self.depth = trace.depth
+        trace.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = perf_counter() - self._t0
+        if exc_type is not None:
+            self.outcome = _outcome_for(exc_type)
+        trace = self._trace
+        trace.depth -= 1
+        trace.add(self)
+        _STAGE_SECONDS.labels(self.name).observe(self.duration)
+        return False
+
+    async def __aenter__(self) -> 'Span':
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict:
+        entry = {
+            'name': self.name,
+            'start': round(self.start, 3),
+            'duration': round(self.duration, 3),
+            'outcome': self.outcome,
+            'depth': self.depth,
+        }
+        if self.bytes:
+            entry['bytes'] = self.bytes
+        if self.attrs:
+            entry['attrs'] = self.attrs
+        return entry
+
+
+class _NoopSpan:
+    """Returned outside a job; accepts the same calls and records nothing"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    __slots__ = ('job_id', 'kind', 'user_id', 'attrs', 'started_at', 't0', 'duration',
+                 'outcome', 'spans', 'dropped', 'depth')
+
+    def __init__(self, kind: str, user_id: Optional[int], attrs: Dict):
+        self.job_id = secrets.token_hex(4)
+        self.kind = kind
+        self.user_id = user_id
+        self.attrs = attrs
+        self.started_at = time()
+        self.t0 = perf_counter()
+        self.duration = None
+        self.outcome = None
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self.depth = 0
+
+    def add(self, span: Span):
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    def to_dict(self) -> Dict:
+        running = self.duration is None
+        spans = sorted(self.spans, key=lambda span: span.start)
+        return {
+            'job_id': self.job_id,
+            'kind': self.kind,
+            'user_id': self.user_id,
+            'started_at': datetime.fromtimestamp(self.started_at).strftime('%Y-%m-%d %H:%M:%S'),
+            'duration': round(perf_counter() - self.t0 if running else self.duration, 3),
+            'outcome': 'running' if running else self.outcome,
+            'attrs': self.attrs,
+            'spans': [span.to_dict() for span in spans],
+            'dropped_spans': self.dropped,
+        }
+
+
+class _Job:
+    """Async context manager that makes a Trace current for the enclosed job"""
+    __slots__ = ('_tracer', 'trace', '_token')
+
+    def __init__(self, tracer: 'Tracer', trace: Trace):
+        self._tracer = tracer
+        self.trace = trace
+        self._token = None
+
+    async def __aenter__(self) -> Trace:
+        self._token = _current.set(self.trace)
+        self._tracer.active[self.trace.job_id] = self.trace
+        return self.trace
+
+    async def __aexit__(self, exc_type, exc, tb):
+        trace = self.trace
+        trace.duration = perf_counter() - trace.t0
+        if exc_type is not None:
+            trace.outcome = _outcome_for(exc_type)
+        elif trace.outcome is None:
+            trace.outcome = 'ok'
+        _current.reset(self._token)
+        self._tracer.active.pop(trace.job_id, None)
+        self._tracer.finished.append(trace)
+        return False
+
+
+class Tracer:
+    def __init__(self, max_traces: int = TRACE_BUFFER_SIZE):
+        self.finished = deque(maxlen=max_traces)
+        self.active: Dict[str, Trace] = {}
+
+    def job(self, kind: str, user_id: Optional[int] = None, **attrs) -> _Job:
+        """Start a new trace for the enclosed job (nested jobs get their own trace)"""
+        return _Job(self, Trace(kind, user_id, attrs))
+
+    def span(self, name: str, **attrs):
+        """Time one stage of the current job; a no-op outside a job"""
+        trace = _current.get()
+        if trace is None:
+            return _NOOP_SPAN
+        return Span(trace, name, attrs)
+
+    def current(self) -> Optional[Trace]:
+        return _current.get()
+
+    def set_outcome(self, outcome: str):
+        """Outcome of the current job for paths that end without an exception"""
+        trace = _current.get()
+        if trace is not None:
+            trace.outcome = outcome
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        trace = self.active.get(job_id)
+        if trace is None:
+            # list() copies the deque in one step; iterating it directly races the bot loop's appends
+            trace = next((t for t in list(self.finished) if t.job_id == job_id), None)
+        return trace.to_dict() if trace else None
+
+    def recent(self, limit: int = 20) -> List[Dict]:
+        """Most recent first; running jobs are listed before finished ones"""
+        traces = list(self.active.values()) + list(reversed(self.finished))
+        return [trace.to_dict() for trace in traces[:max(0, limit)]]
+
+    def stage_summary(self) -> List[Dict]:
+        """Per-stage count/avg/p95/max over the buffered traces, slowest p95 first"""
+        durations: Dict[str, List[float]] = {}
+        for trace in list(self.finished):
+            for span in trace.spans:
+                durations.setdefault(span.name, []).append(span.duration)
+        summary = []
+        for name, values in durations.items():
+            values.sort()
+            summary.append({
+                'stage': name,
+                'count': len(values),
+                'avg': round(sum(values) / len(values), 3),
+                'p95': round(values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))], 3),
+                'max': round(values[-1], 3),
+            })
+        summary.sort(key=lambda entry: entry['p95'], reverse=True)
+        return summary
+
+
+# Global tracer instance
+tracer = Tracer()
@@ -0,0 +1,99 @@
+"""
+Precompiled HTML templates for the web server (replaces Jinja2).
+
+A template is read from templates/ once and split into static byte chunks and
+{{ name }} placeholders (HTML-escaped; {{ name|raw }} inserts trusted markup
+as-is), so rendering is a join with no parsing or formatting of the static
+parts. Files are re-checked for changes at most every TEMPLATE_RECHECK_SECONDS
+and recompiled when their mtime changes.
+"""
+
+import os
+import re
+import threading
+from html import escape
+from time import monotonic
+from typing import Dict, Optional, Tuple, Union
+from logger import LOGGER
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+TEMPLATE_RECHECK_SECONDS = float(os.getenv("TEMPLATE_RECHECK_SECONDS", "2"))
+
+_PLACEHOLDER = re.compile(r"\{\{\s*(\w+)(\|raw)?\s*\}\}")
+
+
+class CompiledTemplate:
+    __slots__ = ('name', 'parts', 'mtime_ns')
+
+    def __init__(self, name: str, source: str, mtime_ns: int = 0):
+        self.name = name
+        self.mtime_ns = mtime_ns
+        parts = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(source):
+            if match.start() > position:
+                parts.append(source[position:match.start()].encode('utf-8'))
+            parts.append((match.group(1), bool(match.group(2))))
+            position = match.end()
+        if position < len(source):
+            parts.append(source[position:].encode('utf-8'))
+        self.parts: Tuple[Union[bytes, Tuple[str, bool]], ...] = tuple(parts)
+
+    def render(self, **values) -> bytes:
+        out = []
+        for part in self.parts:
+            if part.__class__ is bytes:
+                out.append(part)
+                continue
+            name, raw = part
+            value = values.get(name, '')
+            if isinstance(value, bytes):
+                out.append(value)
+                continue
+            value = '' if value is None else str(value)
+            out.append((value if raw else escape(value)).encode('utf-8'))
+        return b''.join(out)
+
+
+class TemplateCache:
+    def __init__(self, directory: str = TEMPLATE_DIR):
+        self.directory = directory
+        self._templates: Dict[str, CompiledTemplate] = {}
+        self._checked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.compiles = 0
+
+    def get(self, name: str) -> CompiledTemplate:
+        template = self._templates.get(name)
+        now = monotonic()
+        if template is not None and now - self._checked.get(name, 0.0) < TEMPLATE_RECHECK_SECONDS:
+            return template
+
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            mtime_ns = os.stat(path).st_mtime_ns
+            template = self._templates.get(name)
+            if template is None or template.mtime_ns != mtime_ns:
+                with open(path, 'r', encoding='utf-8') as f:
+                    template = CompiledTemplate(name, f.read(), mtime_ns)
+                self._templates[name] = template
+                self.compiles += 1
+                LOGGER(__name__).debug(f"Compiled template {name} ({len(template.parts)} parts)")
+            self._checked[name] = now
+        return template
+
+    def render(self, name: str, **values) -> bytes:
+        return self.get(name).render(**values)
+
+    def invalidate(self, name: Optional[str] = None):
+        with self._lock:
+            if name is None:
+                self._templates.clear()
+                self._checked.clear()
+            else:
+                self._templates.pop(name, None)
+                self._checked.pop(name, None)
+
+
+# Global template cache instance
+templates = TemplateCache()
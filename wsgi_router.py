@@ -0,0 +1,42 @@
+"""
+Route table for the WSGI server.
+
+Handlers register with @router.route(path, *methods); dispatch is a single
+dict lookup on the path plus a dict lookup on the method, so request routing
+cost doesn't grow with the number of pages.
+"""
+
+from typing import Callable, Dict, Optional, Tuple
+
+# Handler signature: handler(environ, start_response, headers_common) -> iterable of bytes
+Handler = Callable
+
+
+class Router:
+    ANY_METHOD = '*'
+
+    def __init__(self):
+        self.routes: Dict[str, Dict[str, Handler]] = {}
+
+    def route(self, path: str, *methods: str):
+        """Register a handler for a path; no methods means any method"""
+        def decorator(handler: Handler) -> Handler:
+            table = self.routes.setdefault(path, {})
+            for method in methods or (self.ANY_METHOD,):
+                table[method.upper()] = handler
+            return handler
+        return decorator
+
+    def resolve(self, path: str, method: str) -> Tuple[Optional[Handler], Optional[str]]:
+        """
+        Returns:
+            (handler, None) on a match, (None, allowed_methods) when the path
+            exists but not for this method (405), or (None, None) for 404
+        """
+        table = self.routes.get(path)
+        if table is None:
+            return None, None
+        handler = table.get(method) or table.get(self.ANY_METHOD)
+        if handler is not None:
+            return handler, None
+        return None, ', '.join(sorted(table))